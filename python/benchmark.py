@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+
+def summarize(label, samples):
+    """輸出一組計時數據的統計結果
+
+    參數:
+        label (str): 顯示名稱
+        samples (list): 每次操作的耗時（秒）
+    """
+    if not samples:
+        print(f"{label}: 沒有數據")
+        return
+    samples_ms = [s * 1000 for s in samples]
+    print(
+        f"{label}: {len(samples_ms)}次，平均 {statistics.mean(samples_ms):.2f} ms，"
+        f"中位數 {statistics.median(samples_ms):.2f} ms，最大 {max(samples_ms):.2f} ms"
+    )
+
+def load_ocr(use_ocr):
+    """按需載入PaddleOCR，未安裝時返回None"""
+    if not use_ocr:
+        return None
+    from paddle_utils import create_paddleocr
+    from pdf_utils import OCR_LANG
+    return create_paddleocr(use_angle_cls=True, lang=OCR_LANG)
+
+def bench_ocr_render(args):
+    """比較每頁經臨時PNG文件和直接使用內存數組交給OCR的延遲"""
+    import fitz
+    import numpy as np
+    from PIL import Image
+    from pdf_utils import render_page_pixmap, pixmap_to_ndarray
+
+    ocr = load_ocr(args.ocr)
+    png_samples = []
+    memory_samples = []
+    temp_dir = tempfile.mkdtemp()
+    try:
+        with fitz.open(args.pdf) as doc:
+            page_count = min(len(doc), args.pages) if args.pages else len(doc)
+            print(f"文件: {os.path.basename(args.pdf)}，測試頁數: {page_count}，DPI: {args.dpi}，"
+                  f"{'包含OCR識別' if ocr else '僅渲染和解碼（未使用--ocr）'}")
+            for _ in range(args.repeat):
+                for page_num in range(page_count):
+                    page = doc[page_num]
+
+                    # 舊方式：渲染後編碼為PNG寫入臨時目錄，再從路徑讀回
+                    start_time = time.perf_counter()
+                    pix = render_page_pixmap(page, dpi=args.dpi)
+                    img_path = os.path.join(temp_dir, f"temp_page_{page_num}.png")
+                    pix.save(img_path)
+                    if ocr:
+                        ocr.ocr(img_path, cls=True)
+                    else:
+                        # PaddleOCR收到路徑時會自行解碼圖片，未載入OCR時用PIL模擬這一步
+                        np.asarray(Image.open(img_path).convert("L"))
+                    os.remove(img_path)
+                    png_samples.append(time.perf_counter() - start_time)
+                    del pix
+
+                    # 新方式：直接引用像素圖緩衝區
+                    start_time = time.perf_counter()
+                    pix = render_page_pixmap(page, dpi=args.dpi)
+                    image = pixmap_to_ndarray(pix)
+                    if ocr:
+                        ocr.ocr(image, cls=True)
+                    memory_samples.append(time.perf_counter() - start_time)
+                    del image, pix
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    summarize("臨時PNG文件", png_samples)
+    summarize("內存數組", memory_samples)
+
+def bench_ocr_batch(args):
+    """比較不同批量大小下OCR的吞吐量（頁/秒）"""
+    import fitz
+    from pdf_utils import iter_text_with_paddleocr, configure_ocr_batch
+
+    ocr = load_ocr(True)
+    if ocr is None:
+        print("無法載入PaddleOCR，請先安裝paddleocr和paddlepaddle")
+        return
+    configure_ocr_batch(memory_budget_mb=args.memory)
+    with fitz.open(args.pdf) as doc:
+        page_count = len(doc)
+    print(f"文件: {os.path.basename(args.pdf)}，共{page_count}頁，預先渲染內存上限: {args.memory} MB")
+
+    # 先識別一次，避免模型首次推理的預熱時間影響第一組結果
+    for _ in iter_text_with_paddleocr(args.pdf, ocr_instance=ocr, batch_size=1):
+        break
+
+    for batch_size in args.batch_sizes:
+        elapsed = []
+        for _ in range(args.repeat):
+            start_time = time.perf_counter()
+            pages = sum(1 for _ in iter_text_with_paddleocr(args.pdf, ocr_instance=ocr, batch_size=batch_size))
+            elapsed.append(time.perf_counter() - start_time)
+        best = min(elapsed)
+        print(f"批量大小 {batch_size}: {pages}頁，最快 {best:.2f} 秒，{pages / best if best else 0:.2f} 頁/秒")
+
+def bench_db_register(args):
+    """比較逐條SELECT+INSERT和批量登記文件路徑的耗時"""
+    import sqlite3
+    import db_utils
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        for count in args.counts:
+            paths = (f"/share/dir{i // 1000:05d}/file{i:07d}.pdf" for i in range(count))
+
+            db_utils.db_file = os.path.join(temp_dir, f"register_{count}.db")
+            db_utils.init_database()
+            start_time = time.perf_counter()
+            added = db_utils.register_files(paths, chunk_size=args.chunk_size)
+            bulk_elapsed = time.perf_counter() - start_time
+            db_utils.close_all_connections()
+            line = f"{count}個路徑: 批量登記 {bulk_elapsed:.2f} 秒（新增{added}）"
+
+            if count <= args.legacy_max:
+                # 舊方式：每個路徑一次SELECT 1和一次INSERT，再逐個更新為等待狀態
+                legacy_db = os.path.join(temp_dir, f"legacy_{count}.db")
+                conn = sqlite3.connect(legacy_db)
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute(
+                    'CREATE TABLE files (path TEXT PRIMARY KEY, status INTEGER, message TEXT, '
+                    'thread INTEGER, start_time REAL, end_time REAL)'
+                )
+                start_time = time.perf_counter()
+                for i in range(count):
+                    file_path = f"/share/dir{i // 1000:05d}/file{i:07d}.pdf"
+                    if conn.execute("SELECT 1 FROM files WHERE path = ?", (file_path,)).fetchone() is None:
+                        conn.execute(
+                            "INSERT INTO files (path, status, message, thread, start_time, end_time) VALUES (?, ?, ?, ?, ?, ?)",
+                            (file_path, 0, "等待處理", None, None, None)
+                        )
+                conn.commit()
+                for i in range(count):
+                    file_path = f"/share/dir{i // 1000:05d}/file{i:07d}.pdf"
+                    conn.execute("SELECT path, status, message, thread, start_time, end_time FROM files WHERE path = ?", (file_path,)).fetchone()
+                    conn.execute(
+                        "INSERT OR REPLACE INTO files (path, status, message, thread, start_time, end_time) VALUES (?, ?, ?, ?, ?, ?)",
+                        (file_path, 0, "等待處理", 1, None, None)
+                    )
+                conn.commit()
+                legacy_elapsed = time.perf_counter() - start_time
+                conn.close()
+                line += f"，逐條處理 {legacy_elapsed:.2f} 秒（單一連接，不含每次重新連接的開銷）"
+            print(line)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF重命名工具性能測試")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    render_parser = subparsers.add_parser("ocr-render", help="比較OCR頁面渲染經臨時PNG和內存數組的每頁延遲")
+    render_parser.add_argument("pdf", help="測試用的PDF文件")
+    render_parser.add_argument("--pages", type=int, default=5, help="最多測試的頁數，0表示全部")
+    render_parser.add_argument("--dpi", type=int, default=300, help="渲染解析度")
+    render_parser.add_argument("--repeat", type=int, default=1, help="重複次數")
+    render_parser.add_argument("--ocr", action="store_true", help="包含PaddleOCR識別時間")
+    render_parser.set_defaults(func=bench_ocr_render)
+
+    batch_parser = subparsers.add_parser("ocr-batch", help="比較不同批量大小下OCR的吞吐量（頁/秒），建議使用掃描文件")
+    batch_parser.add_argument("pdf", help="測試用的PDF文件")
+    batch_parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8], help="要比較的批量大小")
+    batch_parser.add_argument("--memory", type=int, default=256, help="預先渲染的頁面最多佔用的內存（MB）")
+    batch_parser.add_argument("--repeat", type=int, default=1, help="重複次數，取最快的一次")
+    batch_parser.set_defaults(func=bench_ocr_batch)
+
+    register_parser = subparsers.add_parser("db-register", help="比較逐條和批量登記文件路徑到狀態數據庫的耗時")
+    register_parser.add_argument("--counts", type=int, nargs="+", default=[10000, 100000, 1000000], help="要測試的路徑數量")
+    register_parser.add_argument("--chunk-size", type=int, default=10000, help="每個事務插入的路徑數量")
+    register_parser.add_argument("--legacy-max", type=int, default=100000, help="超過此數量時不測試逐條方式")
+    register_parser.set_defaults(func=bench_db_register)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
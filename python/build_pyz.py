@@ -32,6 +32,10 @@ def build_pyz(output_name="pdfRenamer", include_paddleocr=False):
         "rule_utils.py",
         "worker_utils.py",
         "ui_utils.py",
+        "cache_utils.py",
+        "job_utils.py",
+        "split_utils.py",
+        "encrypt_utils.py",
         "__init__.py"
     ]
     
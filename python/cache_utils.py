@@ -0,0 +1,305 @@
+import sqlite3
+import os
+import time
+import json
+import hashlib
+import threading
+
+from log_utils import log_message
+
+# 全局變量
+# 提取結果緩存使用獨立的數據庫文件，不會被cleanup_database刪除
+cache_file = 'pdf_extraction_cache.db'
+cache_enabled = True
+max_cache_bytes = 512 * 1024 * 1024  # 默認最多緩存512MB的提取結果
+_cache_instance = None
+_cache_instance_lock = threading.Lock()
+
+def compute_file_hash(file_path, chunk_size=1024 * 1024):
+    """
+    計算文件內容的哈希值
+
+    參數:
+        file_path (str): 文件路徑
+        chunk_size (int): 每次讀取的字節數
+
+    返回:
+        str: 十六進制的blake2b哈希值
+    """
+    hasher = hashlib.blake2b(digest_size=20)
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+class ExtractionCache:
+    """
+    以文件內容哈希和提取設置為鍵的提取結果緩存
+
+    緩存保存每頁的文本和元數據，超過容量上限時按最近最少使用的順序淘汰。
+    同一路徑、大小和修改時間的文件會重用已計算的哈希值，重複運行時不必重新讀取文件內容。
+    """
+
+    def __init__(self, cache_path=None, max_bytes=None):
+        self.cache_path = cache_path or cache_file
+        self.max_bytes = max_bytes if max_bytes is not None else max_cache_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        # 同一個連接由多個線程共用，通過鎖保護
+        self.conn = sqlite3.connect(self.cache_path, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                pages TEXT,
+                metadata TEXT,
+                size INTEGER,
+                elapsed REAL,
+                last_access REAL
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries (last_access)')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS file_hashes (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime_ns INTEGER,
+                hash TEXT
+            )
+        ''')
+        self.conn.commit()
+        self.total_bytes = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def file_hash(self, file_path, stat_result=None):
+        """
+        獲取文件內容哈希，路徑、大小和修改時間未變時直接使用上次的結果
+
+        參數:
+            file_path (str): 文件路徑
+            stat_result (os.stat_result): 可選的文件狀態信息，避免重複stat
+
+        返回:
+            str: 文件內容哈希
+        """
+        if stat_result is None:
+            stat_result = os.stat(file_path)
+        size = stat_result.st_size
+        mtime_ns = stat_result.st_mtime_ns
+
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT hash FROM file_hashes WHERE path = ? AND size = ? AND mtime_ns = ?',
+                (file_path, size, mtime_ns)
+            ).fetchone()
+        if row:
+            return row[0]
+
+        content_hash = compute_file_hash(file_path)
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, hash) VALUES (?, ?, ?, ?)',
+                (file_path, size, mtime_ns, content_hash)
+            )
+            self.conn.commit()
+        return content_hash
+
+    def historic_elapsed(self, file_path, stat_result=None):
+        """
+        查詢此前提取同一文件內容的耗時，只使用已記錄的哈希，不讀取文件內容
+
+        參數:
+            file_path (str): 文件路徑
+            stat_result (os.stat_result): 可選的文件狀態信息，避免重複stat
+
+        返回:
+            float or None: 各種設置下最長的一次提取耗時（秒），沒有記錄時返回None
+        """
+        if stat_result is None:
+            stat_result = os.stat(file_path)
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT hash FROM file_hashes WHERE path = ? AND size = ? AND mtime_ns = ?',
+                (file_path, stat_result.st_size, stat_result.st_mtime_ns)
+            ).fetchone()
+            if row is None:
+                return None
+            # 緩存鍵以「哈希:設置哈希」組成，按主鍵範圍查詢同一內容的所有條目
+            row = self.conn.execute(
+                'SELECT MAX(elapsed) FROM entries WHERE key >= ? AND key < ?',
+                (row[0] + ':', row[0] + ';')
+            ).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def make_key(content_hash, settings):
+        """
+        根據文件哈希和提取設置生成緩存鍵
+
+        參數:
+            content_hash (str): 文件內容哈希
+            settings (dict): 提取設置（引擎、OCR選項、DPI、語言等）
+
+        返回:
+            str: 緩存鍵
+        """
+        settings_json = json.dumps(settings, sort_keys=True, ensure_ascii=False)
+        settings_hash = hashlib.blake2b(settings_json.encode('utf-8'), digest_size=8).hexdigest()
+        return f"{content_hash}:{settings_hash}"
+
+    def get(self, key):
+        """
+        讀取緩存
+
+        參數:
+            key (str): 緩存鍵
+
+        返回:
+            dict or None: {'pages': 每頁文本列表, 'metadata': 元數據或None, 'elapsed': 提取耗時}
+        """
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT pages, metadata, elapsed FROM entries WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute('UPDATE entries SET last_access = ? WHERE key = ?', (time.time(), key))
+            self.conn.commit()
+        return {
+            'pages': json.loads(row[0]) if row[0] is not None else None,
+            'metadata': row[1],
+            'elapsed': row[2]
+        }
+
+    def put(self, key, pages=None, metadata=None, elapsed=None):
+        """
+        寫入緩存，已存在的條目只更新提供的欄位
+
+        參數:
+            key (str): 緩存鍵
+            pages (list): 每頁文本列表
+            metadata (str): 元數據
+            elapsed (float): 提取耗時（秒）
+        """
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT pages, metadata, elapsed, size FROM entries WHERE key = ?', (key,)
+            ).fetchone()
+            pages_json = json.dumps(pages, ensure_ascii=False) if pages is not None else None
+            old_size = 0
+            if row:
+                pages_json = pages_json if pages_json is not None else row[0]
+                metadata = metadata if metadata is not None else row[1]
+                elapsed = elapsed if elapsed is not None else row[2]
+                old_size = row[3] or 0
+            size = len(pages_json.encode('utf-8')) if pages_json else 0
+            size += len(metadata.encode('utf-8')) if metadata else 0
+            self.conn.execute(
+                'INSERT OR REPLACE INTO entries (key, pages, metadata, size, elapsed, last_access) VALUES (?, ?, ?, ?, ?, ?)',
+                (key, pages_json, metadata, size, elapsed, time.time())
+            )
+            self.total_bytes += size - old_size
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        """按最近最少使用的順序刪除條目，直到總大小低於上限的90%（調用者需持有鎖）"""
+        target = self.max_bytes * 0.9
+        evicted = 0
+        while self.total_bytes > target:
+            rows = self.conn.execute(
+                'SELECT key, size FROM entries ORDER BY last_access LIMIT 100'
+            ).fetchall()
+            if not rows:
+                self.total_bytes = 0
+                break
+            for key, size in rows:
+                self.conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+                self.total_bytes -= size or 0
+                evicted += 1
+                if self.total_bytes <= target:
+                    break
+        if evicted:
+            log_message(f"提取緩存超過上限，已淘汰 {evicted} 個最久未使用的條目", level='信息')
+
+    def clear(self):
+        """清空所有緩存條目"""
+        with self.lock:
+            self.conn.execute('DELETE FROM entries')
+            self.conn.execute('DELETE FROM file_hashes')
+            self.conn.commit()
+            self.conn.execute('VACUUM')
+            self.total_bytes = 0
+
+    def close(self):
+        """關閉緩存數據庫連接"""
+        with self.lock:
+            try:
+                self.conn.close()
+            except Exception as e:
+                log_message(f"關閉提取緩存時出錯: {e}", level='警告')
+
+def configure_cache(enabled=True, max_bytes=None, cache_path=None):
+    """
+    設置提取緩存
+
+    參數:
+        enabled (bool): 是否啟用緩存
+        max_bytes (int): 緩存容量上限（字節）
+        cache_path (str): 緩存數據庫文件路徑
+    """
+    global cache_enabled, max_cache_bytes, cache_file
+    cache_enabled = enabled
+    if max_bytes is not None:
+        max_cache_bytes = max_bytes
+    if cache_path is not None:
+        cache_file = cache_path
+
+def get_extraction_cache():
+    """
+    獲取當前進程共用的提取緩存實例
+
+    返回:
+        ExtractionCache or None: 緩存未啟用或無法打開時返回None
+    """
+    global _cache_instance
+    if not cache_enabled:
+        return None
+    with _cache_instance_lock:
+        if _cache_instance is None:
+            try:
+                _cache_instance = ExtractionCache()
+            except Exception as e:
+                log_message(f"無法打開提取緩存，將不使用緩存: {e}", level='警告')
+                return None
+        return _cache_instance
+
+def reset_extraction_cache():
+    """丟棄從父進程繼承的緩存實例（不關閉連接，SQLite連接不能跨進程使用）"""
+    global _cache_instance
+    _cache_instance = None
+
+def clear_extraction_cache():
+    """清空提取緩存"""
+    cache = ExtractionCache() if _cache_instance is None else _cache_instance
+    cache.clear()
+    if cache is not _cache_instance:
+        cache.close()
+    log_message(f"已清空提取緩存: {cache_file}", level='信息')
+
+def close_extraction_cache():
+    """關閉提取緩存並記錄命中統計"""
+    global _cache_instance
+    with _cache_instance_lock:
+        if _cache_instance is not None:
+            log_message(f"提取緩存命中 {_cache_instance.hits} 次，未命中 {_cache_instance.misses} 次", level='信息')
+            _cache_instance.close()
+            _cache_instance = None
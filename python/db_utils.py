@@ -1,9 +1,9 @@
 import sqlite3
 import time
 import os
-import gc
 import threading
 import queue
+import itertools
 import csv
 from contextlib import contextmanager
 
@@ -11,41 +11,98 @@ from contextlib import contextmanager
 db_lock = threading.Lock()
 # 使用線程本地存儲來確保每個線程使用自己的連接
 thread_local = threading.local()
-connection_pool = queue.Queue(maxsize=10)  # 最多10個連接
 db_file = 'pdf_processing.db'
+db_cache_size_kb = 16 * 1024  # 每個連接的頁面緩存大小（KB）
+# 所有已打開的線程連接，關閉時按登記表逐一關閉
+_connection_registry = []
+_connection_registry_lock = threading.Lock()
+# 每次關閉所有連接後遞增，線程發現代數不同時會重新打開連接
+_connection_generation = 0
+
+def _open_connection():
+    """
+    打開一個已設置好PRAGMA的數據庫連接
+    
+    返回:
+        sqlite3.Connection: 數據庫連接
+    """
+    conn = sqlite3.connect(db_file, timeout=30, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')  # 使用WAL模式提高並發性能
+    conn.execute('PRAGMA synchronous=NORMAL')  # WAL模式下只在檢查點時同步，減少每次提交的fsync
+    conn.execute(f'PRAGMA cache_size=-{int(db_cache_size_kb)}')
+    conn.execute('PRAGMA recursive_triggers=ON')  # INSERT OR REPLACE刪除舊行時也觸發計數觸發器
+    return conn
+
+def _get_thread_connection():
+    """
+    獲取當前線程緩存的連接，首次使用或連接已被關閉時重新打開並登記
+    
+    返回:
+        sqlite3.Connection: 數據庫連接
+    """
+    cached = getattr(thread_local, 'connection', None)
+    if cached is not None:
+        conn, generation, path = cached
+        if generation == _connection_generation and path == db_file:
+            return conn
+    
+    conn = _open_connection()
+    with _connection_registry_lock:
+        _connection_registry.append(conn)
+        thread_local.connection = (conn, _connection_generation, db_file)
+    thread_local.depth = 0
+    return conn
+
+def close_all_connections():
+    """
+    關閉所有線程緩存的數據庫連接
+    
+    返回:
+        int: 關閉的連接數量
+    """
+    global _connection_generation
+    with _connection_registry_lock:
+        connections = list(_connection_registry)
+        _connection_registry.clear()
+        _connection_generation += 1
+    
+    for conn in connections:
+        try:
+            conn.close()
+        except Exception as e:
+            print(f"關閉數據庫連接時出錯: {e}")
+            from log_utils import log_message
+            log_message(f"關閉數據庫連接時出錯: {e}", level='警告')
+    return len(connections)
 
 # 數據庫連接管理
 @contextmanager
 def db_connection():
     """
     獲取數據庫連接的上下文管理器（線程安全）
-    使用線程本地存儲確保每個線程使用自己的連接
+    每個線程第一次調用時打開一個連接並緩存，之後重複使用，直到close_all_connections
+    最外層的with結束時提交事務，出錯時回滾
     
     返回:
         sqlite3.Connection: 數據庫連接
     """
-    # 獲取當前線程ID
-    current_thread_id = threading.get_ident()
-    
-    # 創建新連接（每次調用都創建新連接，避免跨線程共享）
-    conn = sqlite3.connect(db_file, timeout=30)
-    conn.execute('PRAGMA journal_mode=WAL')  # 使用WAL模式提高並發性能
+    conn = _get_thread_connection()
+    depth = getattr(thread_local, 'depth', 0)
+    thread_local.depth = depth + 1
     
     try:
         # 返回連接
         yield conn
         
-        # 提交事務
-        conn.commit()
+        # 提交事務（嵌套使用時由最外層提交）
+        if depth == 0:
+            conn.commit()
     except sqlite3.Error as e:
         # 發生錯誤時回滾事務
-        if conn:
-            conn.rollback()
+        conn.rollback()
         raise e
     finally:
-        # 確保連接被關閉
-        if conn:
-            conn.close()
+        thread_local.depth = depth
 
 # 數據庫初始化函數
 def init_database():
@@ -66,19 +123,73 @@ def init_database():
                     end_time REAL
                 )
             ''')
+            # 按狀態查詢（UI只取處理中和最近失敗的少量記錄）使用的索引
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_files_status ON files (status, end_time)')
+            
+            # 各狀態的文件數量，由觸發器在每次插入、更新和刪除時維護，UI讀取時不必掃描整個表
+            # queued: 是否已記錄線程ID（等待狀態下用於區分已排入隊列和尚未分派）
+            # 觸發器內不用INSERT OR IGNORE：外層語句（如INSERT OR REPLACE）的衝突處理方式會覆蓋它
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS status_counts (
+                    status INTEGER,
+                    queued INTEGER,
+                    count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (status, queued)
+                )
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS files_count_insert AFTER INSERT ON files
+                BEGIN
+                    INSERT INTO status_counts (status, queued, count)
+                        SELECT NEW.status, NEW.thread IS NOT NULL, 0
+                        WHERE NOT EXISTS (SELECT 1 FROM status_counts
+                                          WHERE status IS NEW.status AND queued = (NEW.thread IS NOT NULL));
+                    UPDATE status_counts SET count = count + 1
+                        WHERE status IS NEW.status AND queued = (NEW.thread IS NOT NULL);
+                END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS files_count_delete AFTER DELETE ON files
+                BEGIN
+                    UPDATE status_counts SET count = count - 1
+                        WHERE status IS OLD.status AND queued = (OLD.thread IS NOT NULL);
+                END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS files_count_update AFTER UPDATE OF status, thread ON files
+                WHEN OLD.status IS NOT NEW.status OR (OLD.thread IS NULL) != (NEW.thread IS NULL)
+                BEGIN
+                    UPDATE status_counts SET count = count - 1
+                        WHERE status IS OLD.status AND queued = (OLD.thread IS NOT NULL);
+                    INSERT INTO status_counts (status, queued, count)
+                        SELECT NEW.status, NEW.thread IS NOT NULL, 0
+                        WHERE NOT EXISTS (SELECT 1 FROM status_counts
+                                          WHERE status IS NEW.status AND queued = (NEW.thread IS NOT NULL));
+                    UPDATE status_counts SET count = count + 1
+                        WHERE status IS NEW.status AND queued = (NEW.thread IS NOT NULL);
+                END
+            ''')
+            # 數據庫文件可能是上次未清理的殘留，重新統計一次以保證計數與表內容一致
+            conn.execute('DELETE FROM status_counts')
+            conn.execute('''
+                INSERT INTO status_counts (status, queued, count)
+                SELECT status, thread IS NOT NULL, COUNT(*) FROM files GROUP BY status, thread IS NOT NULL
+            ''')
 
 def cleanup_database():
     """關閉所有數據庫連接並刪除數據庫文件（線程安全）
     
     此函數專注於清理數據庫相關資源：
-    1. 關閉所有活躍的數據庫連接
-    2. 導出數據庫內容到CSV
-    3. 刪除臨時數據庫文件
-    4. 清空SQLite緩存
+    1. 停止狀態寫入線程並寫入剩餘的狀態更新
+    2. 關閉所有活躍的數據庫連接
+    3. 導出數據庫內容到CSV
+    4. 刪除臨時數據庫文件
+    5. 清空SQLite緩存
     """
-    global connection_pool
+    # 先寫入所有尚未提交的狀態更新
+    stop_status_writer()
     
-    # 首先導出數據庫內容到CSV
+    # 然後導出數據庫內容到CSV
     try:
         export_database_to_csv()
     except Exception as e:
@@ -87,32 +198,11 @@ def cleanup_database():
         log_message(f"導出數據庫到CSV時出錯: {e}", level='警告')
     
     with db_lock:
-        # 清空連接池並關閉所有連接
-        while not connection_pool.empty():
-            try:
-                conn = connection_pool.get(block=False)
-                if conn:
-                    conn.close()
-            except queue.Empty:
-                break
-        
-        # 獲取當前線程ID
-        current_thread_id = threading.get_ident()
-        
-        # 獲取並關閉所有活躍連接，但只關閉當前線程創建的連接
-        connections = [obj for obj in gc.get_objects() if isinstance(obj, sqlite3.Connection)]
-        for conn in connections:
-            try:
-                # 檢查連接是否由當前線程創建
-                # 注意：這裡我們不能直接檢查，因為SQLite連接沒有公開線程ID
-                # 所以我們使用try-except來安全地嘗試關閉
-                if conn:
-                    conn.close()
-            except Exception as e:
-                # 如果出現跨線程錯誤，只是記錄而不拋出異常
-                print(f"關閉數據庫連接時出錯: {e}")
-                from log_utils import log_message
-                log_message(f"關閉數據庫連接時出錯: {e}", level='警告')
+        # 關閉所有線程緩存的連接
+        closed_count = close_all_connections()
+        if closed_count:
+            from log_utils import log_message
+            log_message(f"已關閉 {closed_count} 個數據庫連接", level='信息')
         
         # 刪除數據庫文件
         if os.path.exists(db_file):
@@ -165,6 +255,51 @@ def get_file_status(file_path):
     else:
         return None
 
+def get_status_counts():
+    """
+    獲取各狀態的文件數量（讀取觸發器維護的計數表，不掃描文件表）
+    
+    返回:
+        dict: {'pending': 未分派, 'queued': 已排入隊列, 'processing': 處理中,
+               'completed': 已完成, 'failed': 失敗, 'total': 總數}
+    """
+    counts = {'pending': 0, 'queued': 0, 'processing': 0, 'completed': 0, 'failed': 0}
+    with db_connection() as conn:
+        rows = conn.execute("SELECT status, queued, count FROM status_counts").fetchall()
+    
+    for status, queued, count in rows:
+        if status == 0:
+            counts['queued' if queued else 'pending'] += count
+        elif status == 1:
+            counts['processing'] += count
+        elif status == 2:
+            counts['completed'] += count
+        elif status == 3:
+            counts['failed'] += count
+    counts['total'] = sum(counts.values())
+    return counts
+
+def get_files_by_status(status, limit, recent_first=False):
+    """
+    獲取指定狀態的少量文件記錄，供UI顯示
+    
+    參數:
+        status (int): 狀態碼
+        limit (int): 最多返回的記錄數
+        recent_first (bool): 是否按結束時間倒序（用於顯示最近失敗或完成的文件）
+        
+    返回:
+        list: (path, message, thread)元組列表
+    """
+    if recent_first:
+        query = "SELECT path, message, thread FROM files WHERE status = ? ORDER BY end_time DESC LIMIT ?"
+    elif status == 1:
+        query = "SELECT path, message, thread FROM files WHERE status = ? ORDER BY start_time LIMIT ?"
+    else:
+        query = "SELECT path, message, thread FROM files WHERE status = ? LIMIT ?"
+    with db_connection() as conn:
+        return conn.execute(query, (status, max(0, int(limit)))).fetchall()
+
 def get_all_file_statuses():
     """
     獲取所有文件處理狀態
@@ -214,66 +349,236 @@ def get_pending_files(limit=None):
     
     return [result[0] for result in results]
 
-def update_file_status(file_path, status, message=None, thread_id=None, start_time=None, end_time=None):
+# 批量寫入狀態失敗（如SQLITE_BUSY）時的重試次數和首次重試前的等待秒數，每次重試等待時間加倍
+STATUS_WRITE_RETRIES = 5
+STATUS_WRITE_BACKOFF = 0.1
+
+# 狀態寫入使用的SQL：已存在的記錄只覆蓋提供了值的欄位，開始/結束時間只在為空時自動填入
+STATUS_UPSERT_SQL = """
+    INSERT INTO files (path, status, message, thread, start_time, end_time)
+    VALUES (:path, COALESCE(:status, 0), COALESCE(:message, ''), :thread,
+            COALESCE(:start_time, :auto_start), COALESCE(:end_time, :auto_end))
+    ON CONFLICT(path) DO UPDATE SET
+        status = COALESCE(:status, files.status),
+        message = COALESCE(:message, files.message),
+        thread = COALESCE(:thread, files.thread),
+        start_time = COALESCE(:start_time, files.start_time, :auto_start),
+        end_time = COALESCE(:end_time, files.end_time, :auto_end)
+"""
+
+def _make_status_update(file_path, status, message=None, thread_id=None, start_time=None, end_time=None):
+    """
+    生成一條狀態更新記錄（在調用者線程中確定線程ID和時間）
+    
+    返回:
+        dict: 對應STATUS_UPSERT_SQL參數的字典
+    """
+    now = time.time()
+    return {
+        'path': file_path,
+        'status': status,
+        'message': message,
+        'thread': thread_id if thread_id is not None else threading.get_ident(),
+        'start_time': start_time,
+        'end_time': end_time,
+        'auto_start': now if status == 1 else None,
+        'auto_end': now if status in (2, 3) else None
+    }
+
+def _merge_status_update(pending, update):
     """
-    更新文件處理狀態
+    把較新的更新合併到同一路徑尚未寫入的記錄中
     
     參數:
-        file_path (str): 文件路徑
-        status (int): 狀態碼 (0: 等待, 1: 處理中, 2: 完成, 3: 失敗)
-        message (str): 狀態消息
-        thread_id (int): 線程ID
-        start_time (float): 開始處理時間（Unix時間戳）
-        end_time (float): 結束處理時間（Unix時間戳）
+        pending (dict): 尚未寫入的記錄（會被修改）
+        update (dict): 較新的更新記錄
     """
-    try:
-        # 獲取當前文件狀態
-        current_status = get_file_status(file_path)
-        
-        # 如果文件不存在於數據庫中，則創建一個新的狀態記錄
-        if current_status is None:
-            current_status = {
-                'path': file_path,
-                'status': 0,
-                'message': '',
-                'thread': None,
-                'start_time': None,
-                'end_time': None
-            }
-        
-        # 更新狀態
-        if status is not None:
-            current_status['status'] = status
+    for field in ('status', 'message', 'thread', 'start_time', 'end_time'):
+        if update[field] is not None:
+            pending[field] = update[field]
+    # 自動時間只在數據庫中為空時才使用，保留最早的一次
+    for field in ('auto_start', 'auto_end'):
+        if pending[field] is None:
+            pending[field] = update[field]
+
+class StatusWriter:
+    """
+    單一寫入線程的文件狀態寫入器
+    
+    工作線程只把狀態更新放入隊列，由寫入線程按路徑合併後，
+    在一個長期使用的連接上以executemany批量提交，避免每次更新都打開連接和爭用寫鎖。
+    """
+    
+    def __init__(self, batch_size=500, flush_interval=0.05):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.updates = 0
+        self.rows = 0
+        self.transactions = 0
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._run, name="StatusWriter", daemon=True)
+        self.thread.start()
+    
+    def put(self, update):
+        """放入一條狀態更新記錄"""
+        self.queue.put(update)
+    
+    def flush(self, timeout=None):
+        """
+        等待隊列中已有的更新全部寫入數據庫
         
-        # 更新消息
-        if message is not None:
-            current_status['message'] = message
+        參數:
+            timeout (float): 最長等待秒數
         
-        # 更新線程ID
-        if thread_id is not None:
-            current_status['thread'] = thread_id
-        else:
-            # 使用當前線程ID
-            current_status['thread'] = threading.get_ident()
+        返回:
+            bool: 是否在超時前完成且期間沒有因重試失敗而丟棄的更新
+        """
+        dropped = self.dropped
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout) and self.dropped == dropped
+    
+    def stop(self, timeout=None):
+        """寫入所有剩餘更新後停止寫入線程"""
+        self.queue.put(None)
+        self.thread.join(timeout)
+    
+    def _run(self):
+        # 寫入線程使用獨立的連接，不放入線程連接登記表，由線程自己關閉
+        conn = _open_connection()
+        try:
+            running = True
+            while running:
+                item = self.queue.get()
+                pending = {}
+                waiters = []
+                deadline = time.monotonic() + self.flush_interval
+                # 收集一小段時間內的更新，同一路徑的多次更新合併為一行
+                while True:
+                    if item is None:
+                        running = False
+                        break
+                    if isinstance(item, threading.Event):
+                        waiters.append(item)
+                        break
+                    self.updates += 1
+                    if item['path'] in pending:
+                        _merge_status_update(pending[item['path']], item)
+                    else:
+                        pending[item['path']] = item
+                    if len(pending) >= self.batch_size:
+                        break
+                    remaining = deadline - time.monotonic()
+                    try:
+                        item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                
+                if pending:
+                    self._write(conn, list(pending.values()))
+                for waiter in waiters:
+                    waiter.set()
+        finally:
+            conn.close()
+    
+    def _write(self, conn, rows):
+        """
+        批量寫入狀態記錄，失敗時退避重試，多次失敗後才丟棄並記錄錯誤
         
-        # 更新時間戳
-        if start_time is not None:
-            current_status['start_time'] = start_time
-        elif status == 1 and current_status['start_time'] is None:  # 開始處理
-            current_status['start_time'] = time.time()
+        參數:
+            conn (sqlite3.Connection): 寫入線程的連接
+            rows (list): 合併後的狀態記錄
         
-        if end_time is not None:
-            current_status['end_time'] = end_time
-        elif status in [2, 3] and current_status['end_time'] is None:  # 完成或失敗
-            current_status['end_time'] = time.time()
+        返回:
+            bool: 是否寫入成功
+        """
+        from log_utils import log_message
+        delay = STATUS_WRITE_BACKOFF
+        for attempt in range(STATUS_WRITE_RETRIES + 1):
+            try:
+                with conn:
+                    conn.executemany(STATUS_UPSERT_SQL, rows)
+                self.rows += len(rows)
+                self.transactions += 1
+                return True
+            except sqlite3.Error as e:
+                error = e
+                if attempt < STATUS_WRITE_RETRIES:
+                    log_message(f"批量寫入文件狀態時出錯（{len(rows)}條），{delay:.1f}秒後重試: {e}", level='警告')
+                    time.sleep(delay)
+                    delay *= 2
         
-        # 更新數據庫
-        with db_connection() as conn:
-            conn.execute(
-                "INSERT OR REPLACE INTO files (path, status, message, thread, start_time, end_time) VALUES (?, ?, ?, ?, ?, ?)",
-                (file_path, current_status['status'], current_status['message'], 
-                 current_status['thread'], current_status['start_time'], current_status['end_time'])
-            )
+        self.dropped += len(rows)
+        log_message(f"批量寫入文件狀態重試 {STATUS_WRITE_RETRIES} 次後仍失敗，已丟棄 {len(rows)} 條更新: {error}", level='错误')
+        print(f"批量寫入文件狀態失敗，已丟棄 {len(rows)} 條更新: {error}")
+        return False
+
+_status_writer = None
+_status_writer_lock = threading.Lock()
+
+def get_status_writer():
+    """
+    獲取（必要時啟動）當前進程的狀態寫入線程
+    
+    返回:
+        StatusWriter: 狀態寫入器
+    """
+    global _status_writer
+    with _status_writer_lock:
+        if _status_writer is None:
+            _status_writer = StatusWriter()
+        return _status_writer
+
+def flush_status_updates(timeout=None):
+    """
+    等待已提交的狀態更新寫入數據庫
+    
+    返回:
+        bool: 是否全部寫入（寫入線程未啟動時為True）
+    """
+    writer = _status_writer
+    if writer is None:
+        return True
+    if writer.flush(timeout):
+        return True
+    from log_utils import log_message
+    log_message("部分文件狀態未能寫入數據庫，處理狀態和導出結果可能不完整", level='警告')
+    return False
+
+def stop_status_writer():
+    """寫入剩餘的狀態更新並停止寫入線程，記錄合併統計"""
+    global _status_writer
+    with _status_writer_lock:
+        writer = _status_writer
+        _status_writer = None
+    if writer is None:
+        return
+    writer.stop()
+    from log_utils import log_message
+    log_message(
+        f"狀態寫入線程已停止：{writer.updates} 次更新合併為 {writer.rows} 行，共 {writer.transactions} 次事務",
+        level='信息'
+    )
+    if writer.dropped:
+        log_message(f"共有 {writer.dropped} 條狀態更新因寫入失敗被丟棄", level='错误')
+
+def update_file_status(file_path, status, message=None, thread_id=None, start_time=None, end_time=None):
+    """
+    更新文件處理狀態（異步寫入，由狀態寫入線程批量提交）
+    
+    參數:
+        file_path (str): 文件路徑
+        status (int): 狀態碼 (0: 等待, 1: 處理中, 2: 完成, 3: 失敗)
+        message (str): 狀態消息
+        thread_id (int): 線程ID，默認使用當前線程ID
+        start_time (float): 開始處理時間（Unix時間戳），未提供時在狀態變為處理中時自動記錄
+        end_time (float): 結束處理時間（Unix時間戳），未提供時在完成或失敗時自動記錄
+    """
+    try:
+        get_status_writer().put(
+            _make_status_update(file_path, status, message, thread_id, start_time, end_time)
+        )
     except Exception as e:
         from log_utils import log_message
         log_message(f"更新數據庫狀態時出錯: {e}", level='警告')
@@ -334,32 +639,38 @@ def export_database_to_csv():
         log_message(f"導出數據庫到CSV時出錯: {e}", level='错误')
         return False
 
-def add_files_to_database(file_list):
+def register_files(file_paths, status=0, message="等待處理", thread_id=None, chunk_size=10000):
     """
-    將文件添加到數據庫中
+    批量登記文件並設置初始狀態，已存在的路徑保持不變
     
     參數:
-        file_list (list): 文件路徑列表
+        file_paths (iterable): 文件路徑（可以是生成器，按塊讀取）
+        status (int): 初始狀態碼，默認為0（等待）
+        message (str): 初始狀態消息
+        thread_id (int): 記錄的線程ID，默認使用當前線程ID（UI據此把文件顯示為已排入隊列）
+        chunk_size (int): 每個事務插入的路徑數量
         
     返回:
-        int: 添加的文件數量
+        int: 新添加的文件數量
     """
-    added_count = 0
+    if thread_id is None:
+        thread_id = threading.get_ident()
     
+    added_count = 0
+    paths = iter(file_paths)
     try:
         with db_connection() as conn:
-            for file_path in file_list:
-                # 檢查文件是否已存在於數據庫中
-                cursor = conn.execute("SELECT 1 FROM files WHERE path = ?", (file_path,))
-                exists = cursor.fetchone() is not None
-                
-                if not exists:
-                    # 插入新記錄
-                    conn.execute(
-                        "INSERT INTO files (path, status, message, thread, start_time, end_time) VALUES (?, ?, ?, ?, ?, ?)",
-                        (file_path, 0, "等待處理", None, None, None)
-                    )
-                    added_count += 1
+            while True:
+                chunk = list(itertools.islice(paths, chunk_size))
+                if not chunk:
+                    break
+                cursor = conn.executemany(
+                    "INSERT OR IGNORE INTO files (path, status, message, thread, start_time, end_time) VALUES (?, ?, ?, ?, NULL, NULL)",
+                    ((file_path, status, message, thread_id) for file_path in chunk)
+                )
+                added_count += max(cursor.rowcount, 0)
+                # 每塊單獨提交，避免長時間持有寫鎖
+                conn.commit()
     except Exception as e:
         from log_utils import log_message
         log_message(f"添加文件到數據庫時出錯: {e}", level='警告')
@@ -369,7 +680,7 @@ def add_files_to_database(file_list):
 
 def add_files_to_database(file_list):
     """
-    將文件列表添加到數據庫中
+    將文件列表添加到數據庫中（等待狀態）
     
     參數:
         file_list (list): 文件路徑列表
@@ -377,26 +688,4 @@ def add_files_to_database(file_list):
     返回:
         int: 添加的文件數量
     """
-    added_count = 0
-    
-    with db_connection() as conn:
-        for file_path in file_list:
-            try:
-                # 檢查文件是否已存在於數據庫中
-                cursor = conn.execute("SELECT 1 FROM files WHERE path = ?", (file_path,))
-                if cursor.fetchone() is None:
-                    # 文件不存在，添加到數據庫
-                    conn.execute(
-                        "INSERT INTO files (path, status, message, thread, start_time, end_time) VALUES (?, ?, ?, ?, ?, ?)",
-                        (file_path, 0, "等待處理", None, None, None)
-                    )
-                    added_count += 1
-            except Exception as e:
-                print(f"添加文件到數據庫時出錯: {e}")
-                try:
-                    from log_utils import log_message
-                    log_message(f"添加文件到數據庫時出錯: {e}", level='警告')
-                except ImportError:
-                    pass
-    
-    return added_count
\ No newline at end of file
+    return register_files(file_list)
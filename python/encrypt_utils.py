@@ -0,0 +1,297 @@
+import os
+import time
+import threading
+import concurrent.futures
+
+from log_utils import log_message
+
+# 全局變量
+# 加密使用獨立的進程數，0表示在提取和匹配規則的工作者中直接加密
+ENCRYPT_WORKERS = 0
+# 提交到加密進程池但尚未完成的文件數上限，隊列滿時提交者等待，內存和臨時文件數量不隨文件總數增長
+ENCRYPT_QUEUE_DEPTH = 8
+
+def configure_encryption(max_workers=None, queue_depth=None):
+    """
+    設置加密階段
+
+    參數:
+        max_workers (int): 加密使用的進程數，0表示在提取和匹配規則的工作者中直接加密
+        queue_depth (int): 等待加密的文件數上限
+    """
+    global ENCRYPT_WORKERS, ENCRYPT_QUEUE_DEPTH
+    if max_workers is not None:
+        ENCRYPT_WORKERS = max(0, int(max_workers))
+    if queue_depth is not None:
+        ENCRYPT_QUEUE_DEPTH = max(1, int(queue_depth))
+
+def _init_encrypt_worker(pypdf2_max_mb):
+    """加密進程初始化函數，Ctrl+C由主進程處理"""
+    import signal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from pdf_utils import configure_encryption_fallback
+    configure_encryption_fallback(pypdf2_max_mb=pypdf2_max_mb)
+
+def encrypt_job(pdf_file, output_path, user_pass, owner_pass, has_fitz=False, has_pikepdf=False, has_pypdf2=False):
+    """
+    在加密進程中把文件以AES-256加密保存到最終檔名，成功後刪除原文件
+
+    先寫入臨時文件再原子替換，失敗時原文件保持不變，不會留下不完整的輸出文件。
+
+    參數:
+        pdf_file (str): 原文件路徑
+        output_path (str): 加密後的文件路徑
+        user_pass (bytes): 用戶密碼
+        owner_pass (bytes): 所有者密碼
+        has_fitz (bool): 是否有PyMuPDF
+        has_pikepdf (bool): 是否有pikepdf
+        has_pypdf2 (bool): 是否有PyPDF2
+
+    返回:
+        dict: 結果記錄，包含path、output、success、bytes、elapsed、error和本次產生的logs
+    """
+    from pdf_utils import save_pdf_document, encrypt_pdf
+    from log_utils import drain_log_entries
+
+    start_time = time.time()
+    record = {'path': pdf_file, 'output': output_path, 'success': False, 'bytes': 0, 'error': None}
+    try:
+        record['bytes'] = os.path.getsize(pdf_file)
+        saved = False
+        if has_fitz:
+            try:
+                import fitz
+                with fitz.open(pdf_file) as doc:
+                    save_pdf_document(doc, output_path, user_pass, owner_pass)
+                saved = True
+            except Exception as e:
+                log_message(f"使用PyMuPDF加密PDF時出錯: {pdf_file}, {e}", level='警告')
+        if not saved:
+            temp_output_path = output_path + ".temp"
+            if encrypt_pdf(pdf_file, temp_output_path, user_pass, owner_pass, has_pikepdf, has_pypdf2):
+                os.replace(temp_output_path, output_path)
+                saved = True
+        if saved:
+            # 加密後的文件已在最終路徑，刪除原文件
+            try:
+                os.remove(pdf_file)
+            except Exception as del_err:
+                log_message(f"刪除原文件時出錯: {del_err}", level='警告')
+            record['success'] = True
+        else:
+            record['error'] = "加密文件失敗"
+    except Exception as e:
+        record['error'] = str(e)
+    record['elapsed'] = time.time() - start_time
+    record['logs'] = drain_log_entries()
+    return record
+
+class EncryptionStage:
+    """
+    獨立的加密流水線階段
+
+    提取和匹配規則的工作者只決定檔名和密碼，把加密工作提交到這裡後立即處理下一個文件；
+    AES-256保存在獨立的進程池中進行，不佔用提取工作者，也不受GIL限制。
+    等待加密的文件數有上限，加密跟不上時提交者才會等待。
+    交給加密階段的文件在加密完成前保持處理中狀態，最終狀態和作業結果在加密完成時由這裡更新。
+    """
+
+    def __init__(self, max_workers, queue_depth, has_fitz=False, has_pikepdf=False, has_pypdf2=False, result_callback=None):
+        """
+        參數:
+            max_workers (int): 加密進程數
+            queue_depth (int): 等待加密的文件數上限
+            has_fitz (bool): 是否有PyMuPDF
+            has_pikepdf (bool): 是否有pikepdf
+            has_pypdf2 (bool): 是否有PyPDF2
+            result_callback (callable): 每個文件加密完成（或失敗、被取消）時調用callback(file_path, record)，
+                                        record包含success、new_path、error、elapsed，被取消的文件帶有interrupted標記
+        """
+        from pdf_utils import PipelineStageStats, PYPDF2_ENCRYPT_MAX_BYTES
+        self.libraries = (has_fitz, has_pikepdf, has_pypdf2)
+        self.result_callback = result_callback
+        self.max_workers = max_workers
+        self.queue_depth = queue_depth
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_init_encrypt_worker,
+            initargs=(PYPDF2_ENCRYPT_MAX_BYTES / (1024 * 1024),)
+        )
+        self.slots = threading.BoundedSemaphore(queue_depth)
+        self.lock = threading.Lock()
+        self.failures = []
+        # items為加密的文件數，busy為加密進程的耗時，idle為提交者等待隊列空位的時間
+        self.stats = PipelineStageStats('encrypt')
+        self.bytes = 0
+        self.start_time = time.time()
+        log_message(f"已創建加密進程池，最大工作數: {max_workers}，隊列上限: {queue_depth}", level='信息')
+
+    def submit(self, pdf_file, directory, new_name, user_pass, owner_pass):
+        """
+        分配輸出路徑並把文件交給加密進程池，隊列已滿時等待空位
+
+        參數:
+            pdf_file (str): 原文件路徑
+            directory (str): 輸出目錄
+            new_name (str): 不含擴展名的新檔名
+            user_pass (bytes): 用戶密碼
+            owner_pass (bytes): 所有者密碼
+
+        返回:
+            str or None: 加密後的文件路徑，無法分配檔名或提交失敗時返回None
+        """
+        from file_utils import reserve_output_path, release_output_path
+        from worker_utils import update_worker_status
+        # 加密完成前檔名已被空的佔位文件佔用，其他工作者或進程不會選中同一路徑
+        output_path = reserve_output_path(directory, new_name)
+        if output_path is None:
+            return None
+        # 在提交前更新狀態，加密完成時的最終狀態一定在它之後寫入
+        update_worker_status(pdf_file, 1, f"等待加密: {os.path.basename(output_path)}")
+        wait_start = time.time()
+        self.slots.acquire()
+        self.stats.record(idle=time.time() - wait_start)
+        try:
+            future = self.executor.submit(encrypt_job, pdf_file, output_path, user_pass, owner_pass, *self.libraries)
+        except Exception as e:
+            self.slots.release()
+            release_output_path(output_path)
+            log_message(f"提交加密任務時出錯: {pdf_file}, {e}", level='错误')
+            return None
+        future.add_done_callback(lambda done: self._job_done(done, pdf_file, output_path))
+        return output_path
+
+    def _job_done(self, future, pdf_file, output_path):
+        """加密任務完成時釋放隊列空位，更新文件狀態並報告結果"""
+        self.slots.release()
+        try:
+            record = future.result()
+        except concurrent.futures.CancelledError:
+            record = {'path': pdf_file, 'output': output_path, 'success': False, 'error': "處理被中斷，未加密", 'interrupted': True}
+        except Exception as e:
+            record = {'path': pdf_file, 'output': output_path, 'success': False, 'error': str(e)}
+
+        from log_utils import append_log_entries
+        from file_utils import release_output_path
+        append_log_entries(record.get('logs', []))
+        if not record['success']:
+            release_output_path(output_path)
+        with self.lock:
+            if record['success']:
+                self.bytes += record.get('bytes', 0)
+            else:
+                self.failures.append(record)
+        from worker_utils import update_worker_status
+        if record['success']:
+            self.stats.record(items=1, busy=record.get('elapsed', 0.0))
+            log_message(f"文件已加密並重命名為: {output_path}")
+            update_worker_status(pdf_file, 2, f"已加密並重命名（加密{record.get('elapsed', 0.0):.2f}秒）")
+        elif record.get('interrupted'):
+            log_message(f"加密文件失敗: {pdf_file}, {record['error']}", level='警告')
+            update_worker_status(pdf_file, 0, record['error'])
+        else:
+            log_message(f"加密文件失敗: {pdf_file}, {record['error']}", level='警告')
+            update_worker_status(pdf_file, 3, f"加密文件失敗: {record['error']}")
+
+        if self.result_callback is not None:
+            try:
+                self.result_callback(pdf_file, {
+                    'success': record['success'],
+                    'new_path': output_path if record['success'] else None,
+                    'error': None if record['success'] else record['error'],
+                    'elapsed': record.get('elapsed'),
+                    'interrupted': record.get('interrupted', False)
+                })
+            except Exception as e:
+                log_message(f"處理結果回調出錯: {pdf_file}, {e}", level='警告')
+
+    def close(self, cancel_pending=False):
+        """
+        等待所有加密任務完成並關閉進程池
+
+        參數:
+            cancel_pending (bool): 是否取消尚未開始的加密任務（收到中斷信號時使用）
+
+        返回:
+            list: 加密失敗的結果記錄
+        """
+        self.executor.shutdown(wait=True, cancel_futures=cancel_pending)
+        log_message("加密進程池已關閉", level='信息')
+        with self.lock:
+            return list(self.failures)
+
+    def summary(self):
+        """
+        返回:
+            dict: 包含items、busy_seconds、idle_seconds、throughput（文件/忙碌秒）、bytes、
+                  mb_per_second（按加密進程的總耗時計算）和wall_seconds的字典
+        """
+        values = self.stats.snapshot()
+        with self.lock:
+            values['bytes'] = self.bytes
+        values['mb_per_second'] = values['bytes'] / 1048576 / values['busy_seconds'] if values['busy_seconds'] else 0.0
+        values['wall_seconds'] = time.time() - self.start_time
+        return values
+
+class DeferredEncryption:
+    """
+    在工作進程中代替EncryptionStage：只記錄加密工作，由主進程收到結果後提交到加密進程池
+
+    工作進程不能直接使用主進程的加密進程池，返回的路徑只是暫定的，
+    主進程提交時可能因其他等待加密的文件而改用帶後綴的檔名。
+    """
+
+    def __init__(self):
+        self.job = None
+
+    def submit(self, pdf_file, directory, new_name, user_pass, owner_pass):
+        """記錄加密工作並返回暫定的輸出路徑，參數與EncryptionStage.submit相同"""
+        from file_utils import unique_output_path
+        output_path = unique_output_path(directory, new_name)
+        if output_path is not None:
+            self.job = {'pdf_file': pdf_file, 'directory': directory, 'new_name': new_name,
+                        'user_pass': user_pass, 'owner_pass': owner_pass}
+        return output_path
+
+def finish_encryption_stage(stage, cancel_pending=False):
+    """
+    等待加密階段完成並寫入各文件的最終狀態
+
+    加密失敗的文件已在加密完成時以失敗結果更新狀態和作業記錄，原文件保持不變，續傳時會重新處理。
+
+    參數:
+        stage (EncryptionStage): 加密階段
+        cancel_pending (bool): 是否取消尚未開始的加密任務
+
+    返回:
+        int: 加密失敗（包括被取消）的文件數量
+    """
+    from db_utils import flush_status_updates
+
+    failures = stage.close(cancel_pending=cancel_pending)
+    flush_status_updates()
+    if failures:
+        log_message(f"{len(failures)} 個文件加密失敗，原文件保持不變", level='警告')
+    return len(failures)
+
+def format_stage_metrics(name, values, unit='個文件'):
+    """
+    生成流水線階段吞吐量的說明文字
+
+    參數:
+        name (str): 階段名稱
+        values (dict): 包含items、busy_seconds和wall_seconds的統計字典
+        unit (str): 計數單位
+
+    返回:
+        str: 說明文字
+    """
+    wall = values.get('wall_seconds') or 0.0
+    text = (f"{name}階段: {values['items']}{unit}，工作者累計耗時{values['busy_seconds']:.2f}秒，"
+            f"每個工作者{values['items'] / values['busy_seconds'] if values['busy_seconds'] else 0.0:.2f}{unit}/秒")
+    if wall:
+        text += f"，整體{values['items'] / wall:.2f}{unit}/秒"
+    if values.get('bytes'):
+        text += f"，{values['bytes'] / 1048576:.1f}MB（{values['mb_per_second']:.1f}MB/秒）"
+    if values.get('idle_seconds'):
+        text += f"，等待加密隊列空位{values['idle_seconds']:.2f}秒"
+    return text
@@ -11,6 +11,14 @@ from log_utils import log_message
 # 全局變量，用於標記是否收到中斷信號
 interrupt_received = False
 
+# file_renamer放入結果隊列的處理結果：已重命名、沒有匹配的規則、匹配後處理失敗、因中斷而未處理、
+# 已交給加密階段（加密完成時由加密階段更新狀態和作業記錄）
+RENAME_DONE = 'done'
+RENAME_NO_MATCH = 'no_match'
+RENAME_FAILED = 'failed'
+RENAME_INTERRUPTED = 'interrupted'
+RENAME_ENCRYPT_QUEUED = 'encrypt_queued'
+
 def is_file_in_use(file_path):
     """
     跨平台檢測文件是否被其他程序占用
@@ -69,6 +77,163 @@ def is_file_in_use(file_path):
     # 默認情況下，假設文件沒有被占用
     return False
 
+# 目錄掃描的並行線程數，網絡共享上同時列出多個目錄可以掩蓋往返延遲
+DISCOVERY_WORKERS = 4
+
+def configure_discovery(max_workers=None):
+    """
+    設置目錄掃描
+    
+    參數:
+        max_workers (int): 同時掃描的目錄數，1表示在調用者線程中依序掃描
+    """
+    global DISCOVERY_WORKERS
+    if max_workers is not None:
+        DISCOVERY_WORKERS = max(1, int(max_workers))
+
+class PdfFileEntry(str):
+    """
+    掃描目錄時找到的文件路徑，附帶目錄項提供的文件狀態
+    
+    本身就是路徑字符串，可以直接傳給所有接受路徑的函數；stat_result中的大小和修改時間
+    供排程和提取緩存使用，不必再次stat。
+    """
+    
+    def __new__(cls, path, stat_result=None):
+        entry = super().__new__(cls, path)
+        entry.stat_result = stat_result
+        return entry
+    
+    def __reduce__(self):
+        # 進程池傳遞任務時保留文件狀態
+        return (PdfFileEntry, (str(self), self.stat_result))
+    
+    @property
+    def size(self):
+        """文件大小（字節），未知時為None"""
+        return self.stat_result.st_size if self.stat_result is not None else None
+    
+    @property
+    def mtime_ns(self):
+        """修改時間（納秒），未知時為None"""
+        return self.stat_result.st_mtime_ns if self.stat_result is not None else None
+
+def _scan_directory(directory, extensions):
+    """
+    列出一個目錄下的PDF文件和子目錄
+    
+    整個目錄先完整列出再返回，之後在同一目錄中重命名產生的新文件不會被當作新發現的文件。
+    
+    參數:
+        directory (str): 目錄路徑
+        extensions (tuple): 小寫的文件擴展名
+        
+    返回:
+        tuple: (PdfFileEntry列表, 子目錄路徑列表)
+    """
+    files = []
+    subdirs = []
+    try:
+        with os.scandir(directory) as iterator:
+            entries = list(iterator)
+    except OSError as e:
+        log_message(f"無法讀取目錄 {directory}: {e}", level='警告')
+        return files, subdirs
+    
+    for entry in entries:
+        try:
+            if entry.is_dir():
+                # 與os.walk相同，不進入指向目錄的符號鏈接
+                if not entry.is_symlink():
+                    subdirs.append(entry.path)
+            elif entry.name.lower().endswith(extensions) and entry.is_file():
+                files.append(PdfFileEntry(entry.path, entry.stat()))
+        except OSError as e:
+            log_message(f"讀取文件信息時出錯 {entry.path}: {e}", level='警告')
+    return files, subdirs
+
+def iter_pdf_files(root, max_workers=None, extensions=('.pdf',), summary=None):
+    """
+    遞歸掃描目錄，找到一個目錄的文件就立即產出，不必等整棵目錄樹掃描完成
+    
+    參數:
+        root (str): 起始目錄
+        max_workers (int): 同時掃描的目錄數，默認使用DISCOVERY_WORKERS
+        extensions (tuple): 要查找的文件擴展名
+        summary (dict): 統計字典，掃描過程中更新found（已找到的文件數），
+                        調用者在處理結束後據此判斷是否找到了文件，不必預先另外掃描一次
+        
+    產出:
+        PdfFileEntry: 帶有文件大小和修改時間的文件路徑
+    """
+    if max_workers is None:
+        max_workers = DISCOVERY_WORKERS
+    extensions = tuple(ext.lower() for ext in extensions)
+    if summary is None:
+        summary = {}
+    summary['found'] = 0
+    
+    if max_workers <= 1:
+        pending_dirs = [root]
+        while pending_dirs:
+            files, subdirs = _scan_directory(pending_dirs.pop(), extensions)
+            pending_dirs.extend(reversed(subdirs))
+            summary['found'] += len(files)
+            yield from files
+        return
+    
+    import queue
+    dir_queue = queue.Queue()
+    result_queue = queue.Queue()
+    stop_event = threading.Event()
+    
+    def scan_worker():
+        while not stop_event.is_set():
+            directory = dir_queue.get()
+            if directory is None:
+                break
+            files, subdirs = _scan_directory(directory, extensions)
+            for subdir in subdirs:
+                dir_queue.put(subdir)
+            # 先放入子目錄再回報，調用者據此計算尚未完成的目錄數
+            result_queue.put((files, len(subdirs)))
+    
+    workers = [threading.Thread(target=scan_worker, name=f"PdfScan-{i}", daemon=True) for i in range(max_workers)]
+    for worker in workers:
+        worker.start()
+    dir_queue.put(root)
+    outstanding = 1
+    try:
+        while outstanding:
+            files, subdir_count = result_queue.get()
+            outstanding += subdir_count - 1
+            summary['found'] += len(files)
+            yield from files
+    finally:
+        # 正常結束或調用者提前停止讀取時都讓掃描線程退出
+        stop_event.set()
+        for _ in workers:
+            dir_queue.put(None)
+
+def find_first_pdf(directory):
+    """
+    找出目錄中（不含子目錄）第一個PDF文件
+    
+    參數:
+        directory (str): 目錄路徑
+        
+    返回:
+        str or None: 文件名，沒有PDF文件時返回None
+    """
+    try:
+        with os.scandir(directory) as iterator:
+            for entry in iterator:
+                if entry.name.lower().endswith('.pdf') and entry.is_file():
+                    return entry.name
+    except OSError as e:
+        log_message(f"無法讀取目錄 {directory}: {e}", level='警告')
+    return None
+
 def file_utils_signal_handler(sig, frame):
     """處理Ctrl+C信號，設置中斷標記"""
     global interrupt_received
@@ -76,15 +241,177 @@ def file_utils_signal_handler(sig, frame):
     print("\n\n收到中斷信號，將在當前任務完成後退出...")
     log_message("收到中斷信號，將在當前任務完成後退出...", level='警告')
 
-def file_renamer(rule_items, pdf_file, search_location, result_queue=None, ui_update_event=None, is_copy_mode=False, default_user_password=None, default_owner_password=None, has_fitz=False, has_pypdf2=False, has_paddleocr=False, has_pikepdf=False, use_ocr=False, remove_whitespace=False, save_ocr_txt=False):
+def find_matching_rule(rule_set, context, early_exit=False):
+    """
+    按規則順序找出第一條匹配的規則
+    
+    一般模式下讀取完整內容後依序評估規則。逐頁模式（early_exit）下每讀完一頁就評估一次，
+    第一條達到重複次數的規則即被採用，剩餘頁面不再讀取；標記為完整讀取（full_scan）且
+    尚未達到重複次數的規則會擋住排在它後面的規則，直到文件讀完才做最終判斷。
+    逐頁評估時內容規則的次數按頁累加（IncrementalRuleScan），每頁只掃描新讀取的文本。
+    
+    參數:
+        rule_set: CompiledRuleSet編譯後的規則集
+        context: PdfExtractionContext提取上下文
+        early_exit: 是否逐頁匹配並提前停止
+        
+    返回:
+        規則對象或None（沒有匹配或收到中斷信號）
+    """
+    content_scan = rule_set.incremental_scan("內容") if early_exit else None
+    if content_scan is not None:
+        # 檔名和元數據不隨頁面變化，第一次評估時掃描後重用；內容的次數隨每一頁累加
+        scans = {"內容": content_scan}
+        for page_text in context.iter_content():
+            if interrupt_received:
+                return None
+            content_scan.feed(page_text)
+            rule = rule_set.find_first_match(context.get_text_for, block_on_full_scan=True, scans=scans)
+            if rule is not None:
+                return rule
+    
+    # 檢查是否收到中斷信號
+    if interrupt_received:
+        return None
+    # 讀取完整內容後按順序判斷
+    return rule_set.find_first_match(context.get_text_for)
+
+def _random_password(length=8):
+    """生成由字母和數字組成的隨機密碼"""
+    import random, string
+    return ''.join(random.choice(string.ascii_letters + string.digits) for _ in range(length))
+
+def resolve_rule_passwords(rule, default_user_password=None, default_owner_password=None):
+    """
+    確定匹配規則後加密文件使用的密碼
+    
+    規則指定了密碼時使用規則的密碼，標記為採用預設密碼或沒有指定時使用默認密碼，
+    默認密碼也為空時生成隨機密碼並提示。
+    
+    參數:
+        rule: 匹配的規則對象
+        default_user_password: 默認用戶密碼
+        default_owner_password: 默認所有者密碼
+    
+    返回:
+        tuple or None: (用戶密碼, 所有者密碼)，規則不需要加密時返回None
+    """
+    if not (hasattr(rule, 'user_pass') and hasattr(rule, 'owner_pass')):
+        return None
+    
+    # 如果rule中有user_pass屬性且不為空，則使用rule中的密碼；否則使用默認密碼
+    if getattr(rule, 'user_pass_set', False) or rule.user_pass == '':
+        user_pass = default_user_password
+        # 如果密碼為空，生成一個隨機密碼
+        if not user_pass:
+            user_pass = _random_password()
+            print(f"警告：用戶密碼為空，已生成隨機密碼: {user_pass}")
+    else:
+        user_pass = rule.user_pass
+    
+    if getattr(rule, 'owner_pass_set', False) or rule.owner_pass == '':
+        owner_pass = default_owner_password
+        # 如果密碼為空，生成一個隨機密碼
+        if not owner_pass:
+            owner_pass = _random_password()
+            print(f"警告：所有者密碼為空，已生成隨機密碼: {owner_pass}")
+    else:
+        owner_pass = rule.owner_pass
+    return user_pass, owner_pass
+
+def apply_rename_outcome(record, result):
+    """
+    把file_renamer放入結果隊列的結果寫入結果記錄
+
+    匹配了規則但處理失敗的文件設置error，作業記錄中標記為失敗；因中斷而未處理的文件設置interrupted，
+    續傳時重新處理；已交給加密階段的文件設置encrypt_pending，最終結果由加密階段報告。
+
+    參數:
+        record (dict): 結果記錄
+        result (tuple): file_renamer放入結果隊列的(文件路徑, 是否重命名, 新路徑, 處理結果)
+    """
+    _, _, new_path, outcome = result
+    record['new_path'] = new_path
+    record['outcome'] = outcome
+    if outcome == RENAME_FAILED and not record.get('error'):
+        record['error'] = "文件處理失敗，詳見處理日誌"
+    elif outcome == RENAME_INTERRUPTED:
+        record['interrupted'] = True
+    elif outcome == RENAME_ENCRYPT_QUEUED:
+        record['encrypt_pending'] = True
+
+def unique_output_path(directory, new_name, max_attempts=100):
+    """
+    在目錄中為新檔名找到不與現有文件衝突的路徑，衝突時依次加上_1、_2等後綴
+    
+    參數:
+        directory: 輸出目錄
+        new_name: 不含擴展名的新檔名
+        max_attempts: 最多嘗試的後綴數量
+    
+    返回:
+        str or None: 輸出路徑，找不到唯一檔名時返回None
+    """
+    output_path = os.path.join(directory, f"{new_name}.pdf")
+    counter = 1
+    while os.path.exists(output_path):
+        output_path = os.path.join(directory, f"{new_name}_{counter}.pdf")
+        counter += 1
+        if counter > max_attempts: # 防止無限循環，設定一個上限
+            log_message(f"嘗試了{max_attempts}個不同的檔名後，仍然無法為 {new_name} 找到唯一的檔名。跳過此檔案。", level='警告')
+            return None
+    return output_path
+
+def reserve_output_path(directory, new_name, max_attempts=100):
+    """
+    與unique_output_path相同地選擇檔名，並立即在該路徑以獨佔方式建立空的佔位文件
+    
+    建立佔位文件是原子操作，同時為其他文件選擇檔名的工作者或進程不會選中同一路徑；
+    輸出寫完後以os.replace替換佔位文件，失敗時用release_output_path刪除。
+    
+    參數:
+        directory: 輸出目錄
+        new_name: 不含擴展名的新檔名
+        max_attempts: 最多嘗試的後綴數量
+    
+    返回:
+        str or None: 已佔用的輸出路徑，找不到唯一檔名或無法建立文件時返回None
+    """
+    output_path = os.path.join(directory, f"{new_name}.pdf")
+    counter = 1
+    while True:
+        try:
+            with open(output_path, 'xb'):
+                pass
+            return output_path
+        except FileExistsError:
+            output_path = os.path.join(directory, f"{new_name}_{counter}.pdf")
+            counter += 1
+            if counter > max_attempts: # 防止無限循環，設定一個上限
+                log_message(f"嘗試了{max_attempts}個不同的檔名後，仍然無法為 {new_name} 找到唯一的檔名。跳過此檔案。", level='警告')
+                return None
+        except OSError as e:
+            log_message(f"無法建立輸出文件 {output_path}: {e}", level='错误')
+            return None
+
+def release_output_path(output_path):
+    """輸出沒有完成時刪除reserve_output_path建立的、仍為空的佔位文件"""
+    try:
+        if os.path.getsize(output_path) == 0:
+            os.remove(output_path)
+    except OSError:
+        pass
+
+def file_renamer(rule_items, pdf_file, search_location, result_queue=None, ui_update_event=None, is_copy_mode=False, default_user_password=None, default_owner_password=None, has_fitz=False, has_pypdf2=False, has_paddleocr=False, has_pikepdf=False, use_ocr=False, remove_whitespace=False, save_ocr_txt=False, early_exit=False, ocr_instance=None, encryption_stage=None):
     """
     根據規則匹配PDF內容並重命名或複製PDF文件，如需要還會加密
     
     參數:
-        rule_items: 規則項目列表
+        rule_items: 規則項目列表或已編譯的CompiledRuleSet
         pdf_file: PDF文件路徑
         search_location: 搜索位置
-        result_queue: 結果隊列
+        result_queue: 結果隊列，放入(文件路徑, 是否重命名, 新路徑, 處理結果)，處理結果為RENAME_DONE、
+                      RENAME_NO_MATCH、RENAME_FAILED、RENAME_INTERRUPTED或RENAME_ENCRYPT_QUEUED
         ui_update_event: UI更新事件 (已棄用，保留參數以兼容現有代碼)
         is_copy_mode: 是否為複製模式（True為複製，False為重命名）
         default_user_password: 默認用戶密碼
@@ -96,6 +423,10 @@ def file_renamer(rule_items, pdf_file, search_location, result_queue=None, ui_up
         use_ocr: 是否使用OCR功能處理所有PDF文件
         remove_whitespace: 是否去除中文文本中的空白
         save_ocr_txt: 是否將OCR結果保存為txt文件
+        early_exit: 是否逐頁匹配，有規則達到重複次數後即停止讀取剩餘頁面
+        ocr_instance: 可選的PaddleOCR實例，提供時不再從模型池借出
+        encryption_stage: 可選的EncryptionStage或DeferredEncryption，提供時需要加密的文件交給它加密，
+                          本函數不等待加密完成
     """
     
     # 如果result_queue未傳入且全局變量中沒有定義，創建一個新的隊列
@@ -104,149 +435,103 @@ def file_renamer(rule_items, pdf_file, search_location, result_queue=None, ui_up
         result_queue = queue.Queue()
     
     # 導入需要的模塊
-    import re
-    from pdf_utils import extract_text_from_pdf, encrypt_pdf
-    
+    from pdf_utils import PdfExtractionContext, encrypt_pdf
+    from rule_utils import CompiledRuleSet
+
     # 檢查是否收到中斷信號
     if interrupt_received:
         log_message(f"由於收到中斷信號，跳過處理文件: {pdf_file}", level='警告')
         if result_queue:
-            result_queue.put((pdf_file, False, None))
+            result_queue.put((pdf_file, False, None, RENAME_INTERRUPTED))
         return False
         
+    context = None
     try:
-        # 提取文件名（不含路徑和擴展名）
-        filename = os.path.splitext(os.path.basename(pdf_file))[0]
+        rule_set = rule_items if isinstance(rule_items, CompiledRuleSet) else CompiledRuleSet(rule_items)
         
-        # 如果需要OCR，為每個線程創建獨立的PaddleOCR實例
-        ocr_instance = None
-        if has_paddleocr and use_ocr:
-            try:
-                # 使用paddle_utils模塊初始化PaddleOCR
-                try:
-                    from paddle_utils import init_paddleocr
-                    ocr_instance = init_paddleocr(use_angle_cls=True, lang="ch")
-                    if ocr_instance is None:
-                        # 如果初始化失敗，嘗試直接導入PaddleOCR
-                        from paddleocr import PaddleOCR
-                        ocr_instance = PaddleOCR(use_angle_cls=True, lang="ch")
-                except ImportError:
-                    # 如果paddle_utils不可用，直接導入PaddleOCR
-                    from paddleocr import PaddleOCR
-                    ocr_instance = PaddleOCR(use_angle_cls=True, lang="ch")
-                log_message(f"為線程創建獨立的PaddleOCR實例處理文件: {filename}", level='信息')
-            except Exception as e:
-                log_message(f"創建PaddleOCR實例時出錯: {e}", level='警告')
+        # 創建文件的提取上下文，內容和元數據在第一條需要它們的規則中才提取，之後所有規則共用
+        # 如果use_ocr為True則強制使用OCR，但暫時不保存OCR結果；OCR只識別規則聲明的頁面和區域
+        context = PdfExtractionContext(pdf_file, has_fitz, has_pypdf2, has_paddleocr, force_ocr=use_ocr, remove_whitespace=remove_whitespace, region_plan=rule_set.region_plan)
         
-        # 提取元數據
-        metadata = ""
-        if has_fitz:
+        # 如果需要OCR且緩存中沒有此文件的內容，從模型池借出一個PaddleOCR實例，提取完成後歸還
+        ocr_pool = None
+        if has_paddleocr and use_ocr and ocr_instance is None and not context.has_cached_content():
             try:
-                import fitz
-                with fitz.open(pdf_file) as doc:
-                    if doc.metadata and isinstance(doc.metadata, dict):
-                        for key, value in doc.metadata.items():
-                            if value:
-                                metadata += str(value)
+                from paddle_utils import get_ocr_pool
+                ocr_pool = get_ocr_pool()
+                ocr_instance = ocr_pool.checkout()
             except Exception as e:
-                log_message(f"讀取元數據時出錯: {e}", level='警告')
+                log_message(f"獲取PaddleOCR實例時出錯: {e}", level='警告')
+        context.ocr_instance = ocr_instance
         
         # 初始化變量，用於跟踪是否成功重命名
         rename_success = False
         new_pdf_path = None
+        encrypt_queued = False
         
-        # 應用規則
-        for rule in rule_items:
+        try:
+            # 應用規則，找出第一條匹配的規則
+            matched_rule = find_matching_rule(rule_set, context, early_exit)
+            
             # 檢查是否收到中斷信號
             if interrupt_received:
                 log_message(f"由於收到中斷信號，中止規則處理: {pdf_file}", level='警告')
                 if result_queue:
-                    result_queue.put((pdf_file, False, None))
+                    result_queue.put((pdf_file, False, None, RENAME_INTERRUPTED))
                 return False
-            # 提取文本，如果use_ocr為True則強制使用OCR，但暫時不保存OCR結果
-            text = extract_text_from_pdf(pdf_file, has_fitz, has_pypdf2, has_paddleocr, force_ocr=use_ocr, remove_whitespace=remove_whitespace, save_txt=False, ocr_instance=ocr_instance)
             
-            # 根據目標類型選擇要匹配的內容
-            if rule.target_type == "內容":
-                content_to_match = text
-            elif rule.target_type == "檔名":
-                content_to_match = filename
-            elif rule.target_type == "元數據":
-                content_to_match = metadata
+            # 需要保存OCR結果時，在文件被重命名前讀完全部內容
+            if use_ocr and save_ocr_txt and has_paddleocr:
+                text = context.content
             else:
-                content_to_match = text  # 默認使用內容
+                text = ""
+        finally:
+            # 停止讀取剩餘頁面並釋放文件，以便後續重命名；OCR模型不再需要，歸還給其他文件使用
+            context.close()
+            if ocr_pool is not None:
+                ocr_pool.checkin(ocr_instance)
+        
+        # 如果匹配成功
+        if matched_rule is not None:
+            rule = matched_rule
+            # 獲取新文件名
+            new_name = rule.name if hasattr(rule, 'name') else rule.name_to
             
-            # 使用正則表達式匹配
-            pattern = re.compile(rule.pattern) if hasattr(rule, 'pattern') else rule.rule_from
-            matches = pattern.findall(content_to_match)
-            occurrence = int(rule.occurrence) if hasattr(rule, 'occurrence') else rule.occurrence_match
+            # 構建新文件路徑並處理文件名衝突；直接加密時先佔用檔名，
+            # 避免其他工作者在保存完成前選中同一路徑而互相覆蓋；交給加密階段時由它分配並佔用檔名
+            passwords = resolve_rule_passwords(rule, default_user_password, default_owner_password)
+            output_path = None
+            if passwords is None or encryption_stage is None:
+                if passwords is not None:
+                    output_path = reserve_output_path(os.path.dirname(pdf_file), new_name)
+                else:
+                    output_path = unique_output_path(os.path.dirname(pdf_file), new_name)
+                if output_path is None:
+                    if result_queue:
+                        result_queue.put((pdf_file, False, None, RENAME_FAILED))
+                    return False
             
-            # 如果匹配成功
-            if matches and len(matches) >= occurrence:
-                # 獲取新文件名
-                new_name = rule.name if hasattr(rule, 'name') else rule.name_to
+            # 如果需要加密
+            if passwords is not None and encryption_stage is not None:
+                user_pass, owner_pass = passwords
                 
-                # 構建新文件路徑
-                output_path = os.path.join(os.path.dirname(pdf_file), f"{new_name}.pdf")
-                
-                # 處理文件名衝突
-                counter = 1
-                while os.path.exists(output_path):
-                    output_path = os.path.join(os.path.dirname(pdf_file), f"{new_name}_{counter}.pdf")
-                    counter += 1
-                    if counter > 100: # 防止無限循環，設定一個上限
-                        log_message(f"嘗試了100個不同的檔名後，仍然無法為 {new_name} 找到唯一的檔名。跳過此檔案。", level='警告')
-                        if result_queue:
-                            result_queue.put((pdf_file, False, None))
-                        return False
+                # 釋放文檔句柄後交給加密階段，由它分配最終檔名，加密成功後刪除原文件
+                context.close_document()
+                new_pdf_path = encryption_stage.submit(pdf_file, os.path.dirname(pdf_file), new_name, user_pass, owner_pass)
+                if new_pdf_path is not None:
+                    log_message(f"文件已交給加密階段，等待加密並重命名為: {new_pdf_path}")
+                    rename_success = True
+                    encrypt_queued = True
+                else:
+                    log_message(f"加密文件失敗: {pdf_file}", level='警告')
+            elif passwords is not None:
+                user_pass, owner_pass = passwords
                 
-                # 如果需要加密
-                # 如果需要加密
-                if hasattr(rule, 'user_pass') and hasattr(rule, 'owner_pass'):
-                    # 設置密碼
-                    if hasattr(rule, 'user_pass_set') and rule.user_pass_set:
-                        # 使用函數參數中傳入的默認用戶密碼
-                        user_pass = default_user_password
-                        # 如果密碼為空，生成一個隨機密碼
-                        if not user_pass:
-                            import random, string
-                            user_pass = ''.join(random.choice(string.ascii_letters + string.digits) for _ in range(8))
-                            print(f"警告：用戶密碼為空，已生成隨機密碼: {user_pass}")
-                    else:
-                        # 如果rule中有user_pass屬性且不為空，則使用rule中的密碼
-                        if hasattr(rule, 'user_pass') and rule.user_pass != '':
-                            user_pass = rule.user_pass
-                        else:
-                            # 否則使用默認密碼
-                            user_pass = default_user_password
-                            # 如果默認密碼為空，生成一個隨機密碼
-                            if not user_pass:
-                                import random, string
-                                user_pass = ''.join(random.choice(string.ascii_letters + string.digits) for _ in range(8))
-                                print(f"警告：用戶密碼為空，已生成隨機密碼: {user_pass}")
-                    
-                    if hasattr(rule, 'owner_pass_set') and rule.owner_pass_set:
-                        # 使用函數參數中傳入的默認所有者密碼
-                        owner_pass = default_owner_password
-                        # 如果密碼為空，生成一個隨機密碼
-                        if not owner_pass:
-                            import random, string
-                            owner_pass = ''.join(random.choice(string.ascii_letters + string.digits) for _ in range(8))
-                            print(f"警告：所有者密碼為空，已生成隨機密碼: {owner_pass}")
-                    else:
-                        # 如果rule中有owner_pass屬性且不為空，則使用rule中的密碼
-                        if hasattr(rule, 'owner_pass') and rule.owner_pass != '':
-                            owner_pass = rule.owner_pass
-                        else:
-                            # 否則使用默認密碼
-                            owner_pass = default_owner_password
-                            # 如果默認密碼為空，生成一個隨機密碼
-                            if not owner_pass:
-                                import random, string
-                                owner_pass = ''.join(random.choice(string.ascii_letters + string.digits) for _ in range(8))
-                                print(f"警告：所有者密碼為空，已生成隨機密碼: {owner_pass}")
-                    
-                    # 使用臨時文件路徑進行加密
+                # 用提取時已打開的文檔句柄直接把加密結果保存到已佔用的檔名（先寫臨時文件再原子替換佔位文件），不再重新讀取文件
+                encrypt_success = context.save_encrypted(output_path, user_pass, owner_pass)
+                context.close_document()
+                if not encrypt_success:
+                    # 沒有PyMuPDF或保存失敗時，使用pikepdf或PyPDF2重新讀取並加密
                     temp_output_path = output_path + ".temp"
                     encrypt_success = encrypt_pdf(
                         pdf_file, 
@@ -256,81 +541,85 @@ def file_renamer(rule_items, pdf_file, search_location, result_queue=None, ui_up
                         has_pikepdf, 
                         has_pypdf2
                     )
-                    
                     if encrypt_success:
                         try:
-                            # 重命名源文件為備份（以防萬一）
-                            backup_path = pdf_file + ".bak"
-                            os.rename(pdf_file, backup_path)
-                            
-                            # 將臨時文件重命名為最終文件名
-                            os.rename(temp_output_path, output_path)
-                            
-                            # 刪除備份文件
-                            try:
-                                os.remove(backup_path)
-                            except Exception as backup_err:
-                                log_message(f"刪除備份文件時出錯: {backup_err}", level='警告')
-                            
-                            log_message(f"文件已加密並重命名為: {output_path}")
-                            rename_success = True
-                            new_pdf_path = output_path
+                            os.replace(temp_output_path, output_path)
                         except Exception as rename_err:
                             log_message(f"重命名加密文件時出錯: {rename_err}", level='错误')
-                            rename_success = False
-                    else:
-                        log_message(f"加密文件失敗: {pdf_file}", level='警告')
-                        rename_success = False
+                            encrypt_success = False
+                
+                if encrypt_success:
+                    # 加密後的文件已在最終路徑，刪除原文件
+                    try:
+                        os.remove(pdf_file)
+                    except Exception as del_err:
+                        log_message(f"刪除原文件時出錯: {del_err}", level='警告')
+                    log_message(f"文件已加密並重命名為: {output_path}")
+                    rename_success = True
+                    new_pdf_path = output_path
                 else:
-                    # 根據模式選擇重命名或複製
+                    release_output_path(output_path)
+                    log_message(f"加密文件失敗: {pdf_file}", level='警告')
+                    rename_success = False
+            else:
+                # 釋放文檔句柄後才能重命名原文件
+                context.close_document()
+                # 根據模式選擇重命名或複製
+                try:
+                    # 檢查文件是否被占用
+                    file_in_use = is_file_in_use(pdf_file)
+                    
+                    # 如果文件被占用且不是複製模式，自動切換到複製模式
+                    if file_in_use and not is_copy_mode:
+                        log_message(f"檔案 {pdf_file} 被其他程序占用，自動切換到複製模式", level='警告')
+                        is_copy_mode = True
+                    
+                    if is_copy_mode:
+                        # 複製模式：複製文件
+                        import shutil
+                        shutil.copy2(pdf_file, output_path)
+                        log_message(f"文件已複製為: {output_path}")
+                        rename_success = True
+                        new_pdf_path = output_path
+                    else:
+                        # 重命名模式：嘗試直接重命名
+                        os.rename(pdf_file, output_path)
+                        log_message(f"文件已重命名為: {output_path}")
+                        rename_success = True
+                        new_pdf_path = output_path
+                except Exception as e:
+                    # 如果重命名失敗（可能是跨卷），嘗試複製後刪除
                     try:
-                        # 檢查文件是否被占用
-                        file_in_use = is_file_in_use(pdf_file)
-                        
-                        # 如果文件被占用且不是複製模式，自動切換到複製模式
-                        if file_in_use and not is_copy_mode:
-                            log_message(f"檔案 {pdf_file} 被其他程序占用，自動切換到複製模式", level='警告')
-                            is_copy_mode = True
-                        
-                        if is_copy_mode:
-                            # 複製模式：複製文件
-                            import shutil
-                            shutil.copy2(pdf_file, output_path)
-                            log_message(f"文件已複製為: {output_path}")
-                            rename_success = True
-                            new_pdf_path = output_path
-                        else:
-                            # 重命名模式：嘗試直接重命名
-                            os.rename(pdf_file, output_path)
-                            log_message(f"文件已重命名為: {output_path}")
-                            rename_success = True
-                            new_pdf_path = output_path
-                    except Exception as e:
-                        # 如果重命名失敗（可能是跨卷），嘗試複製後刪除
-                        try:
-                            import shutil
-                            shutil.copy2(pdf_file, output_path)
-                            if not is_copy_mode:  # 只有在重命名模式下才刪除原文件
-                                try:
-                                    os.remove(pdf_file)
-                                    log_message(f"文件已複製並刪除原文件: {output_path}")
-                                except Exception as del_err:
-                                    log_message(f"無法刪除原文件，可能被占用: {del_err}", level='警告')
-                                    log_message(f"文件已複製為: {output_path}")
-                            else:
+                        import shutil
+                        shutil.copy2(pdf_file, output_path)
+                        if not is_copy_mode:  # 只有在重命名模式下才刪除原文件
+                            try:
+                                os.remove(pdf_file)
+                                log_message(f"文件已複製並刪除原文件: {output_path}")
+                            except Exception as del_err:
+                                log_message(f"無法刪除原文件，可能被占用: {del_err}", level='警告')
                                 log_message(f"文件已複製為: {output_path}")
-                            rename_success = True
-                            new_pdf_path = output_path
-                        except Exception as copy_err:
-                            log_message(f"重命名/複製文件失敗: {e}, {copy_err}", level='错误')
-                            rename_success = False
-                
-                # 找到匹配後跳出規則循環，處理下一個文件
-                break
+                        else:
+                            log_message(f"文件已複製為: {output_path}")
+                        rename_success = True
+                        new_pdf_path = output_path
+                    except Exception as copy_err:
+                        log_message(f"重命名/複製文件失敗: {e}, {copy_err}", level='错误')
+                        rename_success = False
         
-        # 如果沒有匹配的規則
-        if not rename_success:
-            log_message(f"沒有匹配的規則或處理失敗: {pdf_file}", level='警告')
+        # 沒有匹配的規則時保持原名；匹配了規則但沒有完成重命名或加密時為處理失敗
+        if matched_rule is None and context.extraction_failed:
+            # 提取內容出錯時沒有匹配可能只是因為內容不完整，記為失敗，續傳時重新處理
+            outcome = RENAME_FAILED
+            log_message(f"提取內容出錯，沒有匹配的規則: {pdf_file}", level='警告')
+        elif matched_rule is None:
+            outcome = RENAME_NO_MATCH
+            log_message(f"沒有匹配的規則: {pdf_file}", level='警告')
+        elif rename_success:
+            outcome = RENAME_ENCRYPT_QUEUED if encrypt_queued else RENAME_DONE
+        else:
+            outcome = RENAME_FAILED
+            log_message(f"處理失敗: {pdf_file}", level='警告')
         
         # 無論是否重命名成功，只要啟用了OCR和保存OCR結果，都將OCR文本保存到txt文件中
         if use_ocr and save_ocr_txt and has_paddleocr and text:
@@ -347,14 +636,18 @@ def file_renamer(rule_items, pdf_file, search_location, result_queue=None, ui_up
         
         # 將結果放入隊列
         if result_queue:
-            result_queue.put((pdf_file, rename_success, new_pdf_path))
+            result_queue.put((pdf_file, rename_success, new_pdf_path, outcome))
         
         return rename_success
     except Exception as e:
         log_message(f"處理文件時出錯: {pdf_file}, {e}", level='错误')
         if result_queue:
-            result_queue.put((pdf_file, False, None))
+            result_queue.put((pdf_file, False, None, RENAME_FAILED))
         return False
+    finally:
+        # 沒有匹配規則或中途返回時也要關閉共用的文檔句柄
+        if context is not None:
+            context.close_document()
 
 
             
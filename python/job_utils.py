@@ -0,0 +1,358 @@
+import sqlite3
+import os
+import time
+import json
+import uuid
+import hashlib
+import itertools
+import threading
+
+from log_utils import log_message
+
+# 全局變量
+# 作業記錄使用獨立的數據庫文件，不會被cleanup_database刪除，中斷後可用--resume繼續
+jobs_file = 'pdf_jobs.db'
+_job_store_instance = None
+_job_store_lock = threading.Lock()
+
+# 作業中文件的狀態碼，與files表一致
+JOB_FILE_PENDING = 0
+JOB_FILE_DONE = 2
+JOB_FILE_FAILED = 3
+
+def compute_rules_hash(rule_items):
+    """
+    計算規則集的指紋，用於續傳時確認規則是否已變更（不包含密碼）
+
+    參數:
+        rule_items: 規則列表或已編譯的CompiledRuleSet
+
+    返回:
+        str: 十六進制的blake2b哈希值
+    """
+    rules = getattr(rule_items, 'rules', rule_items)
+    description = []
+    for rule in rules:
+        description.append([
+            getattr(rule, 'rule_pattern', getattr(rule, 'pattern', None)),
+            getattr(rule, 'name_to', getattr(rule, 'replacement', None)),
+            getattr(rule, 'target_type', getattr(rule, 'rule_type', None)),
+            getattr(rule, 'occurrence_match', None),
+            getattr(rule, 'full_scan', False),
+            getattr(rule, 'page_range', None),
+            getattr(rule, 'region', None)
+        ])
+    rules_json = json.dumps(description, ensure_ascii=False, default=str)
+    return hashlib.blake2b(rules_json.encode('utf-8'), digest_size=16).hexdigest()
+
+class JobStore:
+    """
+    持久化的作業記錄
+
+    每次處理建立一個作業，保存搜索位置、規則指紋、處理設置，以及每個文件的處理結果。
+    程序崩潰或被中斷後，可以根據記錄只重新處理未完成和失敗的文件。
+    """
+
+    def __init__(self, jobs_path=None):
+        self.jobs_path = jobs_path or jobs_file
+        self.lock = threading.Lock()
+
+        # 同一個連接由多個線程共用，通過鎖保護
+        self.conn = sqlite3.connect(self.jobs_path, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                search_location TEXT,
+                rules_hash TEXT,
+                settings TEXT,
+                status TEXT,
+                created REAL,
+                updated REAL
+            )
+        ''')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS job_files (
+                job_id TEXT,
+                path TEXT,
+                status INTEGER,
+                matched INTEGER,
+                new_path TEXT,
+                message TEXT,
+                elapsed REAL,
+                updated REAL,
+                PRIMARY KEY (job_id, path)
+            )
+        ''')
+        self.conn.commit()
+
+    def create_job(self, search_location, rules_hash, settings):
+        """
+        建立新作業
+
+        參數:
+            search_location (str): 搜索位置
+            rules_hash (str): 規則指紋
+            settings (dict): 處理設置
+
+        返回:
+            str: 作業ID
+        """
+        job_id = f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                'INSERT INTO jobs (job_id, search_location, rules_hash, settings, status, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job_id, os.path.abspath(search_location), rules_hash,
+                 json.dumps(settings, sort_keys=True, ensure_ascii=False, default=str), 'running', now, now)
+            )
+            self.conn.commit()
+        return job_id
+
+    def find_job(self, job_id=None):
+        """
+        查找作業
+
+        參數:
+            job_id (str): 作業ID，None表示最近更新的作業
+
+        返回:
+            dict or None: 作業信息
+        """
+        with self.lock:
+            if job_id:
+                row = self.conn.execute(
+                    'SELECT job_id, search_location, rules_hash, settings, status, created, updated FROM jobs WHERE job_id = ?',
+                    (job_id,)
+                ).fetchone()
+            else:
+                row = self.conn.execute(
+                    'SELECT job_id, search_location, rules_hash, settings, status, created, updated FROM jobs ORDER BY updated DESC LIMIT 1'
+                ).fetchone()
+        if row is None:
+            return None
+        return {
+            'job_id': row[0],
+            'search_location': row[1],
+            'rules_hash': row[2],
+            'settings': json.loads(row[3]) if row[3] else {},
+            'status': row[4],
+            'created': row[5],
+            'updated': row[6]
+        }
+
+    def add_files(self, job_id, file_paths, chunk_size=10000):
+        """
+        把文件登記到作業中（已登記的文件保持原有結果）
+
+        參數:
+            job_id (str): 作業ID
+            file_paths (iterable): 文件路徑
+            chunk_size (int): 每個事務插入的路徑數量
+
+        返回:
+            int: 新登記的文件數量
+        """
+        added_count = 0
+        paths = iter(file_paths)
+        while True:
+            chunk = list(itertools.islice(paths, chunk_size))
+            if not chunk:
+                break
+            with self.lock:
+                cursor = self.conn.executemany(
+                    'INSERT OR IGNORE INTO job_files (job_id, path, status) VALUES (?, ?, ?)',
+                    ((job_id, os.path.abspath(path), JOB_FILE_PENDING) for path in chunk)
+                )
+                added_count += max(cursor.rowcount, 0)
+                self.conn.commit()
+        return added_count
+
+    def record_result(self, job_id, file_path, record):
+        """
+        記錄單個文件的處理結果（每個文件立即提交，崩潰時最多只需重做正在處理的文件）
+
+        參數:
+            job_id (str): 作業ID
+            file_path (str): 文件路徑
+            record (dict): 處理結果，包含success、new_path、error、elapsed，
+                           因中斷而未處理的文件帶有interrupted標記
+        """
+        error = record.get('error')
+        if record.get('interrupted'):
+            status = JOB_FILE_PENDING
+        else:
+            status = JOB_FILE_FAILED if error else JOB_FILE_DONE
+        new_path = record.get('new_path')
+        now = time.time()
+        try:
+            with self.lock:
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO job_files (job_id, path, status, matched, new_path, message, elapsed, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (job_id, os.path.abspath(file_path), status, int(bool(record.get('success'))),
+                     os.path.abspath(new_path) if new_path else None, error, record.get('elapsed'), now)
+                )
+                self.conn.execute('UPDATE jobs SET updated = ? WHERE job_id = ?', (now, job_id))
+                self.conn.commit()
+        except sqlite3.Error as e:
+            log_message(f"記錄作業結果時出錯: {file_path}, {e}", level='警告')
+
+    def track_files(self, job_id, file_paths, chunk_size=64):
+        """
+        邊產出文件路徑邊把它們登記到作業中，適合接在目錄掃描生成器之後
+
+        參數:
+            job_id (str): 作業ID
+            file_paths (iterable): 文件路徑
+            chunk_size (int): 每次登記的路徑數量
+
+        產出:
+            原樣產出file_paths中的每個路徑
+        """
+        paths = iter(file_paths)
+        while True:
+            chunk = list(itertools.islice(paths, chunk_size))
+            if not chunk:
+                break
+            self.add_files(job_id, chunk)
+            yield from chunk
+
+    def iter_resume_files(self, job_id, discovered_paths, summary):
+        """
+        根據作業記錄篩選續傳時需要處理的文件
+
+        已完成的文件會核對輸出是否仍然存在：重命名後的文件遺失而原文件仍在時重新處理；
+        本作業產生的輸出文件不會被當作新文件再次處理。
+
+        參數:
+            job_id (str): 作業ID
+            discovered_paths (iterable): 本次在搜索位置找到的文件路徑（可以是生成器）
+            summary (dict): 統計字典，篩選過程中更新（skipped、skipped_seconds、failed、pending、new、redo、missing）
+
+        產出:
+            需要處理的文件路徑
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT path, status, matched, new_path, elapsed FROM job_files WHERE job_id = ?', (job_id,)
+            ).fetchall()
+
+        for key in ('skipped', 'failed', 'pending', 'new', 'redo', 'missing'):
+            summary[key] = 0
+        summary['skipped_seconds'] = 0.0
+        known = {}
+        produced = set()
+        redo = set()
+        for path, status, matched, new_path, elapsed in rows:
+            known[path] = status
+            if new_path:
+                produced.add(new_path)
+            if status != JOB_FILE_DONE:
+                continue
+            if matched and new_path:
+                # 加密階段在加密完成前以空文件佔用檔名，中途崩潰留下的空文件不算已完成的輸出
+                if os.path.exists(new_path) and os.path.getsize(new_path) > 0:
+                    summary['skipped'] += 1
+                    summary['skipped_seconds'] += elapsed or 0
+                elif os.path.exists(path):
+                    # 輸出文件已不在，但原文件仍在，需要重新處理
+                    redo.add(path)
+                else:
+                    summary['missing'] += 1
+                    log_message(f"續傳核對：{path} 的輸出文件 {new_path} 已不存在", level='警告')
+            else:
+                # 沒有匹配任何規則的文件保持原名，不需要重新處理
+                summary['skipped'] += 1
+                summary['skipped_seconds'] += elapsed or 0
+
+        for file_path in discovered_paths:
+            abs_path = os.path.abspath(file_path)
+            if abs_path in produced and abs_path not in known:
+                continue
+            status = known.get(abs_path)
+            if status is None:
+                summary['new'] += 1
+            elif abs_path in redo:
+                summary['redo'] += 1
+            elif status == JOB_FILE_DONE:
+                continue
+            elif status == JOB_FILE_FAILED:
+                summary['failed'] += 1
+            else:
+                summary['pending'] += 1
+            yield file_path
+
+    def finish_job(self, job_id, status=None):
+        """
+        更新作業狀態，未指定時根據文件結果判斷是否全部完成
+
+        參數:
+            job_id (str): 作業ID
+            status (str): 作業狀態（running、completed、incomplete、interrupted）
+
+        返回:
+            str: 作業狀態
+        """
+        with self.lock:
+            if status is None:
+                remaining = self.conn.execute(
+                    'SELECT COUNT(*) FROM job_files WHERE job_id = ? AND status != ?', (job_id, JOB_FILE_DONE)
+                ).fetchone()[0]
+                status = 'completed' if remaining == 0 else 'incomplete'
+            self.conn.execute('UPDATE jobs SET status = ?, updated = ? WHERE job_id = ?', (status, time.time(), job_id))
+            self.conn.commit()
+        return status
+
+    def close(self):
+        """關閉作業數據庫連接"""
+        with self.lock:
+            try:
+                self.conn.close()
+            except Exception as e:
+                log_message(f"關閉作業記錄時出錯: {e}", level='警告')
+
+def format_resume_summary(job_id, summary):
+    """
+    生成續傳統計的說明文字
+
+    參數:
+        job_id (str): 作業ID
+        summary (dict): iter_resume_files更新的統計字典
+
+    返回:
+        str: 說明文字
+    """
+    text = (f"續傳作業 {job_id}：跳過已完成 {summary['skipped']} 個文件"
+            f"（上次處理耗時約 {summary['skipped_seconds']:.1f} 秒），"
+            f"重新處理失敗 {summary['failed']} 個、未完成 {summary['pending']} 個、新發現 {summary['new']} 個")
+    if summary['redo']:
+        text += f"，輸出遺失需重做 {summary['redo']} 個"
+    if summary['missing']:
+        text += f"，輸出和原文件均不存在 {summary['missing']} 個"
+    return text
+
+def get_job_store():
+    """
+    獲取當前進程共用的作業記錄實例
+
+    返回:
+        JobStore or None: 無法打開時返回None
+    """
+    global _job_store_instance
+    with _job_store_lock:
+        if _job_store_instance is None:
+            try:
+                _job_store_instance = JobStore()
+            except Exception as e:
+                log_message(f"無法打開作業記錄，本次處理將不能續傳: {e}", level='警告')
+                return None
+        return _job_store_instance
+
+def close_job_store():
+    """關閉作業記錄"""
+    global _job_store_instance
+    with _job_store_lock:
+        if _job_store_instance is not None:
+            _job_store_instance.close()
+            _job_store_instance = None
@@ -45,6 +45,32 @@ def log_message(message, level='信息', thread_name=None):
     except Exception as e:
         pass  # 如果通知UI更新失败，则忽略
 
+def append_log_entries(entries):
+    """
+    將其他進程產生的日誌條目合併到全局日誌列表（線程安全）
+    
+    參數:
+        entries (list): 日誌條目字典列表
+    """
+    global log_entries, log_lock
+    if not entries:
+        return
+    with log_lock:
+        log_entries.extend(entries)
+
+def drain_log_entries():
+    """
+    取出並清空目前的日誌條目（線程安全），用於工作進程把日誌交回主進程
+    
+    返回:
+        list: 日誌條目字典列表
+    """
+    global log_entries, log_lock
+    with log_lock:
+        entries = log_entries[:]
+        del log_entries[:]
+    return entries
+
 def init_logging():
     """
     初始化日誌系統
@@ -11,6 +11,7 @@ import queue
 import csv
 import shutil
 import signal
+import itertools
 
 # 嘗試導入questionary，如果不可用則在check_and_install_dependencies中安裝
 try:
@@ -19,12 +20,16 @@ except ImportError:
     questionary = None
 
 # 導入自定義模塊
-from db_utils import init_database, cleanup_database, db_connection, update_file_status, get_pending_files, add_files_to_database
+from db_utils import init_database, cleanup_database, update_file_status, get_pending_files, register_files, get_status_counts, get_files_by_status
 from log_utils import log_message, save_log_to_csv, log_entries
 from input_utils import input_helper, validate_path
-from rule_utils import Rule, SimpleRule
-from file_utils import file_renamer, check_and_install_dependencies
-from pdf_utils import extract_text_from_pdf, encrypt_pdf, split_pdf, process_pdf_files
+from rule_utils import Rule, SimpleRule, is_valid_regex
+from file_utils import file_renamer, check_and_install_dependencies, iter_pdf_files, find_first_pdf, configure_discovery
+from pdf_utils import extract_text_from_pdf, encrypt_pdf, split_pdf, process_pdf_files, configure_ocr_batch, configure_ocr_pipeline, configure_ocr_resolution, configure_page_classifier, configure_split, configure_encryption_fallback
+from encrypt_utils import configure_encryption
+from cache_utils import configure_cache, clear_extraction_cache, close_extraction_cache
+from split_utils import split_and_rename_pdf
+from job_utils import get_job_store, close_job_store, compute_rules_hash, format_resume_summary
 
 # 全局變量
 has_paddleocr = False
@@ -34,6 +39,8 @@ pdf_status_dict = {}
 default_user_password = ""
 default_owner_password = ""
 worker_status = {}
+# 所有文件處理完成後設置，通知UI線程停止更新
+processing_done = threading.Event()
 worker_lock = threading.Lock()
 result_queue = queue.Queue()
 # OCR相關全局設置
@@ -47,6 +54,39 @@ try:
 except ImportError:
     log_message("paddle_utils模塊不可用，PaddleOCR的警告訊息將顯示在控制台", level='警告')
 
+def parse_arguments(argv=None):
+    """解析命令列參數
+    
+    參數:
+        argv (list): 命令列參數列表，默認為None（使用sys.argv）
+    
+    返回:
+        argparse.Namespace: 解析結果
+    """
+    import argparse
+    parser = argparse.ArgumentParser(description="PDF切割&重新命名小工具")
+    parser.add_argument('--no-cache', action='store_true', help='不使用提取結果緩存，每個文件都重新提取文本')
+    parser.add_argument('--clear-cache', action='store_true', help='開始前清空提取結果緩存')
+    parser.add_argument('--cache-size', type=int, default=512, help='提取結果緩存容量上限（MB），默認512')
+    parser.add_argument('--ocr-batch-size', type=int, default=1, help='每批送入OCR的頁數，默認1（逐頁識別）')
+    parser.add_argument('--ocr-batch-memory', type=int, default=256, help='批量OCR時預先渲染的頁面最多佔用的內存（MB），默認256')
+    parser.add_argument('--ocr-pipeline-depth', type=int, default=2, help='渲染和OCR之間最多排隊的批次數，0表示不使用流水線，默認2')
+    parser.add_argument('--ocr-max-dpi', type=int, default=300, help='OCR頁面渲染的最高解析度，默認300')
+    parser.add_argument('--ocr-max-megapixels', type=float, default=8.7, help='OCR單頁圖像最多像素數（百萬），大幅面頁面會相應降低解析度，默認8.7（A4紙300dpi）')
+    parser.add_argument('--ocr-fast-dpi', type=int, default=0, help='先以此解析度快速識別，置信度不足時再以較高解析度重新識別，默認0（不使用）')
+    parser.add_argument('--ocr-confidence', type=float, default=0.8, help='頁面平均置信度低於此值時重新識別，默認0.8')
+    parser.add_argument('--hybrid-min-chars', type=int, default=20, help='文字層少於此字數的頁面才考慮OCR，默認20')
+    parser.add_argument('--hybrid-min-image-coverage', type=float, default=0.3, help='圖像覆蓋頁面比例達到此值的頁面才OCR，默認0.3')
+    parser.add_argument('--ocr-models', type=int, default=None, help='最多同時載入的PaddleOCR模型數量，默認每個工作線程一個')
+    parser.add_argument('--scan-workers', type=int, default=4, help='同時掃描的目錄數，網絡共享上可以調高，默認4')
+    parser.add_argument('--split-workers', type=int, default=1, help='切割PDF時並行輸出的進程數，0表示使用CPU核心數，默認1（依次輸出）')
+    parser.add_argument('--encrypt-workers', type=int, default=0, help='加密使用的獨立進程數，提取和匹配規則的工作者不等待加密，默認0（處理文件時直接加密）')
+    parser.add_argument('--encrypt-queue', type=int, default=8, help='等待加密的文件數上限，加密跟不上時暫停提交，默認8')
+    parser.add_argument('--pypdf2-encrypt-max', type=float, default=20, help='超過此大小（MB）的文件不使用較慢的PyPDF2加密，0表示不限制，默認20')
+    parser.add_argument('--schedule', choices=['discovery', 'lpt'], default='discovery', help='處理順序：discovery按發現順序邊掃描邊處理；lpt先掃描完所有文件，按預估耗時從長到短處理，適合大小懸殊的文件，默認discovery')
+    parser.add_argument('--resume', nargs='?', const='latest', default=None, metavar='JOB_ID', help='繼續之前中斷的作業，只處理未完成和失敗的文件；不指定作業ID時繼續最近一次作業')
+    return parser.parse_args(argv)
+
 def generate_random_password(length=8):
     """生成隨機密碼"""
     characters = string.ascii_letters + string.digits + string.punctuation
@@ -113,46 +153,29 @@ def display_files_status():
         error_logs.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
         error_logs = error_logs[:5]
         
-        # 從數據庫獲取文件狀態
-        with db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT path, status, message, thread FROM files')
-            rows = cursor.fetchall()
-            
-            # 計算統計信息
-            pending = 0
-            queued = 0
-            processing = 0
-            failed = 0
-            completed = 0
-            
-            for row in rows:
-                path, status, message, thread_id = row
-                file_name = os.path.basename(path)
-                
-                if status == 0:  # 待處理
-                    # 檢查是否已排入隊列
-                    if thread_id is not None:
-                        queued += 1
-                        # 縮短檔名顯示：首尾各3個字符，中間用...代替
-                        short_name = truncate_filename(file_name)
-                        queued_files.append(f"{short_name}")  # 白色
-                    else:
-                        pending += 1
-                elif status == 1:  # 處理中
-                    processing += 1
-                    # 縮短檔名顯示：首尾各3個字符，中間用...代替
-                    short_name = truncate_filename(file_name)
-                    processing_files.append(f"\033[93m{short_name}\033[0m")  # 黃色
-                elif status == 2:  # 已處理成功
-                    completed += 1
-                elif status == 3:  # 處理失敗
-                    failed += 1
-                    # 縮短檔名顯示：首尾各3個字符，中間用...代替
-                    short_name = truncate_filename(file_name)
-                    failed_files.append(f"\033[91m{short_name} ({message})\033[0m")  # 紅色
+        # 從數據庫獲取各狀態的數量（計數表）和屏幕能顯示的少量文件
+        counts = get_status_counts()
+        pending = counts['pending']
+        queued = counts['queued']
+        processing = counts['processing']
+        completed = counts['completed']
+        failed = counts['failed']
+        total = counts['total']
+        
+        # 每個類別最多顯示的文件數（預留行給進度條、錯誤日誌和統計信息）
+        max_files_per_category = max(1, (terminal_size.lines - 15) // 3) * files_per_line
         
-        total = pending + queued + processing + completed + failed
+        for path, message, thread_id in get_files_by_status(1, max_files_per_category):
+            # 縮短檔名顯示：首尾各3個字符，中間用...代替
+            short_name = truncate_filename(os.path.basename(path))
+            processing_files.append(f"\033[93m{short_name}\033[0m")  # 黃色
+        for path, message, thread_id in get_files_by_status(0, max_files_per_category):
+            if thread_id is not None:
+                short_name = truncate_filename(os.path.basename(path))
+                queued_files.append(f"{short_name}")  # 白色
+        for path, message, thread_id in get_files_by_status(3, max_files_per_category, recent_first=True):
+            short_name = truncate_filename(os.path.basename(path))
+            failed_files.append(f"\033[91m{short_name} ({message})\033[0m")  # 紅色
         
         # 顯示處理中的文件 (優先顯示)
         if processing_files:
@@ -160,6 +183,8 @@ def display_files_status():
             for i in range(0, len(processing_files), files_per_line):
                 end_idx = min(i + files_per_line, len(processing_files))
                 print(" ".join(processing_files[i:end_idx]))
+            if processing > len(processing_files):
+                print(f"...等 {processing - len(processing_files)} 個處理中的檔案")
             print()
         
         # 顯示排隊中的文件
@@ -168,6 +193,8 @@ def display_files_status():
             for i in range(0, len(queued_files), files_per_line):
                 end_idx = min(i + files_per_line, len(queued_files))
                 print(" ".join(queued_files[i:end_idx]))
+            if queued > len(queued_files):
+                print(f"...等 {queued - len(queued_files)} 個排隊中的檔案")
             print()
         
         # 顯示失敗的文件
@@ -176,6 +203,8 @@ def display_files_status():
             for i in range(0, len(failed_files), files_per_line):
                 end_idx = min(i + files_per_line, len(failed_files))
                 print(" ".join(failed_files[i:end_idx]))
+            if failed > len(failed_files):
+                print(f"...等 {failed - len(failed_files)} 個失敗的檔案")
             print()
         
         # 使用tqdm顯示進度條
@@ -227,22 +256,13 @@ def ui_thread_function():
         # 不再等待更新事件，改為直接顯示文件狀態
         display_files_status()
         
-        # 檢查是否所有文件都已處理完成
-        with db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT COUNT(*) FROM files')
-            total = cursor.fetchone()[0]
-            
-            if total > 0:
-                cursor.execute('SELECT COUNT(*) FROM files WHERE status = 2')
-                completed = cursor.fetchone()[0]
-                
-                # 如果所有文件都已處理完成（進度100%），則停止更新UI
-                if completed == total:
-                    # 最後更新一次UI
-                    display_files_status()
-                    log_message("所有文件處理完成，UI更新停止", level='信息')
-                    break
+        # 文件邊掃描邊處理，已登記的文件全部完成不代表沒有後續文件，
+        # 因此等處理函數返回後才停止更新UI
+        if processing_done.is_set():
+            # 最後更新一次UI
+            display_files_status()
+            log_message("所有文件處理完成，UI更新停止", level='信息')
+            break
         
         # 休眠1秒，定期查詢數據庫更新UI
         time.sleep(1.0)
@@ -343,8 +363,8 @@ def process_files_parallel(file_list, process_func, max_workers=None, *args, **k
     
     log_message(f"開始並行處理 {total_count} 個文件...", level='信息')
     
-    # 將文件添加到數據庫中
-    added_count = add_files_to_database(file_list)
+    # 將文件批量登記到數據庫中，同時設置為等待處理狀態
+    added_count = register_files(file_list)
     log_message(f"已將 {added_count} 個文件添加到數據庫", level='信息')
     
     # 使用worker_context來創建和管理線程池，確保線程數量受到控制
@@ -353,9 +373,6 @@ def process_files_parallel(file_list, process_func, max_workers=None, *args, **k
         # 提交所有任務
         future_to_file = {}
         for file_path in file_list:
-            # 更新狀態為等待
-            update_worker_status(file_path, 0, "等待處理")
-            
             # 提交任務
             future = executor.submit(process_file_worker, file_path, process_func, *args, **kwargs)
             future_to_file[future] = file_path
@@ -373,9 +390,27 @@ def process_files_parallel(file_list, process_func, max_workers=None, *args, **k
     log_message(f"並行處理完成，成功: {success_count}/{total_count}", level='信息')
     return success_count
 
+def print_split_progress(completed, total, file_path):
+    """
+    在同一行顯示切割進度
+    
+    參數:
+        completed (int): 已輸出的文件數
+        total (int): 文件總數，未知時為None
+        file_path (str): 剛輸出的文件路徑
+    """
+    if total is None:
+        # 按分界頁切割時，文件總數要讀完原文件才知道
+        print(f"\r正在輸出...第{completed}個，檔名：{os.path.basename(file_path)}", end="", flush=True)
+    else:
+        print(f"\r正在輸出...{completed}/{total}，檔名：{os.path.basename(file_path)}", end="\n" if completed == total else "", flush=True)
+
 def import_rules_from_csv(csv_path):
     """從CSV文件導入規則
-    CSV格式: 關鍵字,目標檔名,原則,重複次數,開啟密碼,編輯密碼
+    CSV格式: 關鍵字,目標檔名,原則,重複次數,開啟密碼,編輯密碼[,完整讀取[,頁碼範圍[,區域]]]
+    完整讀取為可選欄位，填入「是」表示該規則需要讀完整個文件才能判斷（不受逐頁匹配提前停止影響）
+    頁碼範圍和區域為可選欄位，只影響OCR：頁碼範圍如「1」、「1-3」、「2-」，
+    區域為「左,上,右,下」四個0到1之間的頁面比例（需加引號），例如"0,0,1,0.2"表示頁面頂部20%
     """
     rules = []
     try:
@@ -390,6 +425,9 @@ def import_rules_from_csv(csv_path):
                     occurrence = row[3].strip() if len(row) > 3 and row[3].strip() else "1"
                     user_pass = row[4].strip() if len(row) > 4 else ""
                     owner_pass = row[5].strip() if len(row) > 5 else ""
+                    full_scan = row[6].strip().lower() in ('是', 'y', 'yes', 'true', '1') if len(row) > 6 else False
+                    page_range = row[7].strip() if len(row) > 7 else ""
+                    region = row[8].strip() if len(row) > 8 else ""
                     
                     # 處理b''格式的字節字符串
                     def convert_byte_str(s):
@@ -415,7 +453,10 @@ def import_rules_from_csv(csv_path):
                         owner_pass, 
                         user_pass_set, 
                         owner_pass_set, 
-                        encrypt_enable
+                        encrypt_enable,
+                        full_scan,
+                        page_range,
+                        region
                     )
                     rules.append(rule)
         print(f"成功從CSV導入了 {len(rules)} 條規則")
@@ -434,6 +475,8 @@ def signal_handler(sig, frame):
         log_message("已清理數據庫", level='信息')
     except Exception as e:
         log_message(f"清理數據庫時出錯: {e}", level='警告')
+    close_extraction_cache()
+    close_job_store()
     
     # 保存日誌
     try:
@@ -575,6 +618,9 @@ def preview_pdf_content(pdf_path, num_pages=None, use_ocr=False, remove_whitespa
         return False
 
 def main():
+    # 解析命令列參數
+    args = parse_arguments()
+    
     # 註冊信號處理器，捕捉Ctrl+C
     signal.signal(signal.SIGINT, signal_handler)
     
@@ -649,6 +695,37 @@ def main():
     # 初始化數據庫
     init_database()
     
+    # 設置提取結果緩存
+    configure_cache(enabled=not args.no_cache, max_bytes=args.cache_size * 1024 * 1024)
+    if args.clear_cache:
+        clear_extraction_cache()
+        print("已清空提取結果緩存")
+    if args.no_cache:
+        log_message("已停用提取結果緩存", level='信息')
+    
+    # 設置批量OCR、OCR流水線、渲染解析度和逐頁判斷條件
+    configure_ocr_batch(batch_size=args.ocr_batch_size, memory_budget_mb=args.ocr_batch_memory)
+    configure_ocr_pipeline(queue_depth=args.ocr_pipeline_depth)
+    configure_ocr_resolution(
+        max_dpi=args.ocr_max_dpi,
+        max_megapixels=args.ocr_max_megapixels,
+        fast_dpi=args.ocr_fast_dpi,
+        confidence_threshold=args.ocr_confidence
+    )
+    configure_page_classifier(min_text_chars=args.hybrid_min_chars, min_image_coverage=args.hybrid_min_image_coverage)
+    configure_discovery(max_workers=args.scan_workers)
+    configure_split(max_workers=args.split_workers)
+    configure_encryption(max_workers=args.encrypt_workers, queue_depth=args.encrypt_queue)
+    configure_encryption_fallback(pypdf2_max_mb=args.pypdf2_encrypt_max)
+    
+    # 設置PaddleOCR模型池，模型在首次使用時載入，之後所有文件重用
+    if args.ocr_models is not None:
+        try:
+            from paddle_utils import configure_ocr_pool
+            configure_ocr_pool(max_size=args.ocr_models)
+        except ImportError:
+            pass
+    
     rule_items = []
     
     print("歡迎使用PDF切割&重新命名小工具，本工具可以幫你把連續的PDF切割成小檔案，並根據你提供的搜尋原則重新命名／加密這些檔案")
@@ -688,6 +765,9 @@ def main():
     pdf_name = ""
     location = ""
     ori_meta = ""
+    fused_split = False
+    boundary_pattern = None
+    num_page = None
     
     # 根據操作模式處理
     if operation_mode == "切割PDF並重命名":
@@ -707,8 +787,45 @@ def main():
         if os.path.exists(pdf_name):
             print("PDF檔案...已確認！")
             
-            page_str = input_helper("你要幾頁切割為一個檔案？", False)
-            num_page = int(page_str)
+            # 詢問是否在切割時直接按規則命名：只讀取原文件一次，每段頁面直接以最終檔名（及加密）保存
+            if has_fitz:
+                if questionary:
+                    fused_split = questionary.select(
+                        "是否在切割時直接按規則命名？(只讀取原文件一次，不產生中間文件)",
+                        choices=["是", "否"],
+                        default="是"
+                    ).ask() == "是"
+                else:
+                    fused_split = input_helper(
+                        "是否在切割時直接按規則命名？(y/n)\n(只讀取原文件一次，不產生中間文件)",
+                        True,
+                        default="y"
+                    ).lower() in ['y', 'yes']
+            
+            # 切割並命名模式下可以按內容決定切割位置：文本符合分界正則表達式的頁面開始一個新文件
+            if fused_split:
+                if questionary:
+                    split_by_boundary = questionary.select(
+                        "請選擇切割方式：",
+                        choices=["按固定頁數切割", "按分界頁切割（內容符合正則表達式的頁面開始新文件）"],
+                        default="按固定頁數切割"
+                    ).ask().startswith("按分界頁")
+                else:
+                    split_by_boundary = input_helper(
+                        "請選擇切割方式：\n1. 按固定頁數切割\n2. 按分界頁切割（內容符合正則表達式的頁面開始新文件）\n請輸入選項編號(1/2): ",
+                        True,
+                        default="1"
+                    ) == "2"
+                if split_by_boundary:
+                    boundary_pattern = input_helper(
+                        "請輸入分界頁的正則表達式（例如封面上的編號格式）",
+                        False,
+                        validation_func=lambda x: (is_valid_regex(x), "正則表達式無效")
+                    )
+            
+            if boundary_pattern is None:
+                page_str = input_helper("你要幾頁切割為一個檔案？", False)
+                num_page = int(page_str)
             
             if not os.path.exists(location):
                 os.makedirs(location)
@@ -716,7 +833,9 @@ def main():
             print("輸出資料夾...已確認！")
             
             # 讀取PDF元數據
-            if has_fitz:
+            if fused_split:
+                log_message("使用切割並命名模式，規則導入後再切割", level='信息')
+            elif has_fitz:
                 try:
                     with fitz.open(pdf_name) as doc:
                         # 添加防呆機制，確保metadata是字典類型且不為None
@@ -732,30 +851,29 @@ def main():
                 print("PyMuPDF未安裝，無法讀取PDF元數據。")
             
             # 分割PDF - 使用可用的庫
-            split_success = split_pdf(pdf_name, location, num_page, has_fitz, has_pikepdf, has_pypdf2)
-            
-            if not split_success:
-                print("無法分割PDF，請確保已安裝至少一個PDF處理庫")
-                sys.exit(1)
-    
-    # 設置搜索位置
-    search_location = input_helper(
-        "請提供要搜尋的資料夾位置", 
-        True, 
-        default=location if location else ".",
-        validation_func=validate_path
-    )
-    
-    # 獲取PDF文件列表
-    pdf_files = []
-    for root, _, files in os.walk(search_location):
-        for file in files:
-            if file.lower().endswith('.pdf'):
-                file_path = os.path.join(root, file)
-                pdf_files.append(file_path)
-    
-    # 獲取當前目錄下的PDF文件列表（用於預覽）
-    local_pdf_files = [f for f in os.listdir(search_location) if f.lower().endswith('.pdf')]
+            if not fused_split:
+                split_success = split_pdf(pdf_name, location, num_page, has_fitz, has_pikepdf, has_pypdf2,
+                                          progress_callback=print_split_progress)
+                
+                if not split_success:
+                    print("無法分割PDF，請確保已安裝至少一個PDF處理庫")
+                    sys.exit(1)
+    
+    if fused_split:
+        # 切割並命名模式直接處理原文件，預覽原文件的內容
+        search_location = location
+        preview_pdf_name = os.path.abspath(pdf_name)
+    else:
+        # 設置搜索位置
+        search_location = input_helper(
+            "請提供要搜尋的資料夾位置", 
+            True, 
+            default=location if location else ".",
+            validation_func=validate_path
+        )
+        
+        # 找出搜索位置下的第一個PDF文件（用於預覽），完整的文件列表在開始處理時才邊掃描邊處理
+        preview_pdf_name = find_first_pdf(search_location)
     
     # 詢問是否啟用OCR功能
     use_ocr = False
@@ -812,6 +930,22 @@ def main():
     else:
         log_message("未安裝PaddleOCR，無法使用OCR功能", level='警告')
     
+    # 詢問是否使用逐頁匹配模式
+    if questionary:
+        early_exit = questionary.select(
+            "是否逐頁匹配規則，找到符合的規則後即停止讀取剩餘頁面？(適用於關鍵字位於前幾頁的大型掃描文件)",
+            choices=["是", "否"],
+            default="否"
+        ).ask() == "是"
+    else:
+        early_exit = input_helper(
+            "是否逐頁匹配規則，找到符合的規則後即停止讀取剩餘頁面？(y/n)\n(適用於關鍵字位於前幾頁的大型掃描文件)",
+            True,
+            default="n"
+        ).lower() in ['y', 'yes']
+    if early_exit:
+        log_message("已啟用逐頁匹配模式，規則匹配後將停止讀取剩餘頁面", level='信息')
+    
     # 從CSV導入規則
     if operation_mode == "從CSV導入規則並重命名" or pdf_name:
         csv_path = input_helper(
@@ -822,16 +956,16 @@ def main():
         rule_items = import_rules_from_csv(csv_path)
     
     # 預覽第一個PDF文件
-    if local_pdf_files:
+    if preview_pdf_name:
         if questionary:
             preview_choice = questionary.select(
-            f"是否要預覽第一個PDF文件 ({local_pdf_files[0]}) 的內容？",
+            f"是否要預覽第一個PDF文件 ({preview_pdf_name}) 的內容？",
                 choices=["是", "否"],
                 default="是"
             ).ask() == "是"
         else:
             preview_choice = input_helper(
-                f"是否要預覽第一個PDF文件 ({local_pdf_files[0]}) 的內容？(y/n)",
+                f"是否要預覽第一個PDF文件 ({preview_pdf_name}) 的內容？(y/n)",
                 True,
                 default="y",
                 is_confirm=True
@@ -878,31 +1012,52 @@ def main():
             # 使用与OCR设置相同的参数进行预览
             if use_ocr and use_ocr_preview:
                 # 如果全局OCR已启用且预览也使用OCR，使用相同的设置
-                preview_pdf_content(os.path.join(search_location, local_pdf_files[0]), num_pages, use_ocr_preview, remove_whitespace, save_ocr_txt)
+                preview_pdf_content(os.path.join(search_location, preview_pdf_name), num_pages, use_ocr_preview, remove_whitespace, save_ocr_txt)
             else:
                 # 否则使用预览特定的设置
-                preview_pdf_content(os.path.join(search_location, local_pdf_files[0]), num_pages, use_ocr_preview, remove_whitespace_preview, False)
+                preview_pdf_content(os.path.join(search_location, preview_pdf_name), num_pages, use_ocr_preview, remove_whitespace_preview, False)
     
     if not rule_items:
         print("未設置任何規則，程序將退出")
         sys.exit(0)
     
-    # 處理PDF文件
-    print(f"開始處理 {search_location} 中的PDF文件...")
-    
-    # 獲取PDF文件列表
-    pdf_files = []
-    for root, _, files in os.walk(search_location):
-        for file in files:
-            if file.lower().endswith('.pdf'):
-                file_path = os.path.join(root, file)
-                pdf_files.append(file_path)
-    
-    if not pdf_files:
-        print("未找到PDF文件")
+    # 切割並命名模式：逐頁讀取原文件，每段頁面直接以規則決定的檔名保存，不再掃描輸出目錄
+    if fused_split:
+        records = split_and_rename_pdf(
+            pdf_name, location, num_page, rule_items,
+            boundary_pattern=boundary_pattern,
+            has_paddleocr=has_paddleocr,
+            use_ocr=use_ocr,
+            remove_whitespace=remove_whitespace if use_ocr else False,
+            save_ocr_txt=save_ocr_txt,
+            default_user_password=default_user_password,
+            default_owner_password=default_owner_password,
+            progress_callback=print_split_progress
+        )
+        if boundary_pattern is not None and records:
+            print()
+        matched_count = sum(1 for record in records if record['rule'])
+        encrypted_count = sum(1 for record in records if record['encrypted'])
+        failed_count = sum(1 for record in records if record['error'])
+        print(f"切割完成，共輸出 {len(records) - failed_count} 個文件，其中 {matched_count} 個按規則命名、{encrypted_count} 個已加密")
+        if failed_count:
+            print(f"有 {failed_count} 個文件保存失敗，詳見處理日誌")
+        cleanup_database()
+        close_extraction_cache()
+        try:
+            from paddle_utils import shutdown_ocr_pool
+            shutdown_ocr_pool()
+        except ImportError:
+            pass
+        try:
+            save_log_to_csv()
+        except Exception as e:
+            log_message(f"保存日誌時出錯: {e}", level='警告')
+        print("程序執行完畢，感謝使用！")
         return
     
-    print(f"找到 {len(pdf_files)} 個PDF文件")
+    # 處理PDF文件
+    print(f"開始處理 {search_location} 中的PDF文件...")
     
     # 顯示OCR設置信息
     if use_ocr:
@@ -926,7 +1081,21 @@ def main():
     
     # 解析用戶輸入的線程數
     max_workers = min(int(thread_count_str), cpu_count)  # 確保不超過CPU核心數
-    print(f"將使用 {max_workers} 個執行緒處理PDF檔案")
+    
+    # 詢問並行方式：OCR和文本提取佔用CPU較多時，多進程可避開GIL限制
+    if questionary:
+        backend_choice = questionary.select(
+            "請選擇並行處理方式：",
+            choices=["多線程（適合文字型PDF）", "多進程（適合大量OCR或掃描文件）"],
+            default="多線程（適合文字型PDF）"
+        ).ask()
+        backend = 'process' if backend_choice.startswith("多進程") else 'thread'
+    else:
+        print("請選擇並行處理方式：")
+        print("1. 多線程（適合文字型PDF）")
+        print("2. 多進程（適合大量OCR或掃描文件）")
+        backend = 'process' if input_helper("請輸入選項編號(1/2): ", True, default="1") == "2" else 'thread'
+    print(f"將使用 {max_workers} 個{'進程' if backend == 'process' else '執行緒'}處理PDF檔案")
     
     # 詢問操作類型（重命名或複製）
     if questionary:
@@ -965,6 +1134,59 @@ def main():
         print("操作已取消")
         return
     
+    # 邊掃描目錄邊處理：找到的文件直接送入工作池，處理在掃描完成前就開始；
+    # 目錄樹只掃描一次，沒有找到PDF文件時由掃描統計在處理結束後提示
+    scan_summary = {}
+    pdf_files = iter_pdf_files(search_location, summary=scan_summary)
+    
+    # 建立或繼續作業記錄，中斷後可以只重新處理未完成的文件
+    job_store = get_job_store()
+    job_id = None
+    resume_summary = None
+    if job_store is not None:
+        rules_hash = compute_rules_hash(rule_items)
+        job_settings = {
+            'is_copy_mode': is_copy_mode,
+            'use_ocr': use_ocr,
+            'remove_whitespace': remove_whitespace,
+            'save_ocr_txt': save_ocr_txt,
+            'early_exit': early_exit,
+            'backend': backend
+        }
+        if args.resume:
+            job = job_store.find_job(None if args.resume == 'latest' else args.resume)
+            if job is None:
+                print(f"找不到可繼續的作業{'' if args.resume == 'latest' else ' ' + args.resume}，將建立新作業")
+            elif job['search_location'] != os.path.abspath(search_location):
+                print(f"作業 {job['job_id']} 的搜索位置是 {job['search_location']}，與本次不同，將建立新作業")
+            else:
+                resume_confirmed = True
+                if job['rules_hash'] != rules_hash:
+                    resume_confirmed = input_helper(
+                        f"作業 {job['job_id']} 使用的規則與本次不同，仍要繼續該作業嗎？(y/n)",
+                        True,
+                        default="n"
+                    ).lower() in ['y', 'yes']
+                if resume_confirmed:
+                    job_id = job['job_id']
+                    resume_summary = {}
+                    pdf_files = job_store.iter_resume_files(job_id, pdf_files, resume_summary)
+                    # 取出第一個需要處理的文件，確認還有剩餘工作
+                    first_file = next(pdf_files, None)
+                    if first_file is None:
+                        job_store.finish_job(job_id)
+                        print(format_resume_summary(job_id, resume_summary))
+                        print("作業中的文件都已處理完成")
+                        close_job_store()
+                        cleanup_database()
+                        return
+                    pdf_files = itertools.chain([first_file], pdf_files)
+        if job_id is None:
+            job_id = job_store.create_job(search_location, rules_hash, job_settings)
+        pdf_files = job_store.track_files(job_id, pdf_files)
+        print(f"作業ID: {job_id}（中斷後可使用 --resume {job_id} 繼續）")
+        log_message(f"作業ID: {job_id}", level='信息')
+    
     # 啟動UI線程
     ui_thread = threading.Thread(target=ui_thread_function, daemon=True)
     ui_thread.start()
@@ -995,8 +1217,25 @@ def main():
         remove_whitespace,  # 傳遞去除空白選項
         save_ocr_txt,  # 傳遞保存OCR文本選項
         default_user_password,  # 傳遞默認用戶密碼
-        default_owner_password  # 傳遞默認所有者密碼
+        default_owner_password,  # 傳遞默認所有者密碼
+        early_exit,  # 傳遞逐頁匹配選項
+        backend,  # 傳遞並行處理方式
+        schedule=args.schedule,
+        result_callback=(lambda file_path, record: job_store.record_result(job_id, file_path, record)) if job_id else None
     )
+    processing_done.set()
+    
+    # 續傳時的統計在掃描完成後才完整
+    if resume_summary is not None:
+        summary_text = format_resume_summary(job_id, resume_summary)
+        print(summary_text)
+        log_message(summary_text, level='信息')
+    
+    # 更新作業狀態，有未完成或失敗的文件時提示如何續傳
+    if job_id:
+        job_status = job_store.finish_job(job_id)
+        if job_status != 'completed':
+            print(f"作業 {job_id} 仍有未完成或失敗的文件，可使用 --resume {job_id} 繼續")
     
     # 如果啟用了OCR和保存TXT，提示用戶
     if use_ocr and save_ocr_txt:
@@ -1006,10 +1245,20 @@ def main():
     # 處理完成，給UI線程一點時間來最後更新一次
     time.sleep(1)
     
-    print(f"處理完成，共處理了 {processed_count} 個文件")
+    if not scan_summary.get('found'):
+        print("未找到PDF文件")
+    else:
+        print(f"處理完成，共處理了 {processed_count} 個文件")
     
     # 程序結束前清理資源
     cleanup_database()
+    close_extraction_cache()
+    close_job_store()
+    try:
+        from paddle_utils import shutdown_ocr_pool
+        shutdown_ocr_pool()
+    except ImportError:
+        pass
     
     # 保存日誌
     try:
@@ -2,8 +2,16 @@ import warnings
 import logging
 import os
 import sys
+import time
+import threading
+from contextlib import contextmanager
 from log_utils import log_message
 
+# 全局OCR模型池，由configure_ocr_pool設置，get_ocr_pool在首次使用時創建
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+ocr_pool_max_size = None  # None表示不限制，每個並發使用者最多載入一個模型
+
 # 創建一個自定義的警告過濾器
 class PaddleWarningFilter(warnings.catch_warnings):
     """自定義警告過濾器，用於捕獲PaddleOCR的警告訊息並重定向到日誌系統"""
@@ -107,4 +115,214 @@ def init_paddleocr(use_angle_cls=True, lang="ch"):
         return None
     except Exception as e:
         log_message(f"初始化PaddleOCR時出錯: {e}", level='错误')
-        return None
\ No newline at end of file
+        return None
+
+def create_paddleocr(use_angle_cls=True, lang="ch"):
+    """創建PaddleOCR實例，init_paddleocr失敗時直接使用PaddleOCR類創建
+    
+    參數:
+        use_angle_cls (bool): 是否啟用方向分類
+        lang (str): 識別語言
+    
+    返回:
+        PaddleOCR: OCR實例
+    """
+    ocr = init_paddleocr(use_angle_cls=use_angle_cls, lang=lang)
+    if ocr is None:
+        # 如果初始化失敗，嘗試直接導入PaddleOCR
+        from paddleocr import PaddleOCR
+        ocr = PaddleOCR(use_angle_cls=use_angle_cls, lang=lang)
+    return ocr
+
+class PaddleOCRPool:
+    """PaddleOCR模型池
+    
+    模型在首次借出時按需創建，最多創建max_size個（未設置時等於同時借用的線程數）；之後借出的都是已載入的模型，
+    歸還後供下一個文件重用。所有模型都在使用中時，借出操作會等待其他線程歸還。
+    """
+    
+    def __init__(self, max_size=None, use_angle_cls=True, lang="ch"):
+        """
+        參數:
+            max_size (int): 最多載入的模型數量，None表示不限制
+            use_angle_cls (bool): 是否啟用方向分類
+            lang (str): 識別語言
+        """
+        self.max_size = max(1, max_size) if max_size else None
+        self.use_angle_cls = use_angle_cls
+        self.lang = lang
+        self._idle = []
+        self._created = 0
+        self._condition = threading.Condition()
+        
+        # 統計數據
+        self.load_seconds = 0.0
+        self.checkouts = 0
+        self.reuses = 0
+        self.wait_seconds = 0.0
+    
+    def preload(self, count=1):
+        """預先載入模型，避免第一個文件承擔載入時間
+        
+        參數:
+            count (int): 要載入的模型數量，不超過max_size
+        """
+        for _ in range(count):
+            with self._condition:
+                if self._is_full():
+                    return
+                self._created += 1
+                index = self._created
+            instance = self._create(index)
+            with self._condition:
+                if instance is None:
+                    self._created -= 1
+                else:
+                    self._idle.append(instance)
+                self._condition.notify()
+    
+    def _is_full(self):
+        """是否已達到模型數量上限（調用者需持有鎖）"""
+        return self.max_size is not None and self._created >= self.max_size
+    
+    def _create(self, index):
+        """載入一個新模型並記錄載入時間，失敗時返回None
+        
+        參數:
+            index (int): 模型序號，僅用於日誌
+        """
+        start_time = time.time()
+        try:
+            instance = create_paddleocr(use_angle_cls=self.use_angle_cls, lang=self.lang)
+        except Exception as e:
+            log_message(f"創建PaddleOCR實例時出錯: {e}", level='警告')
+            return None
+        elapsed = time.time() - start_time
+        with self._condition:
+            self.load_seconds += elapsed
+        log_message(f"已載入PaddleOCR模型（第{index}個，耗時{elapsed:.2f}秒）", level='信息')
+        return instance
+    
+    def checkout(self, timeout=None):
+        """借出一個OCR模型
+        
+        參數:
+            timeout (float): 等待其他線程歸還模型的最長秒數，None表示一直等待
+        
+        返回:
+            PaddleOCR or None: OCR實例；載入失敗或等待超時時返回None
+        """
+        start_time = time.time()
+        with self._condition:
+            while not self._idle and self._is_full():
+                remaining = None if timeout is None else timeout - (time.time() - start_time)
+                if remaining is not None and remaining <= 0:
+                    log_message("等待可用的PaddleOCR模型超時", level='警告')
+                    return None
+                self._condition.wait(remaining)
+            self.wait_seconds += time.time() - start_time
+            if self._idle:
+                self.checkouts += 1
+                self.reuses += 1
+                return self._idle.pop()
+            # 在鎖外載入模型，其他線程可以同時歸還或借出
+            self._created += 1
+            index = self._created
+        
+        instance = self._create(index)
+        with self._condition:
+            if instance is None:
+                self._created -= 1
+                self._condition.notify()
+            else:
+                self.checkouts += 1
+        return instance
+    
+    def checkin(self, instance):
+        """歸還借出的OCR模型
+        
+        參數:
+            instance (PaddleOCR): checkout返回的實例
+        """
+        if instance is None:
+            return
+        with self._condition:
+            self._idle.append(instance)
+            self._condition.notify()
+    
+    @contextmanager
+    def borrow(self, timeout=None):
+        """借出模型並在離開with區塊時自動歸還
+        
+        參數:
+            timeout (float): 同checkout
+        
+        產出:
+            PaddleOCR or None: OCR實例
+        """
+        instance = self.checkout(timeout)
+        try:
+            yield instance
+        finally:
+            self.checkin(instance)
+    
+    def get_stats(self):
+        """獲取模型池統計數據
+        
+        返回:
+            dict: 包含models、load_seconds、checkouts、reuses和wait_seconds的字典
+        """
+        with self._condition:
+            return {
+                'models': self._created,
+                'load_seconds': self.load_seconds,
+                'checkouts': self.checkouts,
+                'reuses': self.reuses,
+                'wait_seconds': self.wait_seconds
+            }
+    
+    def log_stats(self):
+        """將模型池統計數據寫入日誌"""
+        stats = self.get_stats()
+        if stats['checkouts'] == 0:
+            return
+        log_message(
+            f"PaddleOCR模型池: 載入{stats['models']}個模型，共耗時{stats['load_seconds']:.2f}秒；"
+            f"借出{stats['checkouts']}次，其中重用{stats['reuses']}次；等待模型共{stats['wait_seconds']:.2f}秒",
+            level='信息'
+        )
+
+def configure_ocr_pool(max_size=None):
+    """設置OCR模型池的最大模型數量，已創建的模型池會被替換
+    
+    參數:
+        max_size (int): 最多載入的模型數量，None表示不限制
+    """
+    global _ocr_pool, ocr_pool_max_size
+    with _ocr_pool_lock:
+        ocr_pool_max_size = max_size
+        if _ocr_pool is not None and _ocr_pool.max_size != (max(1, max_size) if max_size else None):
+            _ocr_pool = None
+
+def get_ocr_pool(lang="ch"):
+    """獲取當前進程共用的OCR模型池
+    
+    參數:
+        lang (str): 識別語言
+    
+    返回:
+        PaddleOCRPool: 模型池
+    """
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            _ocr_pool = PaddleOCRPool(max_size=ocr_pool_max_size, use_angle_cls=True, lang=lang)
+        return _ocr_pool
+
+def shutdown_ocr_pool():
+    """記錄模型池統計數據並釋放所有模型"""
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is not None:
+            _ocr_pool.log_stats()
+            _ocr_pool = None
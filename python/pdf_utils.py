@@ -3,10 +3,273 @@ import gc
 import time
 import sys
 import re
+import queue
+import threading
 import importlib.util
+from contextlib import nullcontext
 from log_utils import log_message
 
-def extract_text_from_pdf(pdf_path, has_fitz=False, has_pypdf2=False, has_paddleocr=False, force_ocr=False, remove_whitespace=False, save_txt=False, output_txt_path=None, ocr_instance=None, preview_mode=False):
+# OCR渲染設置
+OCR_DPI = 300  # 頁面渲染的最高解析度
+OCR_MIN_DPI = 200  # 按嵌入圖像解析度降低渲染解析度時的下限
+OCR_MAX_PIXELS = 2480 * 3508  # 單頁圖像最多像素數（A4紙300dpi），大幅面頁面會相應降低解析度
+OCR_FAST_DPI = 0  # 快速首輪識別的解析度，0表示不使用快速首輪
+OCR_CONFIDENCE_THRESHOLD = 0.8  # 頁面平均置信度低於此值時以較高解析度或彩色重新識別
+OCR_LANG = "ch"  # PaddleOCR識別語言
+OCR_BATCH_SIZE = 1  # 每批送入OCR的頁數
+OCR_BATCH_MEMORY_BYTES = 256 * 1024 * 1024  # 預先渲染的頁面圖像最多佔用的內存
+OCR_PIPELINE_DEPTH = 2  # 渲染和OCR階段之間最多排隊的批次數，0表示不使用流水線
+SPLIT_WORKERS = 1  # 分割PDF時並行輸出的進程數，1表示在當前進程中依次輸出，0表示使用CPU核心數
+PYPDF2_ENCRYPT_MAX_BYTES = 20 * 1024 * 1024  # PyPDF2逐頁複製加密比pikepdf慢幾個數量級，超過此大小的文件不使用，0表示不限制
+OCR_HYBRID_MIN_TEXT_CHARS = 20  # 文字層少於此字數的頁面才考慮OCR
+OCR_HYBRID_MIN_IMAGE_COVERAGE = 0.3  # 圖像覆蓋頁面比例達到此值的頁面才OCR
+
+def configure_ocr_batch(batch_size=None, memory_budget_mb=None):
+    """設置批量OCR
+    
+    參數:
+        batch_size (int): 每批送入OCR的頁數，1表示逐頁識別
+        memory_budget_mb (int): 預先渲染的頁面圖像最多佔用的內存（MB）
+    """
+    global OCR_BATCH_SIZE, OCR_BATCH_MEMORY_BYTES
+    if batch_size is not None:
+        OCR_BATCH_SIZE = max(1, batch_size)
+    if memory_budget_mb is not None:
+        OCR_BATCH_MEMORY_BYTES = max(1, memory_budget_mb) * 1024 * 1024
+
+def configure_ocr_resolution(max_dpi=None, min_dpi=None, max_megapixels=None, fast_dpi=None, confidence_threshold=None):
+    """設置OCR渲染解析度策略
+    
+    參數:
+        max_dpi (int): 頁面渲染的最高解析度
+        min_dpi (int): 按嵌入圖像解析度降低渲染解析度時的下限
+        max_megapixels (float): 單頁圖像最多像素數（百萬）
+        fast_dpi (int): 快速首輪識別的解析度，0表示不使用快速首輪
+        confidence_threshold (float): 觸發重新識別的頁面平均置信度
+    """
+    global OCR_DPI, OCR_MIN_DPI, OCR_MAX_PIXELS, OCR_FAST_DPI, OCR_CONFIDENCE_THRESHOLD
+    if max_dpi is not None:
+        OCR_DPI = max(72, max_dpi)
+    if min_dpi is not None:
+        OCR_MIN_DPI = max(72, min_dpi)
+    if max_megapixels is not None:
+        OCR_MAX_PIXELS = int(max_megapixels * 1000000)
+    if fast_dpi is not None:
+        OCR_FAST_DPI = max(0, fast_dpi)
+    if confidence_threshold is not None:
+        OCR_CONFIDENCE_THRESHOLD = confidence_threshold
+
+def get_ocr_resolution_settings():
+    """
+    返回:
+        dict: 當前的OCR渲染解析度設置，可直接傳給configure_ocr_resolution
+    """
+    return {
+        'max_dpi': OCR_DPI,
+        'min_dpi': OCR_MIN_DPI,
+        'max_megapixels': OCR_MAX_PIXELS / 1000000,
+        'fast_dpi': OCR_FAST_DPI,
+        'confidence_threshold': OCR_CONFIDENCE_THRESHOLD
+    }
+
+def configure_ocr_pipeline(queue_depth=None):
+    """設置OCR流水線
+    
+    參數:
+        queue_depth (int): 渲染和OCR階段之間最多排隊的批次數，0表示在同一線程中依次渲染和識別
+    """
+    global OCR_PIPELINE_DEPTH
+    if queue_depth is not None:
+        OCR_PIPELINE_DEPTH = max(0, queue_depth)
+
+def configure_page_classifier(min_text_chars=None, min_image_coverage=None):
+    """設置逐頁判斷使用文字層或OCR的條件
+    
+    參數:
+        min_text_chars (int): 文字層少於此字數（不含空白）的頁面才考慮OCR
+        min_image_coverage (float): 圖像覆蓋頁面比例（0到1）達到此值的頁面才OCR
+    """
+    global OCR_HYBRID_MIN_TEXT_CHARS, OCR_HYBRID_MIN_IMAGE_COVERAGE
+    if min_text_chars is not None:
+        OCR_HYBRID_MIN_TEXT_CHARS = max(0, min_text_chars)
+    if min_image_coverage is not None:
+        OCR_HYBRID_MIN_IMAGE_COVERAGE = min(1.0, max(0.0, min_image_coverage))
+
+def get_page_classifier_settings():
+    """
+    返回:
+        dict: 當前的逐頁判斷設置，可直接傳給configure_page_classifier
+    """
+    return {
+        'min_text_chars': OCR_HYBRID_MIN_TEXT_CHARS,
+        'min_image_coverage': OCR_HYBRID_MIN_IMAGE_COVERAGE
+    }
+
+class PipelineStageStats:
+    """流水線單個階段的統計數據，可由多個線程同時更新"""
+    
+    def __init__(self, name):
+        """
+        參數:
+            name (str): 階段名稱
+        """
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.idle_seconds = 0.0
+        self.lock = threading.Lock()
+    
+    def record(self, items=0, busy=0.0, idle=0.0):
+        """累加處理的頁數、忙碌時間和等待時間（秒）"""
+        with self.lock:
+            self.items += items
+            self.busy_seconds += busy
+            self.idle_seconds += idle
+    
+    def snapshot(self):
+        """
+        返回:
+            dict: 包含items、busy_seconds、idle_seconds和throughput（頁/忙碌秒）的字典
+        """
+        with self.lock:
+            return {
+                'items': self.items,
+                'busy_seconds': self.busy_seconds,
+                'idle_seconds': self.idle_seconds,
+                'throughput': self.items / self.busy_seconds if self.busy_seconds else 0.0
+            }
+    
+    def reset(self):
+        """清零統計數據"""
+        with self.lock:
+            self.items = 0
+            self.busy_seconds = 0.0
+            self.idle_seconds = 0.0
+
+# 各流水線階段的統計數據：render渲染頁面，ocr識別文字，match消費文本並匹配規則
+pipeline_stats = {name: PipelineStageStats(name) for name in ('render', 'ocr', 'match')}
+PIPELINE_STAGE_NAMES = {'render': '渲染', 'ocr': 'OCR', 'match': '匹配'}
+
+def get_pipeline_stats(reset=False):
+    """獲取所有流水線階段的統計數據
+    
+    參數:
+        reset (bool): 讀取後是否清零
+    
+    返回:
+        dict: 階段名稱到統計字典的映射
+    """
+    result = {}
+    for name, stats in pipeline_stats.items():
+        result[name] = stats.snapshot()
+        if reset:
+            stats.reset()
+    return result
+
+def merge_pipeline_stats(snapshot):
+    """將其他進程返回的流水線統計數據累加到本進程
+    
+    參數:
+        snapshot (dict): get_pipeline_stats返回的字典
+    """
+    for name, values in (snapshot or {}).items():
+        if name in pipeline_stats:
+            pipeline_stats[name].record(values['items'], values['busy_seconds'], values['idle_seconds'])
+
+# 各提取方式處理的頁數：text文字層，ocr識別，pypdf2備用提取，cache從緩存讀取
+page_path_counts = {'text': 0, 'ocr': 0, 'pypdf2': 0, 'cache': 0}
+PAGE_PATH_NAMES = {'text': '文字層', 'ocr': 'OCR', 'pypdf2': 'PyPDF2', 'cache': '緩存'}
+_page_path_lock = threading.Lock()
+
+def count_page_path(path, count=1):
+    """記錄以某種方式提取的頁數
+    
+    參數:
+        path (str): 'text'、'ocr'、'pypdf2'或'cache'
+        count (int): 頁數
+    """
+    with _page_path_lock:
+        page_path_counts[path] = page_path_counts.get(path, 0) + count
+
+def get_extraction_stats(reset=False):
+    """獲取流水線和各提取方式的統計數據
+    
+    參數:
+        reset (bool): 讀取後是否清零
+    
+    返回:
+        dict: {'pipeline': get_pipeline_stats的結果, 'page_paths': 各提取方式的頁數}
+    """
+    with _page_path_lock:
+        page_paths = dict(page_path_counts)
+        if reset:
+            for path in page_path_counts:
+                page_path_counts[path] = 0
+    return {'pipeline': get_pipeline_stats(reset), 'page_paths': page_paths}
+
+def merge_extraction_stats(snapshot):
+    """將其他進程返回的統計數據累加到本進程
+    
+    參數:
+        snapshot (dict): get_extraction_stats返回的字典
+    """
+    if not snapshot:
+        return
+    merge_pipeline_stats(snapshot.get('pipeline'))
+    for path, count in (snapshot.get('page_paths') or {}).items():
+        if count:
+            count_page_path(path, count)
+
+def format_page_path_stats():
+    """
+    返回:
+        str: 各提取方式的頁數，例如「文字層 12頁，OCR 3頁」；沒有提取任何頁面時為空字符串
+    """
+    with _page_path_lock:
+        counts = dict(page_path_counts)
+    return "，".join(f"{PAGE_PATH_NAMES.get(path, path)} {count}頁" for path, count in counts.items() if count)
+
+def log_pipeline_stats():
+    """將流水線各階段的統計數據寫入日誌"""
+    for name, values in get_pipeline_stats().items():
+        if values['items'] == 0:
+            continue
+        log_message(
+            f"OCR流水線{PIPELINE_STAGE_NAMES[name]}階段: {values['items']}頁，"
+            f"忙碌{values['busy_seconds']:.2f}秒，空閒{values['idle_seconds']:.2f}秒，"
+            f"{values['throughput']:.2f}頁/秒",
+            level='信息'
+        )
+
+class ExtractionStatus:
+    """記錄一次文本提取是否完整
+    
+    提取函數遇到PyMuPDF、PyPDF2或OCR的錯誤時只打印錯誤並停止產出，調用者無法從產出的頁面
+    分辨完整讀取和中途出錯；提供此對象時錯誤會記錄在這裡，不完整的結果不會被當作文件的完整內容緩存。
+    渲染和OCR線程也會記錄錯誤，list.append本身是線程安全的。
+    """
+    
+    def __init__(self):
+        self.errors = []
+    
+    def fail(self, message):
+        """記錄一個錯誤並打印"""
+        print(message)
+        self.errors.append(message)
+    
+    @property
+    def ok(self):
+        """提取過程中沒有出錯"""
+        return not self.errors
+
+def _extraction_error(status, message):
+    """打印提取錯誤，提供ExtractionStatus時同時記錄"""
+    if status is not None:
+        status.fail(message)
+    else:
+        print(message)
+
+def extract_text_from_pdf(pdf_path, has_fitz=False, has_pypdf2=False, has_paddleocr=False, force_ocr=False, remove_whitespace=False, save_txt=False, output_txt_path=None, ocr_instance=None, preview_mode=False, region_plan=None):
     """從PDF文件中提取文本
     
     參數:
@@ -20,53 +283,211 @@ def extract_text_from_pdf(pdf_path, has_fitz=False, has_pypdf2=False, has_paddle
         output_txt_path (str): OCR結果保存路徑，如果為None則使用原始檔名
         ocr_instance (PaddleOCR): 可選的PaddleOCR實例，如果提供則使用此實例
         preview_mode (bool): 是否為預覽模式，預覽模式下不保存TXT文件
+        region_plan (RegionPlan): 可選的OCR區域方案，OCR時只識別其中的頁面和區域
         
     返回:
         str: 提取的文本
     """
-    text = ""
+    return "".join(iter_text_from_pdf(pdf_path, has_fitz, has_pypdf2, has_paddleocr, force_ocr, remove_whitespace, save_txt, output_txt_path, ocr_instance, preview_mode, region_plan))
+
+def iter_text_from_pdf(pdf_path, has_fitz=False, has_pypdf2=False, has_paddleocr=False, force_ocr=False, remove_whitespace=False, save_txt=False, output_txt_path=None, ocr_instance=None, preview_mode=False, region_plan=None, doc=None, status=None):
+    """逐頁從PDF文件中提取文本的生成器
     
+    參數與extract_text_from_pdf相同。每處理完一頁就產出該頁的文本，將所有產出串接起來
+    即為extract_text_from_pdf的結果。調用者可以隨時停止迭代，之後的頁面（包括OCR）
+    就不會再被讀取。提供doc（已打開的PyMuPDF文檔）時文字層直接從該文檔讀取，不再重新打開文件，
+    文檔由調用者負責關閉。提供status（ExtractionStatus）時，提取過程中吞下的錯誤記錄在其中。
+    
+    產出:
+        str: 單頁的文本（OCR結果帶有「===== 第N頁 =====」分隔行）
+    """
     # 如果強制使用OCR且有PaddleOCR，則直接使用OCR
     if force_ocr and has_paddleocr and has_fitz:
-        return extract_text_with_paddleocr(pdf_path, remove_whitespace, save_txt, output_txt_path, ocr_instance, preview_mode)
+        for page_text in iter_text_with_paddleocr(pdf_path, remove_whitespace, save_txt, output_txt_path, ocr_instance, preview_mode, region_plan=region_plan, status=status):
+            count_page_path('ocr')
+            yield page_text
+        return
+    
+    found_text = False
     
     # 嘗試使用PyMuPDF提取文本
+    # 有PaddleOCR時逐頁判斷：有文字層的頁面直接使用文字層，只有圖像的頁面才OCR，結果按頁碼順序產出
     if has_fitz:
+        ocr = ocr_instance
+        ocr_pool = None
+        
+        def ocr_run_pages(run):
+            """用共用的文檔句柄識別一段連續的只有圖像的頁面，OCR模型在第一次需要時借出，整個文件共用"""
+            nonlocal ocr, ocr_pool, found_text
+            if ocr is None:
+                from paddle_utils import get_ocr_pool
+                ocr_pool = get_ocr_pool(lang=OCR_LANG)
+                ocr = ocr_pool.checkout()
+                if ocr is None:
+                    _extraction_error(status, "無法獲取PaddleOCR實例")
+                    return
+            found_text = True
+            for _, ocr_text in _iter_ocr_document(pdf_path, ocr, None, remove_whitespace, region_plan, set(run), status, doc=doc):
+                count_page_path('ocr')
+                yield ocr_text
+        
         try:
             import fitz
-            with fitz.open(pdf_path) as doc:
-                for page in doc:
-                    text += page.get_text()
-            # 如果提取到文本且不強制使用OCR，則返回
-            if text and not force_ocr:
-                return text
+            with (nullcontext(doc) if doc is not None else fitz.open(pdf_path)) as doc:
+                # 連續的只有圖像的頁面累積成一段，讀到有文字層的頁面、累積到可以填滿OCR流水線的頁數或讀完文件時才識別，
+                # 每一頁在讀到時（或所在的一段識別完時）立即產出，調用者停止迭代後不再讀取或識別後續頁面
+                run_limit = max(1, OCR_BATCH_SIZE) * max(1, OCR_PIPELINE_DEPTH)
+                ocr_run = []
+                announced = False
+                for page_num in range(len(doc)):
+                    page = doc[page_num]
+                    page_text = page.get_text()
+                    needs_ocr = has_paddleocr and classify_page(page, page_text) == 'ocr'
+                    if needs_ocr:
+                        if not announced:
+                            print(f"{os.path.basename(pdf_path)}: 第{page_num + 1}頁起出現只有圖像的頁面，這些頁面將使用OCR識別")
+                            announced = True
+                        ocr_run.append(page_num)
+                    if ocr_run and (not needs_ocr or len(ocr_run) >= run_limit):
+                        yield from ocr_run_pages(ocr_run)
+                        ocr_run = []
+                    if not needs_ocr and page_text:
+                        found_text = True
+                        count_page_path('text')
+                        yield page_text
+                if ocr_run:
+                    yield from ocr_run_pages(ocr_run)
         except Exception as e:
-            print(f"使用PyMuPDF提取文本時出錯: {e}")
+            _extraction_error(status, f"使用PyMuPDF提取文本時出錯: {e}")
+        finally:
+            # 歸還借出的OCR模型
+            if ocr_pool is not None and ocr is not None:
+                ocr_pool.checkin(ocr)
+        # 如果提取到文本，則不再嘗試其他方法
+        if found_text:
+            return
     
     # 嘗試使用PyPDF2提取文本
-    if has_pypdf2 and not text and not force_ocr:
+    if has_pypdf2 and not force_ocr:
         try:
             from PyPDF2 import PdfReader
             reader = PdfReader(pdf_path)
             for page in reader.pages:
                 page_text = page.extract_text()
                 if page_text:
-                    text += page_text
-            # 如果提取到文本且不強制使用OCR，則返回
-            if text and not force_ocr:
-                return text
+                    found_text = True
+                    count_page_path('pypdf2')
+                    yield page_text
         except Exception as e:
-            print(f"使用PyPDF2提取文本時出錯: {e}")
+            _extraction_error(status, f"使用PyPDF2提取文本時出錯: {e}")
+        # 如果提取到文本，則不再使用OCR
+        if found_text:
+            return
+    
+    # 如果沒有提取到文本，且有PaddleOCR，則使用OCR
+    if has_paddleocr:
+        for page_text in iter_text_with_paddleocr(pdf_path, remove_whitespace, save_txt, output_txt_path, ocr_instance, preview_mode, region_plan=region_plan, status=status):
+            count_page_path('ocr')
+            yield page_text
+
+def iter_page_texts(doc, has_paddleocr=False, force_ocr=False, remove_whitespace=False, ocr_instance=None, region_plan=None):
+    """逐頁提取已打開文檔的文本，每一頁都產出一次（包括沒有文本的頁面），頁索引與文檔一致
+    
+    與iter_text_from_pdf的文字層和OCR選擇相同：強制OCR時識別每一頁，否則使用文字層，
+    有PaddleOCR時只識別只有圖像的頁面。需要OCR的頁面在讀到時立即識別，不必預先讀完整個文件，
+    適合在同一次讀取中同時處理頁面（如邊讀取邊切割）。
+    
+    參數:
+        doc (fitz.Document): 已打開的PDF文件
+        has_paddleocr (bool): 是否有PaddleOCR
+        force_ocr (bool): 是否強制使用OCR
+        remove_whitespace (bool): 是否去除OCR結果中的空白
+        ocr_instance (PaddleOCR): 可選的PaddleOCR實例，否則在第一個需要OCR的頁面從模型池借出
+        region_plan: 可選的OCR區域方案，提供page_clip(頁索引)
+    
+    產出:
+        tuple: (頁索引, 單頁文本)，OCR頁面的文本帶有「===== 第N頁 =====」分隔行
+    """
+    ocr = ocr_instance
+    ocr_pool = None
+    rerender = lambda page_num, dpi, colorspace, clip: render_page_pixmap(doc[page_num], dpi, colorspace, clip)
+    try:
+        for page_num in range(len(doc)):
+            page = doc[page_num]
+            page_text = "" if force_ocr and has_paddleocr else page.get_text()
+            if has_paddleocr and (force_ocr or classify_page(page, page_text) == 'ocr'):
+                clip = region_plan.page_clip(page_num) if region_plan is not None else (0.0, 0.0, 1.0, 1.0)
+                if clip is not None:
+                    if ocr is None:
+                        from paddle_utils import get_ocr_pool
+                        ocr_pool = get_ocr_pool(lang=OCR_LANG)
+                        ocr = ocr_pool.checkout()
+                    if ocr is not None:
+                        if clip == (0.0, 0.0, 1.0, 1.0):
+                            clip = None
+                        dpi, colorspace, retry_plan = plan_page_render(page, clip)
+                        pix = render_page_pixmap(page, dpi, colorspace, clip)
+                        _, page_text = next(_ocr_pending_pages(ocr, [(page_num, pix, pixmap_to_ndarray(pix), retry_plan)], remove_whitespace, rerender))
+                        del pix
+                        count_page_path('ocr')
+                        yield page_num, page_text
+                        continue
+            if page_text:
+                count_page_path('text')
+            yield page_num, page_text
+    finally:
+        # 歸還借出的OCR模型
+        if ocr_pool is not None and ocr is not None:
+            ocr_pool.checkin(ocr)
+
+def page_image_coverage(page):
+    """計算嵌入圖像覆蓋頁面的比例
+    
+    參數:
+        page (fitz.Page): PDF頁面
+    
+    返回:
+        float: 0到1之間的比例，重疊的圖像會重複計算但結果不超過1
+    """
+    rect = page.rect
+    page_area = rect.width * rect.height
+    if page_area <= 0:
+        return 0.0
+    covered = 0.0
+    try:
+        for info in page.get_image_info():
+            x0, y0, x1, y1 = info['bbox']
+            width = min(x1, rect.x1) - max(x0, rect.x0)
+            height = min(y1, rect.y1) - max(y0, rect.y0)
+            if width > 0 and height > 0:
+                covered += width * height
+    except Exception:
+        return 0.0
+    return min(1.0, covered / page_area)
+
+def classify_page(page, page_text=None):
+    """判斷頁面應使用文字層還是OCR
+    
+    文字層字數（不含空白）達到OCR_HYBRID_MIN_TEXT_CHARS的頁面使用文字層；字數不足且
+    圖像覆蓋比例達到OCR_HYBRID_MIN_IMAGE_COVERAGE的頁面（掃描頁）使用OCR；其餘頁面
+    （空白頁、只有少量文字的頁面）使用文字層。
     
-    # 如果沒有提取到文本或強制使用OCR，且有PaddleOCR，則使用OCR
-    if has_paddleocr and (not text or force_ocr):
-        ocr_text = extract_text_with_paddleocr(pdf_path, remove_whitespace, save_txt, output_txt_path, ocr_instance, preview_mode)
-        if ocr_text:
-            return ocr_text
+    參數:
+        page (fitz.Page): PDF頁面
+        page_text (str): 已提取的文字層文本，None表示由此函數提取
     
-    return text
+    返回:
+        str: 'text'或'ocr'
+    """
+    if page_text is None:
+        page_text = page.get_text()
+    if len("".join(page_text.split())) >= OCR_HYBRID_MIN_TEXT_CHARS:
+        return 'text'
+    if page_image_coverage(page) >= OCR_HYBRID_MIN_IMAGE_COVERAGE:
+        return 'ocr'
+    return 'text'
 
-def extract_text_with_paddleocr(pdf_path, remove_whitespace=False, save_txt=False, output_txt_path=None, ocr_instance=None, preview_mode=False):
+def extract_text_with_paddleocr(pdf_path, remove_whitespace=False, save_txt=False, output_txt_path=None, ocr_instance=None, preview_mode=False, batch_size=None, region_plan=None):
     """使用PaddleOCR從PDF提取文本
     
     參數:
@@ -76,109 +497,827 @@ def extract_text_with_paddleocr(pdf_path, remove_whitespace=False, save_txt=Fals
         output_txt_path (str): OCR結果保存路徑，如果為None則使用原始檔名
         ocr_instance (PaddleOCR): 可選的PaddleOCR實例，如果提供則使用此實例
         preview_mode (bool): 是否為預覽模式，預覽模式下不保存TXT文件
+        batch_size (int): 每批送入OCR的頁數，None表示使用OCR_BATCH_SIZE
+        region_plan (RegionPlan): 可選的OCR區域方案，只渲染和識別其中的頁面和區域，None表示全部頁面的整頁
         
     返回:
         str: 提取的文本
     """
+    # 不再在此處保存OCR結果，而是返回OCR文本，由調用者決定如何處理
+    # save_txt參數保留以保持向後兼容性
+    return "".join(iter_text_with_paddleocr(pdf_path, remove_whitespace, save_txt, output_txt_path, ocr_instance, preview_mode, batch_size, region_plan))
+
+def iter_text_with_paddleocr(pdf_path, remove_whitespace=False, save_txt=False, output_txt_path=None, ocr_instance=None, preview_mode=False, batch_size=None, region_plan=None, status=None):
+    """使用PaddleOCR逐頁從PDF提取文本的生成器
+    
+    參數與extract_text_with_paddleocr相同。batch_size大於1時，會預先渲染最多batch_size頁
+    （總大小不超過OCR_BATCH_MEMORY_BYTES）並一起送入OCR，識別完一批後按頁碼順序產出。
+    提供region_plan時，不在任何規則頁碼範圍內的頁面不產出，其餘頁面只渲染規則區域的外接矩形。
+    停止迭代後不會再渲染或識別後續頁面。提供status（ExtractionStatus）時記錄渲染和識別中的錯誤。
+    
+    產出:
+        str: 帶有「===== 第N頁 =====」分隔行的單頁OCR文本
+    """
+    for _, page_text in _iter_ocr_document(pdf_path, ocr_instance, batch_size, remove_whitespace, region_plan, status=status):
+        yield page_text
+
+def _iter_ocr_document(pdf_path, ocr_instance=None, batch_size=None, remove_whitespace=False, region_plan=None, pages=None, status=None, doc=None):
+    """使用PaddleOCR識別文件的頁面，按頁碼順序產出(頁索引, 帶分隔行的文本)
+    
+    提供doc（已打開的PyMuPDF文檔）時直接識別該文檔的頁面，不再重新打開文件，文檔由調用者負責關閉；
+    迭代期間調用者不能同時使用該文檔（流水線的渲染線程會訪問它）。
+    
+    參數:
+        pdf_path (str): PDF文件路徑
+        ocr_instance (PaddleOCR): 可選的PaddleOCR實例，否則從模型池借出
+        batch_size (int): 每批送入OCR的頁數，None表示使用OCR_BATCH_SIZE
+        remove_whitespace (bool): 是否去除OCR結果中的空白
+        region_plan (RegionPlan): 可選的OCR區域方案
+        pages (set): 只識別這些頁索引，None表示全部頁面
+        status (ExtractionStatus): 可選的提取狀態，記錄渲染和識別中的錯誤
+        doc (fitz.Document): 可選的已打開文檔
+    
+    產出:
+        tuple: (頁索引, 帶有「===== 第N頁 =====」分隔行的單頁OCR文本)
+    """
     try:
         import fitz
-        import os
-        import tempfile
-        import numpy as np
-        from PIL import Image
         
-        # 使用提供的OCR實例或通過paddle_utils創建新的實例
+        # 使用提供的OCR實例，否則從共用的模型池借出一個
+        ocr_pool = None
         if ocr_instance:
             ocr = ocr_instance
         else:
-            # 導入自定義的paddle_utils模塊來初始化PaddleOCR
-            try:
-                from paddle_utils import init_paddleocr
-                ocr = init_paddleocr(use_angle_cls=True, lang="ch")
-                if ocr is None:
-                    # 如果初始化失敗，嘗試直接導入PaddleOCR
-                    from paddleocr import PaddleOCR
-                    ocr = PaddleOCR(use_angle_cls=True, lang="ch")
-            except ImportError:
-                # 如果paddle_utils不可用，直接導入PaddleOCR
-                from paddleocr import PaddleOCR
-                ocr = PaddleOCR(use_angle_cls=True, lang="ch")
-        ocr_text = ""
+            from paddle_utils import get_ocr_pool
+            ocr_pool = get_ocr_pool(lang=OCR_LANG)
+            ocr = ocr_pool.checkout()
+            if ocr is None:
+                _extraction_error(status, "無法獲取PaddleOCR實例")
+                return
         
-        # 創建臨時目錄用於存儲圖片
-        temp_dir = tempfile.mkdtemp()
+        batch_size = max(1, batch_size or OCR_BATCH_SIZE)
+        try:
+            # 打開PDF文件（已提供文檔時直接使用）
+            with (nullcontext(doc) if doc is not None else fitz.open(pdf_path)) as doc:
+                if pages is None:
+                    print(f"使用PaddleOCR處理PDF: {os.path.basename(pdf_path)}，共{len(doc)}頁")
+                
+                if OCR_PIPELINE_DEPTH > 0:
+                    # 渲染和OCR在各自的線程中進行，本線程只消費識別出的文本
+                    yield from _iter_ocr_pipeline(doc, ocr, batch_size, remove_whitespace, OCR_PIPELINE_DEPTH, region_plan, pages, status)
+                    return
+                
+                # 已渲染、等待識別的頁面：(頁碼, 像素圖, 圖像數組, 重新識別方案)
+                # 頁面按plan_page_render選擇的解析度渲染，直接在內存中交給OCR，不經過臨時PNG文件
+                # 像素圖必須在OCR完成前保持存活，圖像數組直接引用它的像素緩衝區
+                pending = []
+                pending_bytes = 0
+                rerender = lambda page_num, dpi, colorspace, clip: render_page_pixmap(doc[page_num], dpi, colorspace, clip)
+                for page_num, page, clip in _iter_ocr_pages(doc, region_plan, pages):
+                    dpi, colorspace, retry_plan = plan_page_render(page, clip)
+                    pix = render_page_pixmap(page, dpi, colorspace, clip)
+                    pending.append((page_num, pix, pixmap_to_ndarray(pix), retry_plan))
+                    pending_bytes += pix.stride * pix.height
+                    if len(pending) >= batch_size or pending_bytes >= OCR_BATCH_MEMORY_BYTES:
+                        yield from _ocr_pending_pages(ocr, pending, remove_whitespace, rerender, status)
+                        pending = []
+                        pending_bytes = 0
+                if pending:
+                    yield from _ocr_pending_pages(ocr, pending, remove_whitespace, rerender, status)
+        finally:
+            # 歸還借出的OCR模型
+            if ocr_pool is not None:
+                ocr_pool.checkin(ocr)
+    except Exception as e:
+        _extraction_error(status, f"使用PaddleOCR提取文本時出錯: {e}")
+        return
+
+# 流水線階段結束的標記
+_PIPELINE_END = object()
+
+def _iter_ocr_pages(doc, region_plan=None, pages=None):
+    """列出需要OCR的頁面
+    
+    參數:
+        doc (fitz.Document): 已打開的PDF文件
+        region_plan (RegionPlan): 可選的OCR區域方案
+        pages (set): 只列出這些頁索引，None表示全部頁面
+    
+    產出:
+        tuple: (頁索引, 頁面, 比例裁剪區域或None)
+    """
+    page_count = len(doc)
+    if region_plan is not None:
+        last_page = region_plan.last_page()
+        if last_page is not None:
+            page_count = min(page_count, last_page)
+    if pages is not None and pages:
+        page_count = min(page_count, max(pages) + 1)
+    for page_num in range(page_count):
+        if pages is not None and page_num not in pages:
+            continue
+        clip = None
+        if region_plan is not None:
+            clip = region_plan.page_clip(page_num)
+            if clip is None:
+                continue
+            if clip == (0.0, 0.0, 1.0, 1.0):
+                clip = None
+        yield page_num, doc[page_num], clip
+
+def _iter_ocr_pipeline(doc, ocr, batch_size, remove_whitespace, queue_depth, region_plan=None, pages=None, status=None):
+    """以流水線方式識別文件的所有頁面
+    
+    渲染線程將頁面按批渲染後放入有界隊列，OCR線程從隊列取出識別，識別出的文本放入
+    另一個有界隊列，由調用者（匹配階段）逐頁消費。渲染第k+1批時可以同時識別第k批，
+    隊列長度限制了預先渲染的圖像佔用的內存。調用者停止迭代時兩個線程也會隨即停止。
+    
+    參數:
+        doc (fitz.Document): 已打開的PDF文件，流水線運行期間只由渲染線程訪問
+        ocr (PaddleOCR): OCR實例，只由OCR線程使用
+        batch_size (int): 每批頁數
+        remove_whitespace (bool): 是否去除OCR結果中的空白
+        queue_depth (int): 渲染隊列最多排隊的批次數
+        region_plan (RegionPlan): 可選的OCR區域方案
+        pages (set): 只識別這些頁索引，None表示全部頁面
+        status (ExtractionStatus): 可選的提取狀態，記錄渲染和識別線程中的錯誤
+    
+    產出:
+        tuple: (頁索引, 帶有「===== 第N頁 =====」分隔行的單頁OCR文本)
+    """
+    stop_event = threading.Event()
+    # 低置信度頁面由OCR線程重新渲染，與渲染線程共用文件時需要加鎖
+    doc_lock = threading.Lock()
+    render_queue = queue.Queue(maxsize=queue_depth)
+    text_queue = queue.Queue(maxsize=queue_depth * batch_size)
+    render_stats = pipeline_stats['render']
+    ocr_stats = pipeline_stats['ocr']
+    match_stats = pipeline_stats['match']
+    
+    def put(target_queue, item, stats):
+        """放入隊列，隊列滿時等待；流水線被停止時返回False"""
+        start_time = time.perf_counter()
+        while not stop_event.is_set():
+            try:
+                target_queue.put(item, timeout=0.1)
+                stats.record(idle=time.perf_counter() - start_time)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def get(source_queue, stats):
+        """從隊列取出，隊列空時等待；流水線被停止時返回_PIPELINE_END"""
+        start_time = time.perf_counter()
+        while not stop_event.is_set():
+            try:
+                item = source_queue.get(timeout=0.1)
+                stats.record(idle=time.perf_counter() - start_time)
+                return item
+            except queue.Empty:
+                continue
+        return _PIPELINE_END
+    
+    def render_stage():
+        try:
+            pending = []
+            pending_bytes = 0
+            for page_num, page, clip in _iter_ocr_pages(doc, region_plan, pages):
+                if stop_event.is_set():
+                    return
+                start_time = time.perf_counter()
+                with doc_lock:
+                    dpi, colorspace, retry_plan = plan_page_render(page, clip)
+                    pix = render_page_pixmap(page, dpi, colorspace, clip)
+                pending.append((page_num, pix, pixmap_to_ndarray(pix), retry_plan))
+                pending_bytes += pix.stride * pix.height
+                render_stats.record(items=1, busy=time.perf_counter() - start_time)
+                if len(pending) >= batch_size or pending_bytes >= OCR_BATCH_MEMORY_BYTES:
+                    if not put(render_queue, pending, render_stats):
+                        return
+                    pending = []
+                    pending_bytes = 0
+            if pending:
+                put(render_queue, pending, render_stats)
+        except Exception as e:
+            _extraction_error(status, f"渲染頁面時出錯: {e}")
+        finally:
+            put(render_queue, _PIPELINE_END, render_stats)
+    
+    def rerender(page_num, dpi, colorspace, clip):
+        with doc_lock:
+            return render_page_pixmap(doc[page_num], dpi, colorspace, clip)
+    
+    def ocr_stage():
+        try:
+            while True:
+                pending = get(render_queue, ocr_stats)
+                if pending is _PIPELINE_END:
+                    return
+                start_time = time.perf_counter()
+                page_texts = list(_ocr_pending_pages(ocr, pending, remove_whitespace, rerender, status))
+                ocr_stats.record(items=len(pending), busy=time.perf_counter() - start_time)
+                del pending
+                for page_text in page_texts:
+                    if not put(text_queue, page_text, ocr_stats):
+                        return
+        except Exception as e:
+            _extraction_error(status, f"OCR識別時出錯: {e}")
+        finally:
+            put(text_queue, _PIPELINE_END, ocr_stats)
+    
+    threads = [
+        threading.Thread(target=render_stage, name=f"{threading.current_thread().name}-render", daemon=True),
+        threading.Thread(target=ocr_stage, name=f"{threading.current_thread().name}-ocr", daemon=True)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            page_text = get(text_queue, match_stats)
+            if page_text is _PIPELINE_END:
+                break
+            start_time = time.perf_counter()
+            yield page_text
+            match_stats.record(items=1, busy=time.perf_counter() - start_time)
+    finally:
+        # 調用者停止迭代或流水線結束，通知各階段退出並等待它們釋放文件和圖像
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+
+def _ocr_pending_pages(ocr, pending, remove_whitespace=False, rerender=None, status=None):
+    """識別一批已渲染的頁面，按頁碼順序產出帶分隔行的文本
+    
+    平均置信度低於OCR_CONFIDENCE_THRESHOLD且有重新識別方案的頁面，會按方案重新渲染並識別，
+    保留置信度較高的一次結果。
+    
+    參數:
+        ocr (PaddleOCR): OCR實例
+        pending (list): (頁碼, 像素圖, 圖像數組, 重新識別方案)列表
+        remove_whitespace (bool): 是否去除OCR結果中的空白
+        rerender (callable): rerender(頁碼, dpi, 色彩空間, 裁剪區域)返回新的像素圖，None表示不重新識別
+        status (ExtractionStatus): 可選的提取狀態，記錄識別失敗的頁面
+    
+    產出:
+        tuple: (頁索引, 帶有「===== 第N頁 =====」分隔行的單頁OCR文本)
+    """
+    first_page = pending[0][0] + 1
+    last_page = pending[-1][0] + 1
+    if first_page == last_page:
+        print(f"正在OCR處理第{first_page}頁...")
+    else:
+        print(f"正在OCR處理第{first_page}-{last_page}頁...")
+    
+    page_lines = ocr_images(ocr, [entry[2] for entry in pending], status)
+    
+    # 低置信度頁面按重新識別方案再識別一次
+    retry_indexes = [
+        index for index, (entry, lines) in enumerate(zip(pending, page_lines))
+        if rerender is not None and entry[3] is not None and ocr_confidence(lines) < OCR_CONFIDENCE_THRESHOLD
+    ]
+    if retry_indexes:
+        retry_pixmaps = []
+        for index in retry_indexes:
+            page_num, retry_plan = pending[index][0], pending[index][3]
+            print(f"第{page_num+1}頁識別置信度較低（{ocr_confidence(page_lines[index]):.2f}），改用{retry_plan[0]}dpi{'彩色' if retry_plan[1] == 'rgb' else ''}重新識別...")
+            retry_pixmaps.append(rerender(page_num, *retry_plan))
+        retry_images = []
+        for pix in retry_pixmaps:
+            image = pixmap_to_ndarray(pix)
+            if image.ndim == 3:
+                # PaddleOCR按OpenCV的BGR通道順序處理彩色圖像
+                import numpy as np
+                image = np.ascontiguousarray(image[:, :, ::-1])
+            retry_images.append(image)
+        retry_lines = ocr_images(ocr, retry_images, status)
+        del retry_images, retry_pixmaps
+        for index, lines in zip(retry_indexes, retry_lines):
+            if ocr_confidence(lines) >= ocr_confidence(page_lines[index]):
+                page_lines[index] = lines
+    
+    for entry, lines in zip(pending, page_lines):
+        page_num = entry[0]
+        page_text = ""
+        for text_content, confidence in lines:
+            # 根據設置決定是否去除空白
+            if remove_whitespace:
+                text_content = text_content.replace(" ", "")
+            page_text += text_content + "\n"
+        yield page_num, f"===== 第{page_num+1}頁 =====\n{page_text}\n"
+
+def ocr_confidence(lines):
+    """計算頁面識別結果按文本長度加權的平均置信度
+    
+    參數:
+        lines (list): (文本, 置信度)列表
+    
+    返回:
+        float: 平均置信度，沒有識別出文字時為0
+    """
+    total_weight = 0
+    weighted_sum = 0.0
+    for text, confidence in lines:
+        if confidence is None or not text:
+            continue
+        total_weight += len(text)
+        weighted_sum += float(confidence) * len(text)
+    return weighted_sum / total_weight if total_weight else 0.0
+
+def ocr_images(ocr, images, status=None):
+    """識別多張圖像
+    
+    支持批量推理的PaddleOCR（3.x的predict接口）會將整批圖像一次送入檢測和識別模型，
+    否則逐張調用ocr.ocr。
+    
+    參數:
+        ocr (PaddleOCR): OCR實例
+        images (list): 圖像數組列表
+        status (ExtractionStatus): 可選的提取狀態，記錄識別失敗的圖像
+    
+    返回:
+        list: 與images一一對應的識別結果，每項為(文本, 置信度)列表
+    """
+    results = None
+    if hasattr(ocr, 'predict'):
+        try:
+            results = list(ocr.predict(images))
+            if len(results) != len(images):
+                print(f"OCR返回了{len(results)}個結果，預期{len(images)}個，改為逐頁識別")
+                results = None
+        except Exception as ocr_err:
+            print(f"使用predict處理圖片時出錯，改為逐頁識別: {ocr_err}")
+            results = None
+    
+    if results is None:
+        results = []
+        for image in images:
+            try:
+                results.append(ocr.ocr(image, cls=True))
+            except Exception as ocr_err:
+                _extraction_error(status, f"OCR處理圖片時出錯: {ocr_err}")
+                results.append(None)
+    
+    return [_parse_ocr_result(result) for result in results]
+
+def _parse_ocr_result(result):
+    """將PaddleOCR的識別結果轉換為(文本, 置信度)列表
+    
+    支持2.x的嵌套列表格式（[[框, (文本, 置信度)], ...]，外層按頁包裝）
+    和3.x帶有rec_texts、rec_scores的結果對象。
+    
+    參數:
+        result: ocr.ocr或ocr.predict返回的單張圖像結果
+    
+    返回:
+        list: (文本, 置信度)列表
+    """
+    lines = []
+    if result is None:
+        return lines
+    try:
+        # 3.x結果對象（類字典）
+        if hasattr(result, 'get') and not isinstance(result, (list, tuple)):
+            texts = result.get('rec_texts') or []
+            scores = result.get('rec_scores')
+            if scores is None:
+                scores = [None] * len(texts)
+            return [(text, score) for text, score in zip(texts, scores)]
         
+        for item in result:
+            if item is None:
+                continue
+            # 2.x單行：[框, (文本, 置信度)]
+            if len(item) >= 2 and isinstance(item[1], (tuple, list)) and len(item[1]) >= 1 and isinstance(item[1][0], str):
+                lines.append((item[1][0], item[1][1] if len(item[1]) > 1 else None))
+            else:
+                # 外層按頁或按圖像包裝的列表
+                lines.extend(_parse_ocr_result(item))
+    except TypeError as type_err:
+        print(f"處理OCR結果時出錯: {type_err}")
+    except Exception as proc_err:
+        print(f"處理OCR結果時出現未知錯誤: {proc_err}")
+    return lines
+
+def plan_page_render(page, clip=None):
+    """根據頁面尺寸和嵌入圖像選擇OCR渲染解析度和色彩空間
+    
+    掃描頁面按其中最大圖像的原始解析度渲染（限制在OCR_MIN_DPI到OCR_DPI之間），
+    沒有圖像的頁面使用OCR_DPI；之後再按OCR_MAX_PIXELS限制總像素數。首輪一律渲染為灰階，
+    啟用快速首輪時使用OCR_FAST_DPI，置信度不足時再按重新識別方案渲染。
+    
+    參數:
+        page (fitz.Page): PDF頁面
+        clip (tuple): 可選的比例裁剪區域(左, 上, 右, 下)，像素數上限按裁剪後的面積計算
+    
+    返回:
+        tuple: (首輪dpi, 首輪色彩空間, 重新識別方案)，重新識別方案為(dpi, 色彩空間, 裁剪區域)或None
+    """
+    import math
+    rect = page.rect
+    page_area = max(rect.width * rect.height, 1)
+    render_area = page_area
+    if clip is not None:
+        render_area = max(page_area * (clip[2] - clip[0]) * (clip[3] - clip[1]), 1)
+    
+    # 找出覆蓋面積最大的嵌入圖像，估算其原始解析度並判斷是否為彩色
+    image_dpi = None
+    has_colour = False
+    try:
+        largest_area = 0
+        for info in page.get_image_info():
+            x0, y0, x1, y1 = info['bbox']
+            bbox_width = abs(x1 - x0)
+            bbox_height = abs(y1 - y0)
+            area = bbox_width * bbox_height
+            # 忽略小於頁面5%的圖像（圖標、印章等）
+            if area < page_area * 0.05 or not bbox_width or not bbox_height:
+                continue
+            if info.get('colorspace', 1) >= 3:
+                has_colour = True
+            if area > largest_area:
+                largest_area = area
+                image_dpi = max(info['width'] / bbox_width, info['height'] / bbox_height) * 72
+    except Exception:
+        image_dpi = None
+    
+    dpi = OCR_DPI
+    if image_dpi:
+        dpi = min(OCR_DPI, max(OCR_MIN_DPI, image_dpi))
+    # 限制總像素數，大幅面頁面降低解析度
+    max_dpi_for_pixels = 72 * math.sqrt(OCR_MAX_PIXELS / render_area)
+    dpi = int(min(dpi, max_dpi_for_pixels))
+    
+    retry_colorspace = 'rgb' if has_colour else 'gray'
+    if OCR_FAST_DPI and OCR_FAST_DPI < dpi:
+        return OCR_FAST_DPI, 'gray', (dpi, retry_colorspace, clip)
+    if has_colour:
+        return dpi, 'gray', (dpi, 'rgb', clip)
+    return dpi, 'gray', None
+
+def render_page_pixmap(page, dpi=None, colorspace="gray", clip=None):
+    """將PDF頁面渲染為供OCR使用的像素圖
+    
+    參數:
+        page (fitz.Page): PDF頁面
+        dpi (int): 渲染解析度，標準PDF點數為72dpi，縮放比例為dpi/72；None表示使用OCR_DPI
+        colorspace (str): "gray"或"rgb"
+        clip (tuple): 可選的比例裁剪區域(左, 上, 右, 下)，只渲染頁面的這一部分
+    
+    返回:
+        fitz.Pixmap: 不含透明通道的像素圖
+    """
+    import fitz
+    scale_factor = (dpi or OCR_DPI) / 72
+    clip_rect = None
+    if clip is not None:
+        rect = page.rect
+        clip_rect = fitz.Rect(
+            rect.x0 + rect.width * clip[0],
+            rect.y0 + rect.height * clip[1],
+            rect.x0 + rect.width * clip[2],
+            rect.y0 + rect.height * clip[3]
+        )
+    return page.get_pixmap(matrix=fitz.Matrix(scale_factor, scale_factor), colorspace=colorspace, alpha=False, clip=clip_rect)
+
+def pixmap_to_ndarray(pix):
+    """將像素圖轉換為NumPy數組，盡量直接引用像素圖的緩衝區而不複製
+    
+    返回的數組與像素圖共用內存，使用期間必須保持pix存活。
+    
+    參數:
+        pix (fitz.Pixmap): 像素圖
+    
+    返回:
+        numpy.ndarray: 灰階圖為(高, 寬)，彩色圖為(高, 寬, 通道數)的uint8數組
+    """
+    import numpy as np
+    # 舊版PyMuPDF沒有samples_mv，只能使用會複製數據的samples
+    samples = getattr(pix, 'samples_mv', None)
+    if samples is None:
+        samples = pix.samples
+    image = np.ndarray(
+        (pix.height, pix.width, pix.n),
+        dtype=np.uint8,
+        buffer=samples,
+        strides=(pix.stride, pix.n, 1)
+    )
+    if pix.n == 1:
+        image = image[:, :, 0]
+    return image
+
+def read_pdf_metadata(pdf_path, has_fitz=False):
+    """讀取PDF元數據，將所有非空的元數據值串接為一個字符串
+
+    參數:
+        pdf_path (str): PDF文件路徑
+        has_fitz (bool): 是否有PyMuPDF
+
+    返回:
+        str: 串接後的元數據
+    """
+    metadata = ""
+    if has_fitz:
         try:
-            # 打開PDF文件
+            import fitz
             with fitz.open(pdf_path) as doc:
-                print(f"使用PaddleOCR處理PDF: {os.path.basename(pdf_path)}，共{len(doc)}頁")
-                
-                # 處理每一頁
-                for page_num, page in enumerate(doc):
-                    # 計算適當的縮放比例以獲得300dpi的解析度
-                    # 標準PDF點數為72dpi，所以縮放比例為300/72 = 4.167
-                    # 但由於PyMuPDF的Matrix縮放可能會導致圖像過大，我們使用較低的值
-                    scale_factor = 300 / 72
-                    
-                    # 將頁面渲染為圖片，使用300dpi的解析度並轉為灰階
-                    pix = page.get_pixmap(matrix=fitz.Matrix(scale_factor, scale_factor), colorspace="gray")
-                    img_path = os.path.join(temp_dir, f"temp_page_{page_num}.png")
-                    pix.save(img_path)
-                    
-                    print(f"正在OCR處理第{page_num+1}頁...")
-                    
-                    # 使用OCR識別圖片中的文字
-                    try:
-                        result = ocr.ocr(img_path, cls=True)
-                    except Exception as ocr_err:
-                        print(f"OCR處理圖片時出錯: {ocr_err}")
-                        result = None
-                    
-                    # 處理OCR結果
-                    page_text = ""
-                    if result is not None:
-                        try:
-                            for line in result:
-                                if line is None:
-                                    continue
-                                for item in line:
-                                    if len(item) >= 2 and isinstance(item[1], tuple) and len(item[1]) >= 1:
-                                        # 獲取文本內容和置信度
-                                        text_content = item[1][0]
-                                        confidence = item[1][1]
-                                        
-                                        # 根據設置決定是否去除空白
-                                        if remove_whitespace:
-                                            text_content = text_content.replace(" ", "")
-                                        
-                                        page_text += text_content + "\n"
-                        except TypeError as type_err:
-                            print(f"處理OCR結果時出錯: {type_err}")
-                        except Exception as proc_err:
-                            print(f"處理OCR結果時出現未知錯誤: {proc_err}")
-                    
-                    ocr_text += f"===== 第{page_num+1}頁 =====\n{page_text}\n"
-                    
-                    # 刪除臨時圖片
+                metadata = read_document_metadata(doc)
+        except Exception as e:
+            log_message(f"讀取元數據時出錯: {e}", level='警告')
+    return metadata
+
+def read_document_metadata(doc):
+    """串接已打開的PyMuPDF文檔所有非空的元數據值
+
+    參數:
+        doc (fitz.Document): 已打開的PDF文件
+
+    返回:
+        str: 串接後的元數據
+    """
+    metadata = ""
+    if doc.metadata and isinstance(doc.metadata, dict):
+        for key, value in doc.metadata.items():
+            if value:
+                metadata += str(value)
+    return metadata
+
+def read_pdf_page_count(pdf_path, has_fitz=False, has_pikepdf=False, has_pypdf2=False):
+    """讀取PDF頁數，只解析交叉引用表和頁面樹，不提取任何頁面內容
+
+    參數:
+        pdf_path (str): PDF文件路徑
+        has_fitz (bool): 是否有PyMuPDF
+        has_pikepdf (bool): 是否有pikepdf
+        has_pypdf2 (bool): 是否有PyPDF2
+
+    返回:
+        int or None: 頁數，無法讀取（如需要密碼或文件損壞）時返回None
+    """
+    if has_fitz:
+        try:
+            import fitz
+            with fitz.open(pdf_path) as doc:
+                if not doc.needs_pass:
+                    return doc.page_count
+        except Exception:
+            pass
+    if has_pikepdf:
+        try:
+            import pikepdf
+            with pikepdf.open(pdf_path) as pdf:
+                return len(pdf.pages)
+        except Exception:
+            pass
+    if has_pypdf2:
+        try:
+            import PyPDF2
+            with open(pdf_path, 'rb') as f:
+                reader = PyPDF2.PdfReader(f)
+                if not reader.is_encrypted:
+                    return len(reader.pages)
+        except Exception:
+            pass
+    return None
+
+class PdfExtractionContext:
+    """單個PDF文件的提取上下文
+
+    同一個文件的所有規則共用此對象：內容、檔名和元數據只在第一條需要該目標類型的規則
+    被評估時才提取，之後直接返回已提取的結果，避免每條規則都重新打開和OCR文件。
+    內容也可以通過iter_content()逐頁讀取，中途停止後再訪問content會從停下的頁面繼續。
+    完整且沒有出錯地讀取的內容和元數據會寫入提取緩存，同一文件在相同設置下再次處理時直接從緩存讀取。
+    有PyMuPDF時文件只打開一次：讀取元數據、提取文字層和加密保存共用同一個文檔句柄。
+    """
+
+    def __init__(self, pdf_path, has_fitz=False, has_pypdf2=False, has_paddleocr=False, force_ocr=False, remove_whitespace=False, ocr_instance=None, stat_result=None, use_cache=True, region_plan=None):
+        self.pdf_path = pdf_path
+        self.has_fitz = has_fitz
+        self.has_pypdf2 = has_pypdf2
+        self.has_paddleocr = has_paddleocr
+        self.force_ocr = force_ocr
+        self.remove_whitespace = remove_whitespace
+        self.ocr_instance = ocr_instance
+        # 目錄掃描得到的文件路徑（PdfFileEntry）帶有文件狀態，直接用於緩存查詢
+        self.stat_result = stat_result if stat_result is not None else getattr(pdf_path, 'stat_result', None)
+        self.use_cache = use_cache
+        # OCR時只識別規則聲明的頁面和區域
+        self.region_plan = region_plan
+        self.filename = os.path.splitext(os.path.basename(pdf_path))[0]
+        self.extract_seconds = 0.0
+        self._pages = []
+        self._page_iter = None
+        self._content = None
+        self._metadata = None
+        self._cache = None
+        self._cache_key = None
+        self._cache_entry = None
+        self._cache_checked = False
+        self._doc = None
+        self._doc_failed = False
+        self._status = None
+
+    @property
+    def extraction_failed(self):
+        """提取內容時是否出錯（結果可能不完整）"""
+        return self._status is not None and not self._status.ok
+
+    def document(self):
+        """返回共用的PyMuPDF文檔句柄，首次調用時打開文件
+
+        返回:
+            fitz.Document or None: 沒有PyMuPDF或無法打開時返回None
+        """
+        if self._doc is None and self.has_fitz and not self._doc_failed:
+            try:
+                import fitz
+                self._doc = fitz.open(self.pdf_path)
+            except Exception as e:
+                self._doc_failed = True
+                log_message(f"使用PyMuPDF打開PDF時出錯: {e}", level='警告')
+        return self._doc
+
+    def extraction_settings(self):
+        """返回影響提取結果的設置，用於生成緩存鍵"""
+        return {
+            'fitz': self.has_fitz,
+            'pypdf2': self.has_pypdf2,
+            'paddleocr': self.has_paddleocr,
+            'force_ocr': self.force_ocr,
+            'remove_whitespace': self.remove_whitespace,
+            'ocr_resolution': get_ocr_resolution_settings(),
+            'ocr_lang': OCR_LANG,
+            'ocr_regions': self.region_plan.to_key() if self.region_plan is not None else None,
+            'page_classifier': get_page_classifier_settings()
+        }
+
+    def _load_cache_entry(self):
+        """查詢提取緩存（每個文件只查詢一次）"""
+        if self._cache_checked:
+            return self._cache_entry
+        self._cache_checked = True
+        if not self.use_cache:
+            return None
+        try:
+            from cache_utils import get_extraction_cache
+            self._cache = get_extraction_cache()
+            if self._cache is None:
+                return None
+            content_hash = self._cache.file_hash(self.pdf_path, self.stat_result)
+            self._cache_key = self._cache.make_key(content_hash, self.extraction_settings())
+            self._cache_entry = self._cache.get(self._cache_key)
+        except Exception as e:
+            log_message(f"讀取提取緩存時出錯: {e}", level='警告')
+            self._cache = None
+        return self._cache_entry
+
+    def _store_cache(self, pages=None, metadata=None, elapsed=None):
+        """將提取結果寫入緩存"""
+        if self._cache is None or self._cache_key is None:
+            return
+        try:
+            self._cache.put(self._cache_key, pages=pages, metadata=metadata, elapsed=elapsed)
+        except Exception as e:
+            log_message(f"寫入提取緩存時出錯: {e}", level='警告')
+
+    def has_cached_content(self):
+        """提取緩存中是否已有此文件的完整內容"""
+        entry = self._load_cache_entry()
+        return bool(entry and entry['pages'] is not None)
+
+    def iter_content(self):
+        """逐頁讀取內容，每讀完一頁就產出這一頁的文本（之前已讀取的頁面先依次產出）
+
+        產出:
+            str: 單頁的文本，全部產出串接起來即為content
+        """
+        if self._content is not None:
+            yield from self._pages if self._pages else [self._content]
+            return
+        if self._page_iter is None and not self._pages:
+            entry = self._load_cache_entry()
+            if entry and entry['pages'] is not None:
+                self._pages = entry['pages']
+                self._content = "".join(self._pages)
+                count_page_path('cache', len(self._pages))
+                yield from self._pages
+                return
+        if self._page_iter is None:
+            self._status = ExtractionStatus()
+            self._page_iter = iter_text_from_pdf(
+                self.pdf_path, self.has_fitz, self.has_pypdf2, self.has_paddleocr,
+                force_ocr=self.force_ocr, remove_whitespace=self.remove_whitespace,
+                save_txt=False, ocr_instance=self.ocr_instance, region_plan=self.region_plan,
+                doc=self.document(), status=self._status
+            )
+        # 已讀取但尚未被本次迭代看到的頁面
+        seen = len(self._pages)
+        yield from self._pages[:seen]
+        while True:
+            start_time = time.time()
+            try:
+                page_text = next(self._page_iter)
+            except StopIteration:
+                self.extract_seconds += time.time() - start_time
+                break
+            self.extract_seconds += time.time() - start_time
+            self._pages.append(page_text)
+            yield page_text
+        self._content = "".join(self._pages)
+        self._page_iter = None
+        # 只緩存完整讀取且沒有出錯的內容：出錯時產出的頁面可能不完整或為空，下次需要重新提取；
+        # 沒有提取到任何文本時也不緩存，避免暫時的錯誤被永久記錄為空內容
+        if self._status.ok and any(page.strip() for page in self._pages):
+            self._store_cache(pages=self._pages, metadata=self._metadata, elapsed=self.extract_seconds)
+        elif not self._status.ok:
+            log_message(f"提取 {self.pdf_path} 的內容時出錯，結果不寫入緩存", level='警告')
+
+    @property
+    def content(self):
+        """文件內容（首次訪問時提取，已部分讀取時繼續讀完剩餘頁面）"""
+        if self._content is None:
+            for _ in self.iter_content():
+                pass
+        return self._content
+
+    @property
+    def content_loaded(self):
+        """內容是否已經完整提取"""
+        return self._content is not None
+
+    @property
+    def metadata(self):
+        """文件元數據（首次訪問時讀取）"""
+        if self._metadata is None:
+            entry = self._load_cache_entry()
+            if entry and entry['metadata'] is not None:
+                self._metadata = entry['metadata']
+            else:
+                doc = self.document()
+                if doc is not None:
                     try:
-                        os.remove(img_path)
+                        self._metadata = read_document_metadata(doc)
                     except Exception as e:
-                        print(f"刪除臨時圖片時出錯: {e}")
-        finally:
-            # 清理臨時目錄
+                        log_message(f"讀取元數據時出錯: {e}", level='警告')
+                        self._metadata = ""
+                else:
+                    self._metadata = ""
+                self._store_cache(metadata=self._metadata)
+        return self._metadata
+
+    def get_text_for(self, target_type):
+        """根據規則的目標類型返回要匹配的文本
+
+        參數:
+            target_type (str): 目標類型（內容、檔名、元數據）
+
+        返回:
+            str: 要匹配的文本
+        """
+        if target_type == "檔名":
+            return self.filename
+        elif target_type == "元數據":
+            return self.metadata
+        # 默認使用內容
+        return self.content
+
+    def close(self):
+        """停止逐頁讀取，已讀取的頁面作為最終內容保留（共用的文檔句柄保留到close_document）"""
+        if self._page_iter is not None:
+            self._page_iter.close()
+            self._page_iter = None
+            self._content = "".join(self._pages)
+
+    def save_encrypted(self, output_path, user_pass, owner_pass):
+        """用共用的文檔句柄把加密後的文件直接保存到最終路徑（先寫臨時文件再原子替換）
+
+        參數:
+            output_path (str): 最終文件路徑
+            user_pass (str or bytes): 用戶密碼
+            owner_pass (str or bytes): 所有者密碼
+
+        返回:
+            bool: 是否成功，沒有PyMuPDF或保存失敗時返回False
+        """
+        doc = self.document()
+        if doc is None:
+            return False
+        try:
+            save_pdf_document(doc, output_path, user_pass, owner_pass)
+            return True
+        except Exception as e:
+            log_message(f"使用PyMuPDF加密PDF時出錯: {e}", level='警告')
+            return False
+
+    def close_document(self):
+        """停止讀取並關閉共用的文檔句柄，之後才能重命名或刪除原文件"""
+        self.close()
+        if self._doc is not None:
             try:
-                import shutil
-                shutil.rmtree(temp_dir)
+                self._doc.close()
             except Exception as e:
-                print(f"清理臨時目錄時出錯: {e}")
-        
-        # 不再在此處保存OCR結果，而是返回OCR文本，由調用者決定如何處理
-        # save_txt參數保留以保持向後兼容性
-        
-        return ocr_text
-    except Exception as e:
-        print(f"使用PaddleOCR提取文本時出錯: {e}")
-        return ""
+                log_message(f"關閉PDF文檔時出錯: {e}", level='警告')
+            self._doc = None
 
 def encrypt_pdf(input_path, output_path, user_pass, owner_pass, has_pikepdf=False, has_pypdf2=False):
     """加密PDF文件
@@ -214,8 +1353,17 @@ def encrypt_pdf(input_path, output_path, user_pass, owner_pass, has_pikepdf=Fals
         except Exception as e:
             print(f"使用pikepdf加密PDF時出錯: {e}")
     
-    # 嘗試使用PyPDF2加密
+    # 嘗試使用PyPDF2加密：它把每一頁複製到新文檔後再加密，大文件不使用，避免不知不覺地拖慢整批處理
     if has_pypdf2:
+        try:
+            file_size = os.path.getsize(input_path)
+        except OSError:
+            file_size = 0
+        if PYPDF2_ENCRYPT_MAX_BYTES and file_size > PYPDF2_ENCRYPT_MAX_BYTES:
+            log_message(f"文件 {input_path} 大小為 {file_size / 1048576:.1f}MB，超過PyPDF2加密上限 "
+                        f"{PYPDF2_ENCRYPT_MAX_BYTES / 1048576:.0f}MB，不使用PyPDF2加密；請安裝pikepdf或PyMuPDF", level='警告')
+            return False
+        log_message(f"使用PyPDF2加密 {input_path}（{file_size / 1048576:.1f}MB），速度遠慢於pikepdf", level='警告')
         try:
             from PyPDF2 import PdfReader, PdfWriter
             reader = PdfReader(input_path)
@@ -240,7 +1388,155 @@ def encrypt_pdf(input_path, output_path, user_pass, owner_pass, has_pikepdf=Fals
     
     return False
 
-def split_pdf(pdf_path, output_dir, pages_per_file, has_fitz=False, has_pikepdf=False, has_pypdf2=False):
+def save_pdf_document(doc, output_path, user_pass=None, owner_pass=None):
+    """保存PyMuPDF文檔，提供密碼時在同一次保存中以AES-256加密
+    
+    先寫入同目錄的臨時文件，完成後以os.replace原子地替換為最終檔名，
+    中途失敗不會留下不完整的輸出文件。
+    
+    參數:
+        doc (fitz.Document): 要保存的文檔
+        output_path (str): 最終文件路徑
+        user_pass (str or bytes): 用戶密碼，None表示不加密
+        owner_pass (str or bytes): 所有者密碼
+    """
+    import fitz
+    temp_output_path = output_path + ".temp"
+    try:
+        if user_pass is None and owner_pass is None:
+            doc.save(temp_output_path)
+        else:
+            # 與encrypt_pdf相同：AES-256，不允許複製、修改和打印
+            doc.save(
+                temp_output_path,
+                encryption=fitz.PDF_ENCRYPT_AES_256,
+                user_pw=user_pass.decode('utf-8') if isinstance(user_pass, bytes) else (user_pass or ""),
+                owner_pw=owner_pass.decode('utf-8') if isinstance(owner_pass, bytes) else (owner_pass or ""),
+                permissions=fitz.PDF_PERM_ACCESSIBILITY
+            )
+        os.replace(temp_output_path, output_path)
+    except Exception:
+        try:
+            os.remove(temp_output_path)
+        except OSError:
+            pass
+        raise
+
+def configure_encryption_fallback(pypdf2_max_mb=None):
+    """設置加密時PyPDF2備用方案的適用範圍
+    
+    參數:
+        pypdf2_max_mb (float): 超過此大小（MB）的文件不使用PyPDF2加密，0表示不限制
+    """
+    global PYPDF2_ENCRYPT_MAX_BYTES
+    if pypdf2_max_mb is not None:
+        PYPDF2_ENCRYPT_MAX_BYTES = int(max(0, pypdf2_max_mb) * 1024 * 1024)
+
+def configure_split(max_workers=None):
+    """設置分割PDF時使用的進程數
+
+    參數:
+        max_workers (int): 並行輸出分割文件的進程數，1表示在當前進程中依次輸出，0表示使用CPU核心數
+    """
+    global SPLIT_WORKERS
+    if max_workers is not None:
+        SPLIT_WORKERS = max(0, int(max_workers))
+
+def plan_split_ranges(number_of_pages, pages_per_file):
+    """按固定頁數劃分分割範圍
+
+    參數:
+        number_of_pages (int): 總頁數
+        pages_per_file (int): 每個文件的頁數
+
+    返回:
+        list: [(文件序號, 起始頁, 結束頁)]，序號從1開始，頁碼從0開始且包含結束頁
+    """
+    return [(i // pages_per_file + 1, i, min(i + pages_per_file, number_of_pages) - 1)
+            for i in range(0, number_of_pages, pages_per_file)]
+
+def split_chunk_path(pdf_path, output_dir, index):
+    """分割文件的輸出路徑，格式為「原檔名-序號.pdf」
+
+    參數:
+        pdf_path (str): 原PDF文件路徑
+        output_dir (str): 輸出目錄
+        index (int): 文件序號（從1開始）
+
+    返回:
+        str: 輸出文件路徑
+    """
+    pdf_info = os.path.splitext(os.path.basename(pdf_path))[0]
+    return os.path.join(output_dir, f"{pdf_info}-{index}.pdf")
+
+def _write_fitz_chunk(source_doc, from_page, to_page, page_file_path):
+    """把已打開的PyMuPDF文檔中的一段頁面保存為新文件（頁碼從0開始且包含結束頁）"""
+    import fitz
+    new_doc = fitz.open()
+    try:
+        new_doc.insert_pdf(source_doc, from_page=from_page, to_page=to_page)
+        new_doc.save(page_file_path)
+    finally:
+        try:
+            new_doc.close()
+        except Exception as close_err:
+            print(f"關閉PDF文檔時出錯: {close_err}")
+
+# 分割工作進程內打開的原文件，由_init_split_worker在每個進程啟動時打開一次
+_split_source = None
+
+def _init_split_worker(pdf_path):
+    """分割工作進程初始化函數：打開原文件一次，之後該進程輸出的所有分割文件共用"""
+    global _split_source
+    import fitz
+    _split_source = fitz.open(pdf_path)
+
+def _split_worker_chunk(from_page, to_page, page_file_path):
+    """在分割工作進程中輸出一個分割文件"""
+    _write_fitz_chunk(_split_source, from_page, to_page, page_file_path)
+    return page_file_path
+
+def _split_pdf_parallel(pdf_path, output_dir, ranges, max_workers, progress_callback=None):
+    """使用進程池並行輸出分割文件
+
+    參數:
+        pdf_path (str): PDF文件路徑
+        output_dir (str): 輸出目錄
+        ranges (list): plan_split_ranges返回的分割範圍
+        max_workers (int): 進程數
+        progress_callback (callable): 每輸出一個文件後調用callback(已完成數, 總數, 文件路徑)
+
+    返回:
+        bool: 進程池是否正常完成（個別文件輸出失敗不影響返回值）
+    """
+    import concurrent.futures
+    from worker_utils import worker_context
+
+    total = len(ranges)
+    completed = 0
+    try:
+        with worker_context(max_workers, backend='process', initializer=_init_split_worker, initargs=(pdf_path,)) as executor:
+            futures = {}
+            for index, from_page, to_page in ranges:
+                page_file_path = split_chunk_path(pdf_path, output_dir, index)
+                futures[executor.submit(_split_worker_chunk, from_page, to_page, page_file_path)] = page_file_path
+            for future in concurrent.futures.as_completed(futures):
+                page_file_path = futures[future]
+                try:
+                    future.result()
+                except concurrent.futures.BrokenExecutor:
+                    raise
+                except Exception as e:
+                    print(f"使用PyMuPDF分割PDF時出錯: {os.path.basename(page_file_path)}, {e}")
+                completed += 1
+                if progress_callback is not None:
+                    progress_callback(completed, total, page_file_path)
+    except Exception as e:
+        print(f"並行分割PDF時出錯，改為依次分割: {e}")
+        return False
+    return True
+
+def split_pdf(pdf_path, output_dir, pages_per_file, has_fitz=False, has_pikepdf=False, has_pypdf2=False, max_workers=None, progress_callback=None):
     """分割PDF文件
     
     參數:
@@ -250,45 +1546,43 @@ def split_pdf(pdf_path, output_dir, pages_per_file, has_fitz=False, has_pikepdf=
         has_fitz (bool): 是否有PyMuPDF
         has_pikepdf (bool): 是否有pikepdf
         has_pypdf2 (bool): 是否有PyPDF2
+        max_workers (int): 並行輸出的進程數，默認為SPLIT_WORKERS；大於1且有PyMuPDF時，
+                           各進程只打開原文件一次並輸出分配到的分割文件
+        progress_callback (callable): 每輸出一個文件後調用callback(已完成數, 總數, 文件路徑)
         
     返回:
         bool: 是否成功
     """
     split_success = False
+    if max_workers is None:
+        max_workers = SPLIT_WORKERS
+    if max_workers == 0:
+        import multiprocessing
+        max_workers = multiprocessing.cpu_count()
     
     # 嘗試使用PyMuPDF分割
     if has_fitz and not split_success:
         try:
             import fitz
             with fitz.open(pdf_path) as pdf_doc:
-                pdf_info = os.path.splitext(os.path.basename(pdf_path))[0]
                 number_of_pages = pdf_doc.page_count
+                ranges = plan_split_ranges(number_of_pages, pages_per_file)
                 
-                print(f"PDF檔案...一共有{number_of_pages}頁，你最後會得到{(number_of_pages-1)//pages_per_file+1}個檔案")
+                print(f"PDF檔案...一共有{number_of_pages}頁，你最後會得到{len(ranges)}個檔案")
                 
-                for i in range(0, number_of_pages, pages_per_file):
-                    page_limit = min(i + pages_per_file, number_of_pages)
-                    export_name = f"{pdf_info}-"
-                    new_pdf_file_name = f"{export_name}{i//pages_per_file+1}.pdf"
-                    page_file_path = os.path.join(output_dir, new_pdf_file_name)
-                    
-                    print(f"正在輸出...第{i+1}到{page_limit}頁，檔名：{new_pdf_file_name}")
-                    
-                    # 創建新的PDF文件並添加頁面
-                    new_doc = None
-                    try:
-                        new_doc = fitz.open()
-                        new_doc.insert_pdf(pdf_doc, from_page=i, to_page=page_limit-1)
-                        new_doc.save(page_file_path)
-                        print(f"使用PyMuPDF成功分割PDF：第{i+1}到{page_limit}頁")
-                    except Exception as e:
-                        print(f"使用PyMuPDF分割PDF時出錯: {e}")
-                    finally:
-                        if new_doc:
-                            try:
-                                new_doc.close()
-                            except Exception as close_err:
-                                print(f"關閉PDF文檔時出錯: {close_err}")
+                parallel_done = False
+                if max_workers > 1 and len(ranges) > 1:
+                    parallel_done = _split_pdf_parallel(pdf_path, output_dir, ranges, max_workers, progress_callback)
+                
+                if not parallel_done:
+                    for completed, (index, from_page, to_page) in enumerate(ranges, 1):
+                        page_file_path = split_chunk_path(pdf_path, output_dir, index)
+                        try:
+                            _write_fitz_chunk(pdf_doc, from_page, to_page, page_file_path)
+                        except Exception as e:
+                            print(f"使用PyMuPDF分割PDF時出錯: {e}")
+                        if progress_callback is not None:
+                            progress_callback(completed, len(ranges), page_file_path)
             split_success = True
         except Exception as e:
             print(f"使用PyMuPDF處理PDF時出錯: {e}")
@@ -298,24 +1592,19 @@ def split_pdf(pdf_path, output_dir, pages_per_file, has_fitz=False, has_pikepdf=
         try:
             import pikepdf
             with pikepdf.open(pdf_path) as pdf_doc:
-                pdf_info = os.path.splitext(os.path.basename(pdf_path))[0]
                 number_of_pages = len(pdf_doc.pages)
+                ranges = plan_split_ranges(number_of_pages, pages_per_file)
                 
-                print(f"PDF檔案...一共有{number_of_pages}頁，你最後會得到{(number_of_pages-1)//pages_per_file+1}個檔案")
+                print(f"PDF檔案...一共有{number_of_pages}頁，你最後會得到{len(ranges)}個檔案")
                 
-                for i in range(0, number_of_pages, pages_per_file):
-                    page_limit = min(i + pages_per_file, number_of_pages)
-                    export_name = f"{pdf_info}-"
-                    new_pdf_file_name = f"{export_name}{i//pages_per_file+1}.pdf"
-                    page_file_path = os.path.join(output_dir, new_pdf_file_name)
-                    
-                    print(f"正在輸出...第{i+1}到{page_limit}頁，檔名：{new_pdf_file_name}")
+                for completed, (index, from_page, to_page) in enumerate(ranges, 1):
+                    page_file_path = split_chunk_path(pdf_path, output_dir, index)
                     
                     # 創建新的PDF文件並添加頁面
                     new_pdf = None
                     try:
                         new_pdf = pikepdf.new()
-                        for j in range(i, page_limit):
+                        for j in range(from_page, to_page + 1):
                             new_pdf.pages.append(pdf_doc.pages[j])
                         
                         # 保存新文件
@@ -328,6 +1617,8 @@ def split_pdf(pdf_path, output_dir, pages_per_file, has_fitz=False, has_pikepdf=
                                 new_pdf.close()
                             except Exception as close_err:
                                 print(f"關閉pikepdf文檔時出錯: {close_err}")
+                    if progress_callback is not None:
+                        progress_callback(completed, len(ranges), page_file_path)
             split_success = True
         except Exception as e:
             print(f"使用pikepdf分割PDF時出錯: {e}")
@@ -336,48 +1627,126 @@ def split_pdf(pdf_path, output_dir, pages_per_file, has_fitz=False, has_pikepdf=
     if has_pypdf2 and not split_success:
         try:
             from PyPDF2 import PdfReader, PdfWriter
-            try:
-                from tqdm import tqdm
-            except ImportError:
-                def tqdm(iterable, **kwargs):
-                    return iterable
                     
             with open(pdf_path, 'rb') as file:
                 reader = PdfReader(file)
                 number_of_pages = len(reader.pages)
+                ranges = plan_split_ranges(number_of_pages, pages_per_file)
                 
-                print(f"PDF檔案...一共有{number_of_pages}頁，你最後會得到{(number_of_pages-1)//pages_per_file+1}個檔案")
+                print(f"PDF檔案...一共有{number_of_pages}頁，你最後會得到{len(ranges)}個檔案")
                 
-                for i in tqdm(range(0, number_of_pages, pages_per_file), desc="分割PDF進度"):
-                    page_limit = min(i + pages_per_file, number_of_pages)
-                    pdf_info = os.path.splitext(os.path.basename(pdf_path))[0]
-                    export_name = f"{pdf_info}-"
-                    new_pdf_file_name = f"{export_name}{i//pages_per_file+1}.pdf"
-                    page_file_path = os.path.join(output_dir, new_pdf_file_name)
-                    
-                    print(f"正在輸出...第{i+1}到{page_limit}頁，檔名：{new_pdf_file_name}")
+                for completed, (index, from_page, to_page) in enumerate(ranges, 1):
+                    page_file_path = split_chunk_path(pdf_path, output_dir, index)
                     
                     writer = PdfWriter()
-                    output_file = None
                     try:
-                        for j in range(i, page_limit):
+                        for j in range(from_page, to_page + 1):
                             writer.add_page(reader.pages[j])
                         
                         with open(page_file_path, 'wb') as output_file:
                             writer.write(output_file)
                     except Exception as writer_error:
                         print(f"使用PyPDF2寫入頁面時出錯: {writer_error}")
+                    if progress_callback is not None:
+                        progress_callback(completed, len(ranges), page_file_path)
             split_success = True
         except Exception as e:
             print(f"使用PyPDF2分割PDF時出錯: {e}")
     
     return split_success
 
-def process_pdf_files(pdf_files, rule_items, search_location, ori_meta, has_fitz, has_pypdf2, has_paddleocr, has_pikepdf, max_workers=4, is_copy_mode=False, use_ocr=False, remove_whitespace=False, save_ocr_txt=False, default_user_password=None, default_owner_password=None):
+# 工作進程內的全局狀態，由init_process_worker在每個進程啟動時設置一次
+_worker_settings = None
+
+def init_process_worker(settings):
+    """工作進程初始化函數，每個進程只執行一次
+    
+    導入PDF處理庫並按需載入OCR模型，之後該進程處理的所有文件共用。
+    
+    參數:
+        settings (dict): 包含file_renamer參數（renamer_kwargs）、緩存設置（cache）、批量OCR設置（ocr_batch）、流水線設置（ocr_pipeline）、渲染解析度設置（ocr_resolution）、逐頁判斷設置（page_classifier）、
+                         加密備用方案設置（encryption_fallback）和是否把加密交給主進程（defer_encryption）的字典
+    """
+    global _worker_settings
+    import signal
+    # Ctrl+C由主進程處理，工作進程忽略中斷信號
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    
+    _worker_settings = settings
+    renamer_kwargs = settings['renamer_kwargs']
+    
+    # 丟棄從父進程繼承的緩存連接，按相同設置重新打開
+    import cache_utils
+    cache_utils.reset_extraction_cache()
+    cache_utils.configure_cache(**settings['cache'])
+    configure_ocr_batch(**settings['ocr_batch'])
+    configure_ocr_pipeline(**settings['ocr_pipeline'])
+    configure_ocr_resolution(**settings['ocr_resolution'])
+    configure_page_classifier(**settings['page_classifier'])
+    configure_encryption_fallback(**settings['encryption_fallback'])
+    
+    # 預先導入PDF處理庫，讓每個工作進程在啟動時就完成導入，不必在第一個任務中等待
+    if renamer_kwargs.get('has_fitz'):
+        import fitz  # noqa: F401
+    if renamer_kwargs.get('has_pikepdf'):
+        import pikepdf  # noqa: F401
+    
+    # 每個進程只需要一個模型，需要OCR時在進程啟動時預先載入
+    if renamer_kwargs.get('has_paddleocr'):
+        try:
+            from paddle_utils import configure_ocr_pool, get_ocr_pool
+            configure_ocr_pool(max_size=1)
+            if renamer_kwargs.get('use_ocr'):
+                get_ocr_pool(lang=OCR_LANG).preload(1)
+        except Exception as e:
+            log_message(f"工作進程初始化PaddleOCR時出錯: {e}", level='警告')
+
+def process_file_in_worker(pdf_file):
+    """在工作進程中處理單個PDF文件
+    
+    參數:
+        pdf_file (str): PDF文件路徑
+        
+    返回:
+        dict: 結果記錄，包含path、success、new_path、started、elapsed、pid、error，以及本次處理產生的logs和提取統計stats；
+              需要由主進程提交到加密進程池時還包含encrypt_job
+    """
+    import queue
+    from file_utils import file_renamer, apply_rename_outcome
+    from log_utils import drain_log_entries
+    
+    start_time = time.time()
+    record = {'path': pdf_file, 'success': False, 'new_path': None, 'error': None, 'pid': os.getpid(), 'started': start_time}
+    try:
+        local_queue = queue.Queue()
+        # 需要加密的文件只記錄加密工作，由主進程提交到加密進程池
+        deferred = None
+        if _worker_settings.get('defer_encryption'):
+            from encrypt_utils import DeferredEncryption
+            deferred = DeferredEncryption()
+        record['success'] = file_renamer(
+            pdf_file=pdf_file,
+            result_queue=local_queue,
+            encryption_stage=deferred,
+            **_worker_settings['renamer_kwargs']
+        )
+        if not local_queue.empty():
+            apply_rename_outcome(record, local_queue.get_nowait())
+        if deferred is not None and deferred.job is not None and record['success']:
+            record['encrypt_job'] = deferred.job
+    except Exception as e:
+        log_message(f"處理文件時出錯: {pdf_file}, {e}", level='错误')
+        record['error'] = str(e)
+    record['elapsed'] = time.time() - start_time
+    record['logs'] = drain_log_entries()
+    record['stats'] = get_extraction_stats(reset=True)
+    return record
+
+def process_pdf_files(pdf_files, rule_items, search_location, ori_meta, has_fitz, has_pypdf2, has_paddleocr, has_pikepdf, max_workers=4, is_copy_mode=False, use_ocr=False, remove_whitespace=False, save_ocr_txt=False, default_user_password=None, default_owner_password=None, early_exit=False, backend='thread', result_callback=None, schedule='discovery'):
     """處理PDF文件
     
     參數:
-        pdf_files (list): PDF文件列表
+        pdf_files (iterable): PDF文件列表或逐個產出路徑的迭代器
         rule_items (list): 規則列表
         search_location (str): 搜索位置
         ori_meta (bool): 是否保留原始元數據
@@ -392,6 +1761,11 @@ def process_pdf_files(pdf_files, rule_items, search_location, ori_meta, has_fitz
         save_ocr_txt (bool): 是否將OCR結果保存為txt文件
         default_user_password (str): 默認用戶密碼
         default_owner_password (str): 默認所有者密碼
+        early_exit (bool): 是否逐頁匹配，規則匹配後停止讀取剩餘頁面
+        backend (str): 'thread'使用線程池，'process'使用進程池
+        result_callback (callable): 每個文件完成後調用callback(file_path, record)，用於記錄作業結果；
+                                    交給加密階段的文件加密失敗時會以失敗結果再調用一次
+        schedule (str): 'discovery'按發現順序處理，'lpt'按預估耗時從長到短處理
         
     返回:
         int: 處理的文件數量
@@ -399,11 +1773,12 @@ def process_pdf_files(pdf_files, rule_items, search_location, ori_meta, has_fitz
     # 記錄開始時間
     start_time = time.time()
     
-    if not pdf_files:
-        log_message(f"在 {search_location} 中未找到PDF文件", level='警告')
-        return 0
-    
-    log_message(f"找到 {len(pdf_files)} 個PDF文件")
+    # pdf_files可以是列表，也可以是邊掃描邊產出路徑的生成器
+    if isinstance(pdf_files, (list, tuple)):
+        if not pdf_files:
+            log_message(f"在 {search_location} 中未找到PDF文件", level='警告')
+            return 0
+        log_message(f"找到 {len(pdf_files)} 個PDF文件")
     
     # 如果啟用OCR但沒有PaddleOCR，顯示警告
     if use_ocr and not has_paddleocr:
@@ -416,34 +1791,142 @@ def process_pdf_files(pdf_files, rule_items, search_location, ori_meta, has_fitz
             log_message("已啟用保存OCR結果為txt文件功能", level='信息')
     
     # 導入file_renamer函數
-    from file_utils import file_renamer
+    from file_utils import file_renamer, apply_rename_outcome
     
-    # 定義單個PDF處理函數
-    def process_single_pdf(pdf_file):
+    # 將規則一次編譯為規則集，所有文件共用
+    from rule_utils import CompiledRuleSet
+    rule_set = rule_items if isinstance(rule_items, CompiledRuleSet) else CompiledRuleSet(rule_items)
+    
+    # 所有文件共用的file_renamer參數
+    renamer_kwargs = dict(
+        rule_items=rule_set,
+        search_location=search_location,
+        is_copy_mode=is_copy_mode,
+        default_user_password=default_user_password,
+        default_owner_password=default_owner_password,
+        has_fitz=has_fitz,
+        has_pypdf2=has_pypdf2,
+        has_paddleocr=has_paddleocr,
+        has_pikepdf=has_pikepdf,
+        use_ocr=use_ocr,
+        remove_whitespace=remove_whitespace,
+        save_ocr_txt=save_ocr_txt,
+        early_exit=early_exit
+    )
+    
+    # 設置了加密進程數時，加密作為獨立的流水線階段在自己的進程池中進行，提取和匹配規則的工作者不等待加密
+    import encrypt_utils
+    encryption_stage = None
+    if encrypt_utils.ENCRYPT_WORKERS > 0:
         try:
-            # 使用file_renamer函數處理PDF文件
-            return file_renamer(
-                rule_items=rule_items,
-                pdf_file=pdf_file,
-                search_location=search_location,
-                is_copy_mode=is_copy_mode,
-                default_user_password=default_user_password,
-                default_owner_password=default_owner_password,
-                has_fitz=has_fitz,
-                has_pypdf2=has_pypdf2,
-                has_paddleocr=has_paddleocr,
-                has_pikepdf=has_pikepdf,
-                use_ocr=use_ocr,
-                remove_whitespace=remove_whitespace,
-                save_ocr_txt=save_ocr_txt
+            encryption_stage = encrypt_utils.EncryptionStage(
+                encrypt_utils.ENCRYPT_WORKERS, encrypt_utils.ENCRYPT_QUEUE_DEPTH,
+                has_fitz=has_fitz, has_pikepdf=has_pikepdf, has_pypdf2=has_pypdf2,
+                result_callback=result_callback
             )
+        except Exception as e:
+            log_message(f"無法創建加密進程池，將在處理文件時直接加密: {e}", level='警告')
+    extract_stats = PipelineStageStats('extract')
+    
+    def handle_result(file_path, record):
+        """統計提取和匹配階段；工作進程記錄的加密工作在這裡提交到加密進程池
+        
+        已交給加密階段的文件由加密階段在加密完成時報告結果，這裡不記錄作業結果。
+        """
+        extract_stats.record(items=1, busy=record.get('elapsed') or 0.0)
+        job = record.pop('encrypt_job', None)
+        if job is not None:
+            new_path = encryption_stage.submit(job['pdf_file'], job['directory'], job['new_name'], job['user_pass'], job['owner_pass'])
+            if new_path is None:
+                from worker_utils import update_worker_status
+                record['success'] = False
+                record['new_path'] = None
+                record['encrypt_pending'] = False
+                record['error'] = "提交加密任務失敗"
+                update_worker_status(file_path, 3, record['error'])
+            else:
+                record['new_path'] = new_path
+        if result_callback is not None and not record.get('encrypt_pending'):
+            result_callback(file_path, record)
+    
+    # 定義單個PDF處理函數，返回與工作進程相同格式的結果記錄
+    def process_single_pdf(pdf_file):
+        record_start = time.time()
+        record = {'path': pdf_file, 'success': False, 'new_path': None, 'error': None}
+        try:
+            # 使用file_renamer函數處理PDF文件，新路徑經結果隊列取回
+            local_queue = queue.Queue()
+            record['success'] = file_renamer(pdf_file=pdf_file, result_queue=local_queue, encryption_stage=encryption_stage, **renamer_kwargs)
+            # 新路徑和處理結果經結果隊列取回；收到中斷信號後跳過的文件標記為interrupted，續傳時重新處理
+            if not local_queue.empty():
+                apply_rename_outcome(record, local_queue.get_nowait())
         except Exception as e:
             log_message(f"處理文件時出錯: {pdf_file}, {e}", level='错误')
-            return False
+            record['error'] = str(e)
+        record['elapsed'] = time.time() - record_start
+        return record
     
     # 使用並行處理函數處理所有PDF文件
-    from main import process_files_parallel
-    processed_count = process_files_parallel(pdf_files, process_single_pdf, max_workers)
+    from worker_utils import process_files_parallel, estimate_file_cost
+    from functools import partial
+    
+    # 按預估耗時排序時使用的頁數讀取和耗時估算函數
+    cost_func = partial(
+        estimate_file_cost,
+        use_ocr=use_ocr and has_paddleocr,
+        has_ocr=has_paddleocr,
+        page_counter=partial(read_pdf_page_count, has_fitz=has_fitz, has_pikepdf=has_pikepdf, has_pypdf2=has_pypdf2)
+    )
+    if backend == 'process':
+        import cache_utils
+        worker_settings = {
+            'renamer_kwargs': renamer_kwargs,
+            'cache': {
+                'enabled': cache_utils.cache_enabled,
+                'max_bytes': cache_utils.max_cache_bytes,
+                'cache_path': os.path.abspath(cache_utils.cache_file)
+            },
+            'ocr_batch': {
+                'batch_size': OCR_BATCH_SIZE,
+                'memory_budget_mb': OCR_BATCH_MEMORY_BYTES // (1024 * 1024)
+            },
+            'ocr_pipeline': {
+                'queue_depth': OCR_PIPELINE_DEPTH
+            },
+            'ocr_resolution': get_ocr_resolution_settings(),
+            'page_classifier': get_page_classifier_settings(),
+            'encryption_fallback': {
+                'pypdf2_max_mb': PYPDF2_ENCRYPT_MAX_BYTES / (1024 * 1024)
+            },
+            'defer_encryption': encryption_stage is not None
+        }
+    interrupted = False
+    try:
+        if backend == 'process':
+            processed_count = process_files_parallel(
+                pdf_files, process_file_in_worker, max_workers,
+                backend='process', initializer=init_process_worker, initargs=(worker_settings,),
+                result_callback=handle_result, schedule=schedule, cost_func=cost_func
+            )
+        else:
+            processed_count = process_files_parallel(
+                pdf_files, process_single_pdf, max_workers,
+                result_callback=handle_result, schedule=schedule, cost_func=cost_func
+            )
+    except BaseException:
+        interrupted = True
+        raise
+    finally:
+        # 等待加密階段完成，各文件的最終狀態和作業結果已在加密完成時報告
+        encryption_failures = 0
+        if encryption_stage is not None:
+            import file_utils
+            encryption_failures = encrypt_utils.finish_encryption_stage(
+                encryption_stage,
+                cancel_pending=interrupted or file_utils.interrupt_received
+            )
+    # 交給加密階段的文件在提取和匹配階段已計為成功，扣除加密失敗的文件
+    processed_count -= encryption_failures
     
     # 計算總運行時間
     end_time = time.time()
@@ -460,6 +1943,18 @@ def process_pdf_files(pdf_files, rule_items, search_location, ori_meta, has_fitz
     time_str += f"{seconds:.2f}秒"
     
     log_message(f"PDF處理完成！總共處理了{processed_count}個文件，耗時{time_str}", level='信息')
+    log_pipeline_stats()
+    extract_values = extract_stats.snapshot()
+    extract_values['wall_seconds'] = total_time
+    log_message(encrypt_utils.format_stage_metrics("提取和匹配", extract_values), level='信息')
+    if encryption_stage is not None:
+        encrypt_summary = encrypt_utils.format_stage_metrics("加密", encryption_stage.summary())
+        log_message(encrypt_summary, level='信息')
+        print(encrypt_summary)
     print(f"\n總共處理了{processed_count}個文件，耗時{time_str}")
+    page_path_summary = format_page_path_stats()
+    if page_path_summary:
+        log_message(f"頁面提取方式: {page_path_summary}", level='信息')
+        print(f"頁面提取方式: {page_path_summary}")
     
     return processed_count
\ No newline at end of file
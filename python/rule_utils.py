@@ -1,16 +1,37 @@
 import re
+from collections import deque
 from log_utils import log_message
 
+# 可選的C實現Aho–Corasick自動機（pyahocorasick），未安裝時使用純Python實現
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# 正則表達式的特殊字符，不包含這些字符的關鍵字視為純文字
+REGEX_METACHARACTERS = set('.^$*+?{}[]\\|()')
+# 合併為一個交替組的正則表達式數量上限
+REGEX_GROUP_SIZE = 50
+# 逐頁匹配時假定正則表達式的單次匹配不超過此長度（字符），跨頁匹配只需重新查找最後這一段文本
+REGEX_PAGE_OVERLAP = 2000
+
 class Rule:
-    def __init__(self, rule_pattern, name, target_type, occurrence, user_pass, owner_pass, user_pass_set, owner_pass_set, encrypt_enable):
+    def __init__(self, rule_pattern, name, target_type, occurrence, user_pass, owner_pass, user_pass_set, owner_pass_set, encrypt_enable, full_scan=False, page_range=None, region=None):
         # 聲明全局變量，必須在使用前聲明
         from input_utils import default_user_password, default_owner_password
         
+        # OCR時只需識別的頁碼範圍和頁面區域，None表示全部頁面／整頁
+        self.page_range = parse_page_range(page_range)
+        self.region = parse_region(region)
+        
         try:
             # 處理正則表達式模式，確保它是有效的
             self.rule_from = re.compile(rule_pattern, re.DOTALL)
+            self.rule_pattern = rule_pattern
             self.name_to = name
             self.target_type = target_type
+            # 是否必須讀完整個文件才能判斷（逐頁匹配模式下不會因其他規則提前停止讀取）
+            self.full_scan = bool(full_scan)
             
             # 確保occurrence_match是整數
             if isinstance(occurrence, int):
@@ -34,15 +55,23 @@ class Rule:
             user_prompt = "開啟密碼已設定" if not user_pass_set else "開啟密碼採用預設密碼"
             owner_prompt = "編輯密碼已設定" if not owner_pass_set else "編輯密碼採用預設密碼"
             pass_prompt = f"（{user_prompt}／{owner_prompt}）" if encrypt_enable else ""
+            scan_prompt = "（需讀取完整文件）" if self.full_scan else ""
+            area_prompt = ""
+            if self.page_range:
+                area_prompt += f"（OCR頁碼：{format_page_range(self.page_range)}）"
+            if self.region:
+                area_prompt += f"（OCR區域：{','.join(f'{v:g}' for v in self.region)}）"
             
             # 將訊息寫入日誌而不是直接打印
-            log_message(f"找：{rule_pattern}的{target_type}，重複出現{self.occurrence_match}次，更名為：{name}{pass_prompt}", level='信息')
+            log_message(f"找：{rule_pattern}的{target_type}，重複出現{self.occurrence_match}次，更名為：{name}{pass_prompt}{scan_prompt}{area_prompt}", level='信息')
         except re.error as e:
             log_message(f"警告: 正則表達式'{rule_pattern}'無效: {e}", level='警告')
             # 設置一個永不匹配的默認正則表達式
             self.rule_from = re.compile(r'a^')  # 這個正則表達式永遠不會匹配任何內容
+            self.rule_pattern = None
             self.name_to = name
             self.target_type = target_type
+            self.full_scan = bool(full_scan)
             self.occurrence_match = 0
             
             # 使用全局默認密碼
@@ -54,8 +83,10 @@ class Rule:
             log_message(f"創建規則時出錯: {e}", level='错误')
             # 設置安全的默認值
             self.rule_from = re.compile(r'a^')
+            self.rule_pattern = None
             self.name_to = name
             self.target_type = target_type
+            self.full_scan = bool(full_scan)
             self.occurrence_match = 0
             
             # 使用全局默認密碼
@@ -70,4 +101,503 @@ class SimpleRule:
         self.priority = priority
         self.rule_type = rule_type
         self.user_pass = user_pass
-        self.owner_pass = owner_pass
\ No newline at end of file
+        self.owner_pass = owner_pass
+
+def is_literal_pattern(pattern):
+    """判斷規則的關鍵字是否為不含正則表達式特殊字符的純文字"""
+    return bool(pattern) and not any(ch in REGEX_METACHARACTERS for ch in pattern)
+
+def parse_page_range(value):
+    """
+    解析頁碼範圍，例如「1」、「1-3」、「1,3-5」、「2-」（第2頁到最後一頁）
+
+    參數:
+        value: 頁碼範圍字符串、已解析的範圍列表或None
+
+    返回:
+        tuple or None: ((起始頁, 結束頁或None), ...)，頁碼從1開始；空值或格式錯誤時返回None
+    """
+    if value is None or isinstance(value, tuple):
+        return value or None
+    if isinstance(value, list):
+        return tuple(tuple(item) for item in value) or None
+    text = str(value).strip()
+    if not text:
+        return None
+    ranges = []
+    try:
+        for part in re.split(r'[,，;；\s]+', text):
+            if not part:
+                continue
+            if '-' in part:
+                start, end = part.split('-', 1)
+                start = int(start) if start.strip() else 1
+                end = int(end) if end.strip() else None
+            else:
+                start = end = int(part)
+            if start < 1 or (end is not None and end < start):
+                raise ValueError(part)
+            ranges.append((start, end))
+    except ValueError:
+        log_message(f"警告: 頁碼範圍'{text}'格式無效，將識別全部頁面", level='警告')
+        return None
+    return tuple(ranges) or None
+
+def format_page_range(page_range):
+    """將parse_page_range的結果格式化為字符串"""
+    parts = []
+    for start, end in page_range:
+        if end is None:
+            parts.append(f"{start}-")
+        elif start == end:
+            parts.append(str(start))
+        else:
+            parts.append(f"{start}-{end}")
+    return ",".join(parts)
+
+def parse_region(value):
+    """
+    解析頁面區域，格式為「左,上,右,下」，以頁面寬高的比例表示（0到1），例如「0,0,1,0.2」表示頁面頂部20%
+
+    參數:
+        value: 區域字符串、四個數字的序列或None
+
+    返回:
+        tuple or None: (左, 上, 右, 下)；空值或格式錯誤時返回None
+    """
+    if value is None:
+        return None
+    if isinstance(value, (tuple, list)):
+        values = list(value)
+    else:
+        text = str(value).strip()
+        if not text:
+            return None
+        values = [v for v in re.split(r'[,，;；\s]+', text) if v]
+    try:
+        x0, y0, x1, y1 = (min(1.0, max(0.0, float(v))) for v in values)
+    except ValueError:
+        log_message(f"警告: 區域'{value}'格式無效，應為「左,上,右,下」四個0到1之間的數字，將識別整頁", level='警告')
+        return None
+    if x1 <= x0 or y1 <= y0:
+        log_message(f"警告: 區域'{value}'的寬度或高度為0，將識別整頁", level='警告')
+        return None
+    return (x0, y0, x1, y1)
+
+def is_valid_regex(pattern):
+    """檢查字符串是否為有效的正則表達式"""
+    try:
+        re.compile(pattern)
+        return True
+    except re.error:
+        return False
+
+def normalize_target_type(target_type):
+    """將規則的目標類型歸類為內容、檔名或元數據（其他類型按內容處理）"""
+    return target_type if target_type in ("檔名", "元數據") else "內容"
+
+def get_rule_regex(rule):
+    """返回規則的已編譯正則表達式（兼容SimpleRule的pattern屬性）"""
+    return re.compile(rule.pattern) if hasattr(rule, 'pattern') else rule.rule_from
+
+def get_rule_occurrence(rule):
+    """返回規則要求的重複次數（兼容SimpleRule的occurrence屬性）"""
+    return int(rule.occurrence) if hasattr(rule, 'occurrence') else rule.occurrence_match
+
+class AhoCorasickAutomaton:
+    """多關鍵字Aho–Corasick自動機，一次掃描文本即可找出所有關鍵字的出現位置"""
+
+    def __init__(self, keywords):
+        self.keywords = list(keywords)
+        if ahocorasick is not None:
+            self._automaton = ahocorasick.Automaton()
+            for index, keyword in enumerate(self.keywords):
+                self._automaton.add_word(keyword, index)
+            self._automaton.make_automaton()
+            return
+
+        self._automaton = None
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for index, keyword in enumerate(self.keywords):
+            state = 0
+            for ch in keyword:
+                next_state = self._goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][ch] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = next_state
+            self._output[state].append(index)
+
+        # 廣度優先建立失敗鏈接
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for ch, next_state in self._goto[state].items():
+                pending.append(next_state)
+                fail_state = self._fail[state]
+                while fail_state and ch not in self._goto[fail_state]:
+                    fail_state = self._fail[fail_state]
+                self._fail[next_state] = self._goto[fail_state].get(ch, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def iter_matches(self, text):
+        """
+        掃描文本
+
+        產出:
+            tuple: (匹配結束位置, 關鍵字索引)，按結束位置排序
+        """
+        if self._automaton is not None:
+            yield from self._automaton.iter(text)
+            return
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        state = 0
+        for position, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for index in output[state]:
+                yield position, index
+
+class RuleScan:
+    """一段文本針對同一目標類型所有規則的匹配次數"""
+
+    def __init__(self, matcher, text):
+        self.matcher = matcher
+        self.text = text
+        self.counts = matcher.count_literals(text)
+        self._group_hits = {}
+
+    def count(self, rule_index):
+        """返回規則在文本中的匹配次數（正則規則在首次查詢時才計算）"""
+        if rule_index not in self.counts:
+            group_index = self.matcher.group_of.get(rule_index)
+            if group_index is not None:
+                if group_index not in self._group_hits:
+                    self._group_hits[group_index] = self.matcher.groups[group_index].search(self.text) is not None
+                if not self._group_hits[group_index]:
+                    # 整個交替組都沒有匹配，組內所有規則的次數都是0
+                    self.counts[rule_index] = 0
+                    return 0
+            self.counts[rule_index] = len(self.matcher.regexes[rule_index].findall(self.text))
+        return self.counts[rule_index]
+
+class IncrementalRuleScan:
+    """
+    逐頁累加的匹配次數：每讀入一頁只掃描新的文本，結果與對目前讀入的全部文本做RuleScan相同
+
+    純文字關鍵字連同上一段文本末尾（最長關鍵字長度減一個字符）一起掃描，跨頁的關鍵字也能找到，
+    只計算結束在新文本中的匹配。正則表達式從上次確定的匹配之後繼續查找：結束位置距文本末尾
+    超過REGEX_PAGE_OVERLAP個字符的匹配不會再因後續頁面而改變，計入確定次數；其餘匹配在下一頁
+    讀入後重新查找。跨頁的單次匹配長於REGEX_PAGE_OVERLAP時，結果可能與完整掃描不同。
+    """
+
+    def __init__(self, matcher, overlap=None):
+        """
+        參數:
+            matcher (TargetMatcher): 目標類型的編譯結果
+            overlap (int): 重新查找正則表達式的文本長度，None表示使用REGEX_PAGE_OVERLAP
+        """
+        self.matcher = matcher
+        self.overlap = max(1, REGEX_PAGE_OVERLAP if overlap is None else overlap)
+        self.length = 0  # 已讀入文本的總長度
+
+        keywords = matcher.automaton.keywords if matcher.automaton is not None else []
+        self._keyword_of = {}
+        for keyword_index, rule_indexes in enumerate(matcher.keyword_rules):
+            for rule_index in rule_indexes:
+                self._keyword_of[rule_index] = keyword_index
+        self._keyword_counts = [0] * len(keywords)
+        self._next_start = [0] * len(keywords)
+        self._tail_size = max((len(keyword) for keyword in keywords), default=1) - 1
+        self._tail = ""
+
+        # 正則表達式查找的文本窗口（從絕對位置_base開始），每條規則的確定次數、未確定次數和下次查找的起點
+        self._window = ""
+        self._base = 0
+        self._settled = dict.fromkeys(matcher.regexes, 0)
+        self._pending = dict.fromkeys(matcher.regexes, 0)
+        self._resume = dict.fromkeys(matcher.regexes, 0)
+        self._group_members = {}
+        for rule_index, group_index in matcher.group_of.items():
+            self._group_members.setdefault(group_index, []).append(rule_index)
+
+    def feed(self, text):
+        """讀入新的一段文本（通常是一頁），更新所有規則的匹配次數"""
+        if not text:
+            return
+        start = self.length
+        self.length += len(text)
+        if self.matcher.automaton is not None:
+            self._feed_literals(text, start)
+        if self.matcher.regexes:
+            self._window += text
+            self._feed_regexes()
+
+    def _feed_literals(self, text, start):
+        keywords = self.matcher.automaton.keywords
+        buffer = self._tail + text
+        buffer_start = start - len(self._tail)
+        for end, keyword_index in self.matcher.automaton.iter_matches(buffer):
+            # 結束在上一段末尾的匹配已經計算過
+            if end < len(self._tail):
+                continue
+            absolute_end = buffer_start + end
+            # 與re.findall相同，同一關鍵字的匹配不重疊
+            if absolute_end - len(keywords[keyword_index]) + 1 >= self._next_start[keyword_index]:
+                self._keyword_counts[keyword_index] += 1
+                self._next_start[keyword_index] = absolute_end + 1
+        self._tail = buffer[len(buffer) - self._tail_size:] if self._tail_size else ""
+
+    def _feed_regexes(self):
+        # 結束位置不超過settle_limit的匹配視為確定
+        settle_limit = self.length - self.overlap
+        group_hits = {}
+        for rule_index, regex in self.matcher.regexes.items():
+            resume = self._resume[rule_index]
+            group_index = self.matcher.group_of.get(rule_index)
+            if group_index is not None:
+                if group_index not in group_hits:
+                    position = min(self._resume[i] for i in self._group_members[group_index])
+                    group_hits[group_index] = self.matcher.groups[group_index].search(self._window, position - self._base) is not None
+                if not group_hits[group_index]:
+                    # 整個交替組在新文本中都沒有匹配
+                    self._pending[rule_index] = 0
+                    self._resume[rule_index] = max(resume, settle_limit)
+                    continue
+            pending = 0
+            first_pending = None
+            for match in regex.finditer(self._window, resume - self._base):
+                match_end = self._base + match.end()
+                if pending == 0 and match_end <= settle_limit:
+                    self._settled[rule_index] += 1
+                    resume = match_end if match.end() > match.start() else match_end + 1
+                else:
+                    if first_pending is None:
+                        first_pending = self._base + match.start()
+                    pending += 1
+            self._pending[rule_index] = pending
+            # 沒有未確定的匹配時，起點之後到settle_limit之間不會再出現新的匹配
+            next_resume = max(resume, settle_limit)
+            self._resume[rule_index] = min(next_resume, first_pending) if first_pending is not None else next_resume
+        # 保留起點之前一段文本作為後顧斷言的上下文，更早的文本不再需要
+        new_base = min(self._resume.values()) - self.overlap
+        if new_base > self._base:
+            self._window = self._window[new_base - self._base:]
+            self._base = new_base
+
+    def count(self, rule_index):
+        """返回規則在已讀入文本中的匹配次數"""
+        if rule_index in self._settled:
+            return self._settled[rule_index] + self._pending[rule_index]
+        keyword_index = self._keyword_of.get(rule_index)
+        return self._keyword_counts[keyword_index] if keyword_index is not None else 0
+
+class TargetMatcher:
+    """同一目標類型（內容、檔名或元數據）所有規則的編譯結果"""
+
+    def __init__(self, indexed_rules):
+        keywords = []
+        self.keyword_rules = []  # 每個關鍵字對應的規則索引列表
+        keyword_index = {}
+        self.regexes = {}
+        self.group_of = {}
+        self.groups = []
+
+        combinable = []
+        for rule_index, rule in indexed_rules:
+            pattern = getattr(rule, 'rule_pattern', None)
+            if not hasattr(rule, 'pattern') and is_literal_pattern(pattern):
+                if pattern not in keyword_index:
+                    keyword_index[pattern] = len(keywords)
+                    keywords.append(pattern)
+                    self.keyword_rules.append([])
+                self.keyword_rules[keyword_index[pattern]].append(rule_index)
+                continue
+            regex = get_rule_regex(rule)
+            self.regexes[rule_index] = regex
+            # 含反向引用或非DOTALL的表達式無法安全合併，單獨匹配
+            if regex.flags & re.DOTALL and not re.search(r'\\\d|\(\?P=', regex.pattern):
+                combinable.append(rule_index)
+
+        self.automaton = AhoCorasickAutomaton(keywords) if keywords else None
+
+        for start in range(0, len(combinable), REGEX_GROUP_SIZE):
+            members = combinable[start:start + REGEX_GROUP_SIZE]
+            try:
+                group = re.compile("|".join(f"(?:{self.regexes[i].pattern})" for i in members), re.DOTALL)
+            except re.error:
+                # 合併失敗（例如重複的命名組），這些規則單獨匹配
+                continue
+            for rule_index in members:
+                self.group_of[rule_index] = len(self.groups)
+            self.groups.append(group)
+
+    def count_literals(self, text):
+        """一次掃描文本，返回所有純文字規則的不重疊匹配次數"""
+        counts = {}
+        if self.automaton is None:
+            return counts
+        keywords = self.automaton.keywords
+        keyword_counts = [0] * len(keywords)
+        next_start = [0] * len(keywords)
+        for end, keyword_index in self.automaton.iter_matches(text):
+            start = end - len(keywords[keyword_index]) + 1
+            # 與re.findall相同，同一關鍵字的匹配不重疊
+            if start >= next_start[keyword_index]:
+                keyword_counts[keyword_index] += 1
+                next_start[keyword_index] = end + 1
+        for keyword_index, rule_indexes in enumerate(self.keyword_rules):
+            for rule_index in rule_indexes:
+                counts[rule_index] = keyword_counts[keyword_index]
+        return counts
+
+class RegionPlan:
+    """
+    OCR區域方案：所有內容規則聲明的頁碼範圍和頁面區域
+
+    每頁只需渲染和識別所有適用規則區域的外接矩形，不屬於任何規則頁碼範圍的頁面可以跳過。
+    """
+
+    def __init__(self, areas):
+        """
+        參數:
+            areas (list): (頁碼範圍, 區域)列表，頁碼範圍為None表示全部頁面，區域為None表示整頁
+        """
+        self.areas = [(page_range, region) for page_range, region in areas]
+
+    @classmethod
+    def from_rules(cls, rules):
+        """
+        根據規則生成區域方案
+
+        參數:
+            rules (list): 規則列表
+
+        返回:
+            RegionPlan or None: 有內容規則既沒有頁碼範圍也沒有區域時需要識別全部頁面的整頁，返回None
+        """
+        areas = []
+        for rule in rules:
+            if normalize_target_type(rule.target_type) != "內容":
+                continue
+            page_range = getattr(rule, 'page_range', None)
+            region = getattr(rule, 'region', None)
+            if page_range is None and region is None:
+                return None
+            areas.append((page_range, region))
+        if not areas:
+            return None
+        return cls(areas)
+
+    @staticmethod
+    def _page_in_range(page_number, page_range):
+        if page_range is None:
+            return True
+        return any(start <= page_number and (end is None or page_number <= end) for start, end in page_range)
+
+    def page_clip(self, page_index):
+        """
+        返回某一頁需要識別的區域
+
+        參數:
+            page_index (int): 從0開始的頁索引
+
+        返回:
+            tuple or None: (左, 上, 右, 下)比例矩形，(0, 0, 1, 1)表示整頁；不需要識別時返回None
+        """
+        clip = None
+        for page_range, region in self.areas:
+            if not self._page_in_range(page_index + 1, page_range):
+                continue
+            region = region or (0.0, 0.0, 1.0, 1.0)
+            if clip is None:
+                clip = region
+            else:
+                clip = (min(clip[0], region[0]), min(clip[1], region[1]), max(clip[2], region[2]), max(clip[3], region[3]))
+        return clip
+
+    def last_page(self):
+        """返回需要識別的最後一頁的頁碼（從1開始），沒有上限時返回None"""
+        last = 0
+        for page_range, _ in self.areas:
+            if page_range is None:
+                return None
+            for _, end in page_range:
+                if end is None:
+                    return None
+                last = max(last, end)
+        return last
+
+    def to_key(self):
+        """返回可序列化為JSON的表示，用於生成提取緩存鍵"""
+        return [[[list(item) for item in page_range] if page_range else None, list(region) if region else None] for page_range, region in self.areas]
+
+class CompiledRuleSet:
+    """
+    從導入的規則一次編譯而成的規則集
+
+    純文字關鍵字放入Aho–Corasick自動機，一次掃描即可得到所有關鍵字的次數；
+    正則表達式合併為交替組作為預篩選，整組沒有匹配時組內規則都不需要再單獨匹配。
+    規則順序和重複次數的判斷與逐條匹配完全相同（第一條達到重複次數的規則勝出）。
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.targets = [normalize_target_type(rule.target_type) for rule in self.rules]
+        self.occurrences = [get_rule_occurrence(rule) for rule in self.rules]
+        self.matchers = {}
+        for target in set(self.targets):
+            indexed_rules = [(i, rule) for i, rule in enumerate(self.rules) if self.targets[i] == target]
+            self.matchers[target] = TargetMatcher(indexed_rules)
+        # OCR時只需識別的頁面和區域，None表示全部頁面的整頁
+        self.region_plan = RegionPlan.from_rules(self.rules)
+
+    def __iter__(self):
+        return iter(self.rules)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def scan(self, target, text):
+        """掃描文本，返回該目標類型的RuleScan"""
+        return RuleScan(self.matchers[target], text)
+
+    def incremental_scan(self, target):
+        """返回該目標類型的IncrementalRuleScan，沒有該目標類型的規則時返回None"""
+        matcher = self.matchers.get(target)
+        return IncrementalRuleScan(matcher) if matcher is not None else None
+
+    def find_first_match(self, get_text, block_on_full_scan=False, scans=None):
+        """
+        按規則順序找出第一條達到重複次數的規則
+
+        參數:
+            get_text (callable): 接收目標類型（內容、檔名、元數據）並返回要匹配文本的函數，
+                                 只在第一條需要該目標類型的規則被評估時調用
+            block_on_full_scan (bool): 遇到未達到次數且需要完整讀取的內容規則時停止並返回None
+            scans (dict): 可選的目標類型到RuleScan或IncrementalRuleScan的映射，已有的目標類型不再掃描，
+                          新掃描的目標類型也會加入其中，供下次調用重用
+
+        返回:
+            規則對象或None
+        """
+        if scans is None:
+            scans = {}
+        for rule_index, rule in enumerate(self.rules):
+            target = self.targets[rule_index]
+            if target not in scans:
+                scans[target] = self.scan(target, get_text(target))
+            count = scans[target].count(rule_index)
+            if count and count >= self.occurrences[rule_index]:
+                return rule
+            if block_on_full_scan and target == "內容" and getattr(rule, 'full_scan', False):
+                return None
+        return None
@@ -0,0 +1,215 @@
+import os
+import re
+import time
+
+from log_utils import log_message
+
+class ChunkRegionPlan:
+    """
+    切割後各文件的OCR區域方案
+
+    規則的頁碼範圍指切割後文件內的頁碼，在原文件上逐頁識別時按每個文件的頁數換算。
+    """
+
+    def __init__(self, region_plan, pages_per_file):
+        self.region_plan = region_plan
+        self.pages_per_file = pages_per_file
+
+    def page_clip(self, page_index):
+        """返回原文件某一頁需要識別的區域，不需要識別時返回None"""
+        return self.region_plan.page_clip(page_index % self.pages_per_file)
+
+def match_chunk_rule(rule_set, chunk_text, chunk_name, metadata):
+    """
+    為一段頁面找出第一條匹配的規則
+
+    參數:
+        rule_set: CompiledRuleSet編譯後的規則集
+        chunk_text (str): 這段頁面的內容
+        chunk_name (str): 這段頁面切割後的默認檔名（不含擴展名）
+        metadata (str): 原文件的元數據
+
+    返回:
+        規則對象或None
+    """
+    def get_text(target):
+        if target == "檔名":
+            return chunk_name
+        elif target == "元數據":
+            return metadata
+        return chunk_text
+    return rule_set.find_first_match(get_text)
+
+def iter_fixed_chunks(page_texts, ranges):
+    """
+    按固定的頁碼範圍把逐頁文本組成一段段頁面
+
+    參數:
+        page_texts (iterator): iter_page_texts產出的(頁索引, 文本)
+        ranges (list): plan_split_ranges返回的分割範圍
+
+    產出:
+        tuple: (文件序號, 起始頁索引, 結束頁索引, 這段頁面的文本)
+    """
+    for index, from_page, to_page in ranges:
+        chunk_text = "".join(next(page_texts)[1] for _ in range(from_page, to_page + 1))
+        yield index, from_page, to_page, chunk_text
+
+def iter_boundary_chunks(page_texts, boundary_regex):
+    """
+    按分界頁把逐頁文本組成一段段頁面：文本符合分界正則表達式的頁面開始一段新頁面
+
+    讀到下一個分界頁時才產出上一段，整個文件只需讀取一次；第一個分界頁之前的頁面自成一段。
+
+    參數:
+        page_texts (iterator): iter_page_texts產出的(頁索引, 文本)
+        boundary_regex (re.Pattern): 分界頁的正則表達式
+
+    產出:
+        tuple: (文件序號, 起始頁索引, 結束頁索引, 這段頁面的文本)
+    """
+    index = 0
+    from_page = 0
+    chunk_pages = []
+    for page_num, page_text in page_texts:
+        if chunk_pages and boundary_regex.search(page_text):
+            index += 1
+            yield index, from_page, page_num - 1, "".join(chunk_pages)
+            chunk_pages = []
+        if not chunk_pages:
+            from_page = page_num
+        chunk_pages.append(page_text)
+    if chunk_pages:
+        index += 1
+        yield index, from_page, from_page + len(chunk_pages) - 1, "".join(chunk_pages)
+
+def write_chunk(doc, from_page, to_page, output_path, passwords=None):
+    """
+    把一段頁面直接保存為最終文件，需要加密時在同一次保存中加密
+
+    參數:
+        doc (fitz.Document): 已打開的原文件
+        from_page (int): 起始頁索引
+        to_page (int): 結束頁索引（包含）
+        output_path (str): 最終文件路徑
+        passwords (tuple): (用戶密碼, 所有者密碼)，None表示不加密
+    """
+    import fitz
+    from pdf_utils import save_pdf_document
+    new_doc = fitz.open()
+    try:
+        new_doc.insert_pdf(doc, from_page=from_page, to_page=to_page)
+        user_pass, owner_pass = passwords if passwords is not None else (None, None)
+        save_pdf_document(new_doc, output_path, user_pass, owner_pass)
+    finally:
+        new_doc.close()
+
+def split_and_rename_pdf(pdf_path, output_dir, pages_per_file, rule_items, has_paddleocr=False, use_ocr=False, remove_whitespace=False, save_ocr_txt=False, default_user_password=None, default_owner_password=None, progress_callback=None, boundary_pattern=None):
+    """
+    切割PDF並按規則命名，不產生中間文件
+
+    只打開原文件一次並逐頁提取文本，每讀完一段頁面就按規則判斷檔名，直接以最終檔名
+    （需要加密時同時加密）保存這段頁面。與先切割再重命名的結果相同：內容規則匹配這段頁面
+    的文本，檔名規則匹配默認的「原檔名-序號」，元數據規則匹配原文件的元數據；沒有匹配
+    任何規則的頁面保存為默認檔名。
+    提供boundary_pattern時不按固定頁數切割，而是在文本符合該正則表達式的頁面開始新文件，
+    切割位置和檔名都在同一次逐頁讀取中決定。
+
+    參數:
+        pdf_path (str): PDF文件路徑
+        output_dir (str): 輸出目錄
+        pages_per_file (int): 每個文件的頁數（按分界頁切割時不使用）
+        rule_items: 規則列表或已編譯的CompiledRuleSet
+        has_paddleocr (bool): 是否有PaddleOCR
+        use_ocr (bool): 是否對所有頁面使用OCR
+        remove_whitespace (bool): 是否去除OCR結果中的空白
+        save_ocr_txt (bool): 是否將OCR結果保存為txt文件
+        default_user_password (str): 默認用戶密碼
+        default_owner_password (str): 默認所有者密碼
+        progress_callback (callable): 每輸出一個文件後調用callback(已完成數, 總數, 文件路徑)，
+                                      按分界頁切割時總數為None
+        boundary_pattern (str or re.Pattern): 分界頁的正則表達式，None表示按固定頁數切割
+
+    返回:
+        list: 每個輸出文件的記錄，包含pages、path、rule、encrypted、error
+    """
+    import fitz
+    import file_utils
+    from file_utils import resolve_rule_passwords, unique_output_path
+    from pdf_utils import iter_page_texts, plan_split_ranges, split_chunk_path, read_document_metadata
+    from rule_utils import CompiledRuleSet
+
+    rule_set = rule_items if isinstance(rule_items, CompiledRuleSet) else CompiledRuleSet(rule_items)
+    if boundary_pattern is not None:
+        boundary_regex = re.compile(boundary_pattern) if isinstance(boundary_pattern, str) else boundary_pattern
+        # 每一頁都要匹配分界正則表達式，需要識別整頁，頁碼範圍也要切割後才知道
+        region_plan = None
+    else:
+        boundary_regex = None
+        region_plan = ChunkRegionPlan(rule_set.region_plan, pages_per_file) if rule_set.region_plan is not None else None
+    records = []
+    start_time = time.time()
+
+    with fitz.open(pdf_path) as doc:
+        metadata = read_document_metadata(doc)
+        page_texts = iter_page_texts(doc, has_paddleocr, force_ocr=use_ocr, remove_whitespace=remove_whitespace, region_plan=region_plan)
+        if boundary_regex is not None:
+            total = None
+            chunks = iter_boundary_chunks(page_texts, boundary_regex)
+            print(f"PDF檔案...一共有{doc.page_count}頁，將在內容符合「{boundary_regex.pattern}」的頁面開始新檔案")
+        else:
+            ranges = plan_split_ranges(doc.page_count, pages_per_file)
+            total = len(ranges)
+            chunks = iter_fixed_chunks(page_texts, ranges)
+            print(f"PDF檔案...一共有{doc.page_count}頁，你最後會得到{total}個檔案")
+
+        try:
+            for index, from_page, to_page, chunk_text in chunks:
+                if file_utils.interrupt_received:
+                    log_message(f"收到中斷信號，停止切割，已輸出 {len(records)} 個文件", level='警告')
+                    break
+                default_path = split_chunk_path(pdf_path, output_dir, index)
+                chunk_name = os.path.splitext(os.path.basename(default_path))[0]
+                record = {'pages': (from_page + 1, to_page + 1), 'path': None, 'rule': None, 'encrypted': False, 'error': None}
+
+                rule = match_chunk_rule(rule_set, chunk_text, chunk_name, metadata)
+                passwords = None
+                if rule is not None:
+                    new_name = rule.name if hasattr(rule, 'name') else rule.name_to
+                    output_path = unique_output_path(output_dir, new_name)
+                    if output_path is None:
+                        output_path = default_path
+                    else:
+                        record['rule'] = new_name
+                        passwords = resolve_rule_passwords(rule, default_user_password, default_owner_password)
+                else:
+                    output_path = default_path
+
+                try:
+                    write_chunk(doc, from_page, to_page, output_path, passwords)
+                    record['path'] = output_path
+                    record['encrypted'] = passwords is not None
+                    log_message(f"第{from_page+1}到{to_page+1}頁已{'加密並' if passwords else ''}保存為: {output_path}")
+                except Exception as e:
+                    record['error'] = str(e)
+                    log_message(f"保存第{from_page+1}到{to_page+1}頁時出錯: {e}", level='错误')
+
+                # 啟用OCR和保存OCR結果時，將這段頁面的OCR文本保存到同名txt文件中
+                if use_ocr and save_ocr_txt and has_paddleocr and chunk_text and record['path']:
+                    txt_path = os.path.splitext(record['path'])[0] + '_ocr.txt'
+                    try:
+                        with open(txt_path, 'w', encoding='utf-8-sig') as f:
+                            f.write(chunk_text)
+                    except Exception as txt_err:
+                        log_message(f"保存OCR結果到文件時出錯: {txt_err}", level='警告')
+
+                records.append(record)
+                if progress_callback is not None:
+                    progress_callback(len(records), total, output_path)
+        finally:
+            chunks.close()
+            page_texts.close()
+
+    matched = sum(1 for record in records if record['rule'])
+    log_message(f"切割並命名完成：輸出 {len(records)} 個文件，其中 {matched} 個按規則命名，耗時 {time.time() - start_time:.2f} 秒", level='信息')
+    return records
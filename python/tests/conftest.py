@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+# 測試直接導入python目錄下的模塊，與main.py的導入方式相同
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def status_db(tmp_path, monkeypatch):
+    """使用臨時文件狀態數據庫，結束時停止狀態寫入線程並關閉連接"""
+    import db_utils
+    monkeypatch.setattr(db_utils, "db_file", str(tmp_path / "status.db"))
+    db_utils.close_all_connections()
+    db_utils.init_database()
+    yield
+    db_utils.stop_status_writer()
+    db_utils.close_all_connections()
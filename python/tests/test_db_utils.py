@@ -0,0 +1,118 @@
+import sqlite3
+
+import db_utils
+
+
+def counts_from_table():
+    """直接掃描文件表得到的各狀態數量，用於核對觸發器維護的計數"""
+    with db_utils.db_connection() as conn:
+        rows = conn.execute("SELECT status, thread IS NOT NULL, COUNT(*) FROM files GROUP BY 1, 2").fetchall()
+    counts = {"pending": 0, "queued": 0, "processing": 0, "completed": 0, "failed": 0}
+    for status, queued, count in rows:
+        if status == 0:
+            counts["queued" if queued else "pending"] += count
+        else:
+            counts[{1: "processing", 2: "completed", 3: "failed"}[status]] += count
+    counts["total"] = sum(counts.values())
+    return counts
+
+
+def test_status_counts_follow_register_upsert_and_delete(status_db):
+    paths = [f"/data/f{i}.pdf" for i in range(6)]
+    assert db_utils.register_files(paths) == 6
+    # 重複登記不改變計數
+    assert db_utils.register_files(paths[:2]) == 0
+    assert db_utils.get_status_counts() == counts_from_table()
+    assert db_utils.get_status_counts()["queued"] == 6
+
+    db_utils.update_file_status(paths[0], 1, "處理中")
+    db_utils.update_file_status(paths[1], 1, "處理中")
+    db_utils.update_file_status(paths[1], 2, "完成")
+    db_utils.update_file_status(paths[2], 3, "失敗")
+    db_utils.update_file_status("/data/new.pdf", 2, "完成")
+    assert db_utils.flush_status_updates()
+    counts = db_utils.get_status_counts()
+    assert counts == counts_from_table()
+    assert (counts["processing"], counts["completed"], counts["failed"], counts["total"]) == (1, 2, 1, 7)
+
+    with db_utils.db_connection() as conn:
+        conn.execute("DELETE FROM files WHERE path = ?", (paths[3],))
+        conn.execute("INSERT OR REPLACE INTO files (path, status, message, thread) VALUES (?, 0, '', NULL)", (paths[2],))
+    counts = db_utils.get_status_counts()
+    assert counts == counts_from_table()
+    assert (counts["pending"], counts["failed"], counts["total"]) == (1, 0, 6)
+
+
+def test_init_database_recounts_existing_rows(status_db):
+    db_utils.register_files(["/data/a.pdf", "/data/b.pdf"])
+    with db_utils.db_connection() as conn:
+        conn.execute("UPDATE status_counts SET count = 99")
+    db_utils.init_database()
+    assert db_utils.get_status_counts() == counts_from_table()
+
+
+def read_row(path):
+    with db_utils.db_connection() as conn:
+        return conn.execute("SELECT status, message, start_time, end_time FROM files WHERE path = ?", (path,)).fetchone()
+
+
+def test_status_writer_merges_updates_per_path(status_db):
+    writer = db_utils.StatusWriter(flush_interval=0.5)
+    try:
+        writer.put(db_utils._make_status_update("/data/a.pdf", 1, "處理中"))
+        writer.put(db_utils._make_status_update("/data/b.pdf", 1, "處理中"))
+        writer.put(db_utils._make_status_update("/data/a.pdf", 2, "完成"))
+        assert writer.flush(5)
+    finally:
+        writer.stop(5)
+    # 同一路徑的多次更新合併為一行，在同一個事務中寫入
+    assert (writer.updates, writer.rows, writer.transactions) == (3, 2, 1)
+    status, message, start_time, end_time = read_row("/data/a.pdf")
+    assert (status, message) == (2, "完成")
+    assert start_time is not None and end_time >= start_time
+    assert read_row("/data/b.pdf")[:2] == (1, "處理中")
+
+
+class FlakyConnection:
+    """前幾次executemany拋出SQLITE_BUSY的連接包裝"""
+
+    def __init__(self, conn, failures):
+        self.conn = conn
+        self.failures = failures
+
+    def __enter__(self):
+        self.conn.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self.conn.__exit__(*exc_info)
+
+    def executemany(self, sql, rows):
+        if self.failures:
+            self.failures -= 1
+            raise sqlite3.OperationalError("database is locked")
+        return self.conn.executemany(sql, rows)
+
+
+def test_status_writer_retries_busy_batches(status_db, monkeypatch):
+    monkeypatch.setattr(db_utils, "STATUS_WRITE_BACKOFF", 0.001)
+    writer = db_utils.StatusWriter()
+    conn = db_utils._open_connection()
+    try:
+        rows = [db_utils._make_status_update("/data/a.pdf", 2, "完成")]
+        assert writer._write(FlakyConnection(conn, db_utils.STATUS_WRITE_RETRIES), rows)
+        assert writer.dropped == 0
+        assert not writer._write(FlakyConnection(conn, db_utils.STATUS_WRITE_RETRIES + 1), rows)
+        assert writer.dropped == 1
+    finally:
+        conn.close()
+        writer.stop(5)
+    assert read_row("/data/a.pdf")[0] == 2
+
+
+def test_flush_reports_dropped_updates(status_db, monkeypatch):
+    monkeypatch.setattr(db_utils, "STATUS_WRITE_BACKOFF", 0.001)
+    monkeypatch.setattr(db_utils, "STATUS_UPSERT_SQL", "INSERT INTO missing_table VALUES (:path)")
+    db_utils.update_file_status("/data/a.pdf", 2, "完成")
+    assert not db_utils.flush_status_updates(5)
+    assert db_utils.get_status_writer().dropped == 1
@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+import db_utils
+import pdf_utils
+from encrypt_utils import EncryptionStage, finish_encryption_stage
+
+
+def make_pdf(path, text):
+    fitz = pytest.importorskip("fitz")
+    with fitz.open() as doc:
+        doc.new_page().insert_text((72, 72), text)
+        doc.save(str(path))
+    return str(path)
+
+
+def file_status(path):
+    return db_utils.get_file_status(path)["status"]
+
+
+def pdf_names(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(".pdf"))
+
+
+def test_stage_encrypts_and_reports_when_done(tmp_path, status_db):
+    fitz = pytest.importorskip("fitz")
+    first = make_pdf(tmp_path / "a.pdf", "first")
+    second = make_pdf(tmp_path / "b.pdf", "second")
+    results = {}
+    stage = EncryptionStage(1, 1, has_fitz=True, result_callback=lambda path, record: results.__setitem__(path, record))
+
+    # 同名的兩個文件各自佔用不同的檔名
+    assert stage.submit(first, str(tmp_path), "R1", b"user", b"owner") == str(tmp_path / "R1.pdf")
+    assert stage.submit(second, str(tmp_path), "R1", b"user", b"owner") == str(tmp_path / "R1_1.pdf")
+    assert finish_encryption_stage(stage) == 0
+
+    # 加密成功後原文件被刪除
+    assert pdf_names(tmp_path) == ["R1.pdf", "R1_1.pdf"]
+    assert results[first]["success"] and results[first]["new_path"] == str(tmp_path / "R1.pdf")
+    assert results[second]["success"] and results[second]["new_path"] == str(tmp_path / "R1_1.pdf")
+    assert file_status(first) == 2
+    with fitz.open(str(tmp_path / "R1_1.pdf")) as saved:
+        assert saved.needs_pass and saved.authenticate("user")
+        assert "second" in saved[0].get_text()
+    assert stage.summary()["items"] == 2
+
+
+def test_stage_failure_keeps_original_and_releases_name(tmp_path, status_db, monkeypatch):
+    original = make_pdf(tmp_path / "a.pdf", "first")
+    results = {}
+    # 沒有可用的加密庫時加密失敗
+    monkeypatch.setattr(pdf_utils, "PYPDF2_ENCRYPT_MAX_BYTES", 1)
+    stage = EncryptionStage(1, 1, has_pypdf2=True, result_callback=lambda path, record: results.__setitem__(path, record))
+
+    assert stage.submit(original, str(tmp_path), "R1", b"user", b"owner") == str(tmp_path / "R1.pdf")
+    assert finish_encryption_stage(stage) == 1
+
+    # 原文件保持不變，佔位文件被刪除
+    assert pdf_names(tmp_path) == ["a.pdf"]
+    assert not results[original]["success"] and results[original]["error"]
+    assert file_status(original) == 3
@@ -0,0 +1,68 @@
+import os
+import threading
+
+import pytest
+
+from file_utils import release_output_path, reserve_output_path
+from pdf_utils import save_pdf_document
+
+
+def test_reserve_output_path_skips_existing_names(tmp_path):
+    (tmp_path / "R1.pdf").write_bytes(b"existing")
+    first = reserve_output_path(str(tmp_path), "R1")
+    second = reserve_output_path(str(tmp_path), "R1")
+
+    assert [os.path.basename(first), os.path.basename(second)] == ["R1_1.pdf", "R1_2.pdf"]
+    # 佔位文件立即建立，已存在的文件不被覆蓋
+    assert os.path.getsize(first) == 0
+    assert (tmp_path / "R1.pdf").read_bytes() == b"existing"
+
+
+def test_reserve_output_path_is_unique_across_threads(tmp_path):
+    barrier = threading.Barrier(16)
+    reserved = []
+
+    def reserve():
+        barrier.wait()
+        reserved.append(reserve_output_path(str(tmp_path), "R1"))
+
+    threads = [threading.Thread(target=reserve) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert None not in reserved
+    assert len(set(reserved)) == 16
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(path) for path in reserved)
+
+
+def test_reserve_output_path_gives_up_after_max_attempts(tmp_path):
+    for name in ("R1.pdf", "R1_1.pdf", "R1_2.pdf"):
+        (tmp_path / name).write_bytes(b"x")
+    assert reserve_output_path(str(tmp_path), "R1", max_attempts=3) is None
+
+
+def test_release_output_path_only_removes_empty_placeholders(tmp_path):
+    placeholder = reserve_output_path(str(tmp_path), "R1")
+    release_output_path(placeholder)
+    assert not os.path.exists(placeholder)
+
+    written = tmp_path / "R2.pdf"
+    written.write_bytes(b"%PDF-1.4")
+    release_output_path(str(written))
+    assert written.exists()
+
+
+def test_save_pdf_document_replaces_placeholder_with_encrypted_file(tmp_path):
+    fitz = pytest.importorskip("fitz")
+    output_path = reserve_output_path(str(tmp_path), "R1")
+    with fitz.open() as doc:
+        doc.new_page().insert_text((72, 72), "hello")
+        save_pdf_document(doc, output_path, b"user", b"owner")
+
+    assert os.listdir(tmp_path) == ["R1.pdf"]
+    with fitz.open(output_path) as saved:
+        assert saved.needs_pass
+        assert saved.authenticate("user")
+        assert "hello" in saved[0].get_text()
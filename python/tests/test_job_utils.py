@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+from job_utils import JobStore
+
+
+@pytest.fixture
+def job_store(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    yield store
+    store.close()
+
+
+def make_file(path, content=b"%PDF-1.4"):
+    with open(path, "wb") as f:
+        f.write(content)
+    return str(path)
+
+
+def test_iter_resume_files_classification(tmp_path, job_store):
+    job_id = job_store.create_job(str(tmp_path), "hash", {})
+
+    renamed = make_file(tmp_path / "renamed.pdf")
+    renamed_output = make_file(tmp_path / "R1.pdf")
+    lost_output = make_file(tmp_path / "lost.pdf")
+    placeholder = make_file(tmp_path / "placeholder.pdf")
+    make_file(tmp_path / "R3.pdf", b"")
+    gone = str(tmp_path / "gone.pdf")
+    no_match = make_file(tmp_path / "no_match.pdf")
+    failed = make_file(tmp_path / "failed.pdf")
+    interrupted = make_file(tmp_path / "interrupted.pdf")
+    new = make_file(tmp_path / "new.pdf")
+
+    job_store.add_files(job_id, [renamed, lost_output, placeholder, gone, no_match, failed, interrupted])
+    job_store.record_result(job_id, renamed, {"success": True, "new_path": renamed_output, "elapsed": 1.5})
+    job_store.record_result(job_id, lost_output, {"success": True, "new_path": str(tmp_path / "R2.pdf")})
+    job_store.record_result(job_id, placeholder, {"success": True, "new_path": str(tmp_path / "R3.pdf")})
+    job_store.record_result(job_id, gone, {"success": True, "new_path": str(tmp_path / "R4.pdf")})
+    job_store.record_result(job_id, no_match, {"success": False, "elapsed": 0.5})
+    job_store.record_result(job_id, failed, {"success": False, "error": "boom"})
+    job_store.record_result(job_id, interrupted, {"success": False, "interrupted": True})
+
+    discovered = [renamed_output, str(tmp_path / "R3.pdf"), renamed, lost_output, placeholder,
+                  no_match, failed, interrupted, new]
+    summary = {}
+    resumed = list(job_store.iter_resume_files(job_id, discovered, summary))
+
+    # 已完成且輸出仍在的文件、本作業產生的輸出文件都不再處理；空的佔位文件不算已完成
+    assert resumed == [lost_output, placeholder, failed, interrupted, new]
+    assert summary == {
+        "skipped": 2, "skipped_seconds": 2.0, "failed": 1, "pending": 1,
+        "new": 1, "redo": 2, "missing": 1,
+    }
+    assert os.path.exists(renamed_output)
@@ -0,0 +1,76 @@
+import random
+import re
+
+from rule_utils import AhoCorasickAutomaton, CompiledRuleSet, Rule
+
+
+def make_rule(pattern, name, occurrence=1, target_type="內容"):
+    return Rule(pattern, name, target_type, occurrence, "", "", True, True, False)
+
+
+def random_text(rng, alphabet, length):
+    return "".join(rng.choice(alphabet) for _ in range(length))
+
+
+def test_iter_matches_reports_every_keyword_end():
+    keywords = ["he", "she", "his", "hers"]
+    text = "ushers and his sheep"
+    automaton = AhoCorasickAutomaton(keywords)
+    expected = sorted(
+        (match.start() + len(keyword) - 1, index)
+        for index, keyword in enumerate(keywords)
+        for match in re.finditer(f"(?={re.escape(keyword)})", text)
+    )
+    assert sorted(automaton.iter_matches(text)) == expected
+
+
+def test_literal_counts_match_findall():
+    rng = random.Random(4)
+    for _ in range(200):
+        keywords = list({random_text(rng, "ab", rng.randint(1, 4)) for _ in range(rng.randint(1, 6))})
+        rule_set = CompiledRuleSet([make_rule(keyword, f"R{i}") for i, keyword in enumerate(keywords)])
+        text = random_text(rng, "abc", rng.randint(0, 60))
+        scan = rule_set.scan("內容", text)
+        for index, keyword in enumerate(keywords):
+            # 與re.findall相同，同一關鍵字的匹配不重疊
+            assert scan.count(index) == len(re.findall(re.escape(keyword), text)), (keyword, text)
+
+
+def test_first_match_follows_rule_order_and_occurrence():
+    rules = [
+        make_rule("foo", "needs_two_foo", occurrence=2),
+        make_rule(r"ba+r", "regex_bar"),
+        make_rule("foo", "one_foo"),
+    ]
+    rule_set = CompiledRuleSet(rules)
+    assert rule_set.find_first_match(lambda target: "foo baar").name_to == "regex_bar"
+    assert rule_set.find_first_match(lambda target: "foo foo baar").name_to == "needs_two_foo"
+    assert rule_set.find_first_match(lambda target: "foo").name_to == "one_foo"
+    assert rule_set.find_first_match(lambda target: "nothing here") is None
+
+
+def test_first_match_agrees_with_sequential_evaluation():
+    rng = random.Random(7)
+    for _ in range(200):
+        rules = []
+        for i in range(rng.randint(1, 6)):
+            pattern = random_text(rng, "ab", rng.randint(1, 3))
+            if rng.random() < 0.3:
+                pattern += "+"
+            rules.append(make_rule(pattern, f"R{i}", occurrence=rng.randint(1, 3)))
+        text = random_text(rng, "abc", rng.randint(0, 40))
+        expected = next(
+            (rule for rule in rules if len(rule.rule_from.findall(text)) >= rule.occurrence_match), None
+        )
+        assert CompiledRuleSet(rules).find_first_match(lambda target: text) is expected
+
+
+def test_incremental_scan_matches_full_scan_across_pages():
+    rules = [make_rule("abc", "literal", occurrence=2), make_rule(r"c\s*d+", "regex", occurrence=2)]
+    rule_set = CompiledRuleSet(rules)
+    pages = ["xxab", "cyyc", "ddab", "c"]
+    scan = rule_set.incremental_scan("內容")
+    for page_number in range(len(pages)):
+        scan.feed(pages[page_number])
+        full = rule_set.scan("內容", "".join(pages[:page_number + 1]))
+        assert [scan.count(i) for i in range(len(rules))] == [full.count(i) for i in range(len(rules))]
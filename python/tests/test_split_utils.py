@@ -0,0 +1,73 @@
+import re
+
+from pdf_utils import plan_split_ranges
+from rule_utils import CompiledRuleSet, Rule
+from split_utils import ChunkRegionPlan, iter_boundary_chunks, iter_fixed_chunks, match_chunk_rule
+
+
+def iter_pages(texts, pulled):
+    """模擬iter_page_texts，記錄已讀取的頁索引"""
+    for page_num, text in enumerate(texts):
+        pulled.append(page_num)
+        yield page_num, text
+
+
+def test_plan_split_ranges_covers_every_page_once():
+    assert plan_split_ranges(7, 3) == [(1, 0, 2), (2, 3, 5), (3, 6, 6)]
+    assert plan_split_ranges(6, 3) == [(1, 0, 2), (2, 3, 5)]
+    assert plan_split_ranges(0, 3) == []
+
+
+def test_chunk_region_plan_maps_pages_into_each_output_file():
+    class FirstPageOnly:
+        def page_clip(self, page_index):
+            return (0.0, 0.0, 1.0, 0.5) if page_index == 0 else None
+
+    plan = ChunkRegionPlan(FirstPageOnly(), 3)
+    assert [plan.page_clip(i) is not None for i in range(7)] == [True, False, False, True, False, False, True]
+
+
+def test_match_chunk_rule_uses_chunk_text_name_and_metadata():
+    rules = [
+        Rule("INVOICE", "by_content", "內容", 1, "", "", True, True, False),
+        Rule("_2$", "by_name", "檔名", 1, "", "", True, True, False),
+        Rule("Scanner", "by_metadata", "元數據", 1, "", "", True, True, False),
+    ]
+    rule_set = CompiledRuleSet(rules)
+    assert match_chunk_rule(rule_set, "INVOICE 12", "doc_2", "").name_to == "by_content"
+    assert match_chunk_rule(rule_set, "letter", "doc_2", "").name_to == "by_name"
+    assert match_chunk_rule(rule_set, "letter", "doc_1", "Producer: Scanner").name_to == "by_metadata"
+    assert match_chunk_rule(rule_set, "letter", "doc_1", "") is None
+
+
+def test_fixed_chunks_read_each_page_once_in_order():
+    texts = [f"p{i}|" for i in range(7)]
+    pulled = []
+    chunks = iter_fixed_chunks(iter_pages(texts, pulled), plan_split_ranges(len(texts), 3))
+
+    assert next(chunks) == (1, 0, 2, "p0|p1|p2|")
+    # 產出一段時只讀到這段的最後一頁
+    assert pulled == [0, 1, 2]
+    assert list(chunks) == [(2, 3, 5, "p3|p4|p5|"), (3, 6, 6, "p6|")]
+    assert pulled == list(range(7))
+
+
+def test_boundary_chunks_start_at_each_boundary_page():
+    texts = ["intro|", "COVER A|", "a2|", "a3|", "COVER B|", "b2|"]
+    pulled = []
+    chunks = iter_boundary_chunks(iter_pages(texts, pulled), re.compile(r"^COVER"))
+
+    # 第一個分界頁之前的頁面自成一段，讀到分界頁時才產出
+    assert next(chunks) == (1, 0, 0, "intro|")
+    assert pulled == [0, 1]
+    assert next(chunks) == (2, 1, 3, "COVER A|a2|a3|")
+    assert pulled == [0, 1, 2, 3, 4]
+    assert list(chunks) == [(3, 4, 5, "COVER B|b2|")]
+
+
+def test_boundary_chunks_edge_cases():
+    cover = re.compile("COVER")
+    assert list(iter_boundary_chunks(iter_pages(["COVER|", "x|"], []), cover)) == [(1, 0, 1, "COVER|x|")]
+    assert list(iter_boundary_chunks(iter_pages(["COVER|", "COVER|"], []), cover)) == [(1, 0, 0, "COVER|"), (2, 1, 1, "COVER|")]
+    assert list(iter_boundary_chunks(iter_pages(["a|", "b|"], []), cover)) == [(1, 0, 1, "a|b|")]
+    assert list(iter_boundary_chunks(iter_pages([], []), cover)) == []
@@ -0,0 +1,55 @@
+import threading
+import time
+
+import file_utils
+import worker_utils
+
+
+def test_submission_window_bounds_files_pulled_ahead(status_db, monkeypatch):
+    monkeypatch.setattr(worker_utils, "SUBMIT_CHUNK_SIZE", 2)
+    monkeypatch.setattr(worker_utils, "SUBMIT_WINDOW_FACTOR", 2)
+    max_workers = 2
+    window_size = max_workers * worker_utils.SUBMIT_WINDOW_FACTOR
+    lock = threading.Lock()
+    pulled = 0
+    finished = 0
+    ahead = []
+
+    def discover():
+        nonlocal pulled
+        for i in range(40):
+            with lock:
+                pulled += 1
+            yield f"/data/f{i}.pdf"
+
+    def process(file_path):
+        nonlocal finished
+        with lock:
+            ahead.append(pulled - finished)
+        time.sleep(0.002)
+        with lock:
+            finished += 1
+        return {"success": True, "error": None}
+
+    assert worker_utils.process_files_parallel(discover(), process, max_workers) == 40
+    # 從迭代器取出但尚未完成的文件不超過窗口大小加上一次取出的數量
+    assert max(ahead) <= window_size + worker_utils.SUBMIT_CHUNK_SIZE
+
+
+def test_interrupt_stops_pulling_new_files(status_db, monkeypatch):
+    monkeypatch.setattr(worker_utils, "SUBMIT_CHUNK_SIZE", 2)
+    monkeypatch.setattr(worker_utils, "SUBMIT_WINDOW_FACTOR", 1)
+    monkeypatch.setattr(file_utils, "interrupt_received", False)
+    pulled = []
+
+    def discover():
+        for i in range(100):
+            pulled.append(i)
+            yield f"/data/f{i}.pdf"
+
+    def process(file_path):
+        file_utils.interrupt_received = True
+        return {"success": True, "error": None}
+
+    worker_utils.process_files_parallel(discover(), process, 1)
+    assert len(pulled) <= 2 * worker_utils.SUBMIT_CHUNK_SIZE
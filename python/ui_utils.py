@@ -2,9 +2,8 @@ import os
 import threading
 import time
 import shutil
-import sqlite3
 
-from db_utils import db_connection
+from db_utils import get_status_counts, get_files_by_status
 from log_utils import log_message
 from worker_utils import get_worker_status, wait_for_ui_update
 
@@ -38,76 +37,66 @@ def display_files_status():
     files_per_line = max(1, terminal_width // 30)  # 假設每個文件名平均30個字符
     
     try:
-        # 按狀態分類文件
-        pending_files = []
-        processing_files = []
-        failed_files = []
-        completed_files = []
-        
-        with db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT path, status, message FROM files')
-            for row in cursor.fetchall():
-                path, status, message = row
-                file_name = os.path.basename(path)
-                if status == 0:  # 待處理
-                    pending_files.append(f"\033[90m{file_name}\033[0m")  # 深灰色
-                elif status == 1:  # 處理中
-                    processing_files.append(f"\033[93m{file_name}\033[0m")  # 黃色
-                elif status == 2:  # 已處理成功
-                    completed_files.append(f"\033[92m{file_name}\033[0m")  # 綠色
-                elif status == 3:  # 處理失敗
-                    failed_files.append(f"\033[91m{file_name} ({message})\033[0m")  # 紅色
-        
-        # 計算統計信息
-        pending = len(pending_files)
-        processing = len(processing_files)
-        failed = len(failed_files)
-        completed = len(completed_files)
-        total = pending + processing + completed + failed
-        
         # 計算可用的顯示行數 (保留一些行給統計信息和進度條)
         available_lines = terminal_size.lines - 15  # 預留行給標題、統計和進度條
         max_files_per_category = available_lines // 3  # 每個類別最多顯示的行數
+        limit = max(0, max_files_per_category * files_per_line)
+        
+        # 各狀態數量來自計數表，文件列表只查詢屏幕能顯示的數量
+        counts = get_status_counts()
+        pending = counts['pending'] + counts['queued']
+        processing = counts['processing']
+        failed = counts['failed']
+        completed = counts['completed']
+        total = counts['total']
+        
+        pending_files = [f"\033[90m{os.path.basename(path)}\033[0m"  # 深灰色
+                         for path, message, thread in get_files_by_status(0, limit)]
+        processing_files = [f"\033[93m{os.path.basename(path)}\033[0m"  # 黃色
+                            for path, message, thread in get_files_by_status(1, limit)]
+        completed_files = [f"\033[92m{os.path.basename(path)}\033[0m"  # 綠色
+                           for path, message, thread in get_files_by_status(2, limit, recent_first=True)]
+        failed_files = [f"\033[91m{os.path.basename(path)} ({message})\033[0m"  # 紅色
+                        for path, message, thread in get_files_by_status(3, limit, recent_first=True)]
         
         # 顯示處理中的文件 (優先顯示)
         if processing_files:
             print("處理中:")
-            for i in range(0, min(len(processing_files), max_files_per_category * files_per_line), files_per_line):
+            for i in range(0, len(processing_files), files_per_line):
                 end_idx = min(i + files_per_line, len(processing_files))
                 print(" ".join(processing_files[i:end_idx]))
-            if len(processing_files) > max_files_per_category * files_per_line:
-                print(f"...等 {len(processing_files) - max_files_per_category * files_per_line} 個處理中的檔案")
+            if processing > len(processing_files):
+                print(f"...等 {processing - len(processing_files)} 個處理中的檔案")
             print()
         
         # 顯示失敗的文件
         if failed_files:
             print("處理失敗:")
-            for i in range(0, min(len(failed_files), max_files_per_category * files_per_line), files_per_line):
+            for i in range(0, len(failed_files), files_per_line):
                 end_idx = min(i + files_per_line, len(failed_files))
                 print(" ".join(failed_files[i:end_idx]))
-            if len(failed_files) > max_files_per_category * files_per_line:
-                print(f"...等 {len(failed_files) - max_files_per_category * files_per_line} 個失敗的檔案")
+            if failed > len(failed_files):
+                print(f"...等 {failed - len(failed_files)} 個失敗的檔案")
             print()
         
         # 顯示待處理的文件
         if pending_files:
             print("待處理:")
-            for i in range(0, min(len(pending_files), max_files_per_category * files_per_line), files_per_line):
+            for i in range(0, len(pending_files), files_per_line):
                 end_idx = min(i + files_per_line, len(pending_files))
                 print(" ".join(pending_files[i:end_idx]))
-            if len(pending_files) > max_files_per_category * files_per_line:
-                print(f"...等 {len(pending_files) - max_files_per_category * files_per_line} 個待處理的檔案")
+            if pending > len(pending_files):
+                print(f"...等 {pending - len(pending_files)} 個待處理的檔案")
             print()
         
         # 顯示已完成的文件（如果有空間）
         if completed_files and available_lines > 0:
             print("已完成:")
-            for i in range(0, min(len(completed_files), max_files_per_category * files_per_line), files_per_line):
+            for i in range(0, len(completed_files), files_per_line):
                 end_idx = min(i + files_per_line, len(completed_files))
                 print(" ".join(completed_files[i:end_idx]))
-            if len(completed_files) > max_files_per_category * files_per_line:
-                print(f"...等 {len(completed_files) - max_files_per_category * files_per_line} 個已完成的檔案")
+            if completed > len(completed_files):
+                print(f"...等 {completed - len(completed_files)} 個已完成的檔案")
             print()
         
         print(f"統計: 總計 {total} 個檔案, 已完成 {completed}, 處理中 {processing}, 待處理 {pending}, 失敗 {failed}\n")
@@ -1,57 +1,98 @@
 import os
 import threading
 import concurrent.futures
-import queue
 import time
+import itertools
+import collections
+import heapq
 from contextlib import contextmanager
 
-from db_utils import db_connection, update_file_status, get_pending_files, add_files_to_database
+from db_utils import db_connection, update_file_status, get_pending_files, register_files, flush_status_updates
 from log_utils import log_message
 
 # 全局變量
 worker_status = {}
 worker_lock = threading.Lock()
-result_queue = queue.Queue()
 ui_update_event = threading.Event()
+# 工作進程中用於通知主進程「已開始處理某個文件」的隊列，由_init_worker_process設置
+_start_queue = None
+# 從文件迭代器每次取出並登記的文件數
+SUBMIT_CHUNK_SIZE = 64
+# 同時提交到工作池的任務數上限為工作數的倍數，其餘文件留在迭代器中，內存佔用與文件總數無關
+SUBMIT_WINDOW_FACTOR = 4
+# 調度方式：'discovery'按發現順序處理；'lpt'按預估耗時從長到短處理（最長處理時間優先），
+# 避免最後才發現的大文件讓一個工作者長時間獨自運行
+SCHEDULE_MODES = ('discovery', 'lpt')
+# 預估處理耗時的參數（秒）
+COST_FILE_SECONDS = 0.05  # 每個文件的固定開銷（打開、匹配規則、重命名）
+COST_TEXT_PAGE_SECONDS = 0.01  # 有文本層的頁面每頁提取耗時
+COST_OCR_PAGE_SECONDS = 1.5  # 需要OCR的頁面每頁耗時
+COST_BYTES_PER_PAGE = 100 * 1024  # 無法讀取頁數時按文件大小估算頁數
+SCANNED_BYTES_PER_PAGE = 150 * 1024  # 平均每頁超過此大小的文件視為掃描件，預計需要OCR
+# 預估耗時時並行讀取文件頁數的線程數
+COST_ESTIMATE_WORKERS = 8
 
-@contextmanager
-def worker_context(max_workers=None):
+def resolve_max_workers(max_workers=None, backend='thread'):
     """
-    創建和管理工作線程池的上下文管理器
+    確定工作池的大小
     
     參數:
-        max_workers (int): 最大工作線程數，默認為None（使用CPU核心數）
+        max_workers (int): 用戶設置的工作數，默認為None（使用CPU核心數）
+        backend (str): 'thread'或'process'
         
     返回:
-        concurrent.futures.ThreadPoolExecutor: 線程池執行器
+        int: 實際使用的工作數
     """
+    import multiprocessing
+    cpu_count = multiprocessing.cpu_count()
+    
     # 如果未指定最大工作線程數，則使用CPU核心數
     if max_workers is None:
-        import multiprocessing
-        max_workers = multiprocessing.cpu_count()
+        max_workers = cpu_count
     
     # 設置一個合理的線程數上限，避免線程過多導致程序崩潰
     # 建議線程數不超過CPU核心數的2倍，且不超過16個線程
-    import multiprocessing
-    cpu_count = multiprocessing.cpu_count()
-    max_recommended = min(cpu_count * 2, 16)
+    # 進程池不受GIL限制，上限為CPU核心數
+    max_recommended = cpu_count if backend == 'process' else min(cpu_count * 2, 16)
     
     # 如果用戶設置的線程數超過建議值，則使用建議值
     if max_workers > max_recommended:
         log_message(f"警告: 設置的線程數 {max_workers} 過多，已自動調整為 {max_recommended}", level='警告')
         max_workers = max_recommended
+    return max(1, max_workers)
+
+@contextmanager
+def worker_context(max_workers=None, backend='thread', initializer=None, initargs=()):
+    """
+    創建和管理工作池的上下文管理器
+    
+    參數:
+        max_workers (int): 最大工作線程數，默認為None（使用CPU核心數）
+        backend (str): 'thread'使用線程池，'process'使用進程池（每個進程獨立初始化PDF庫和OCR模型）
+        initializer (callable): 每個工作進程啟動時調用一次的初始化函數（僅進程池使用）
+        initargs (tuple): 傳遞給初始化函數的參數
+        
+    返回:
+        concurrent.futures.Executor: 線程池或進程池執行器
+    """
+    max_workers = resolve_max_workers(max_workers, backend)
     
-    # 創建線程池
-    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    # 創建線程池或進程池
+    if backend == 'process':
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, initializer=initializer, initargs=initargs)
+        pool_name = "工作進程池"
+    else:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        pool_name = "工作線程池"
     try:
-        log_message(f"已創建工作線程池，最大線程數: {max_workers}", level='信息')
+        log_message(f"已創建{pool_name}，最大工作數: {max_workers}", level='信息')
         yield executor
     finally:
-        # 關閉線程池
+        # 關閉工作池
         executor.shutdown(wait=True)
-        log_message("工作線程池已關閉", level='信息')
+        log_message(f"{pool_name}已關閉", level='信息')
 
-def update_worker_status(file_path, status, message=None, thread_id=None):
+def update_worker_status(file_path, status, message=None, thread_id=None, start_time=None):
     """
     更新工作線程狀態
     
@@ -60,6 +101,7 @@ def update_worker_status(file_path, status, message=None, thread_id=None):
         status (int): 狀態碼 (0: 等待, 1: 處理中, 2: 完成, 3: 失敗)
         message (str): 狀態消息
         thread_id (int): 線程ID
+        start_time (float): 實際開始處理的時間，工作進程中開始處理的文件由主進程代為記錄時提供
     """
     global worker_status, worker_lock, ui_update_event
     
@@ -91,9 +133,15 @@ def update_worker_status(file_path, status, message=None, thread_id=None):
         
         # 更新時間戳
         if status == 1 and worker_status[file_path]['start_time'] is None:  # 開始處理
-            worker_status[file_path]['start_time'] = current_time
+            worker_status[file_path]['start_time'] = start_time or current_time
         elif status in [2, 3]:  # 完成或失敗
             worker_status[file_path]['end_time'] = current_time
+        
+        start_time = worker_status[file_path]['start_time'] if status == 1 else start_time
+        end_time = worker_status[file_path]['end_time'] if status in [2, 3] else None
+        # 已完成或失敗的文件不再保留在內存中（狀態已寫入數據庫），內存佔用只與進行中的文件數有關
+        if status in [2, 3]:
+            del worker_status[file_path]
     
     # 將狀態更新到數據庫
     try:
@@ -103,8 +151,8 @@ def update_worker_status(file_path, status, message=None, thread_id=None):
             status, 
             message, 
             thread_id, 
-            worker_status[file_path]['start_time'] if status == 1 else None, 
-            worker_status[file_path]['end_time'] if status in [2, 3] else None
+            start_time, 
+            end_time
         )
     except Exception as e:
         log_message(f"更新數據庫狀態時出錯: {e}", level='警告')
@@ -112,6 +160,56 @@ def update_worker_status(file_path, status, message=None, thread_id=None):
     # 通知UI線程更新
     ui_update_event.set()
 
+def _init_worker_process(start_queue, initializer=None, initargs=()):
+    """
+    工作進程初始化：保存開始處理通知隊列後調用原有的初始化函數
+    
+    參數:
+        start_queue (multiprocessing.Queue): 開始處理通知隊列
+        initializer (callable): 原有的工作進程初始化函數
+        initargs (tuple): 傳遞給初始化函數的參數
+    """
+    global _start_queue
+    _start_queue = start_queue
+    if initializer is not None:
+        initializer(*initargs)
+
+def _run_in_worker_process(process_func, file_path, *args, **kwargs):
+    """
+    在工作進程中處理文件：真正開始處理時通知主進程，再調用處理函數
+    
+    返回:
+        處理函數的返回值
+    """
+    if _start_queue is not None:
+        try:
+            _start_queue.put((file_path, os.getpid(), time.time()))
+        except Exception:
+            pass
+    return process_func(file_path, *args, **kwargs)
+
+def _apply_start_messages(start_queue, in_flight_paths):
+    """
+    把工作進程的開始處理通知更新為處理中狀態
+    
+    已經取回結果的文件不再更新，避免遲到的通知把已完成的文件改回處理中。
+    
+    參數:
+        start_queue (multiprocessing.Queue): 開始處理通知隊列
+        in_flight_paths (set): 已提交但尚未取回結果的文件路徑
+    """
+    import queue
+    while True:
+        try:
+            file_path, pid, started = start_queue.get_nowait()
+        except queue.Empty:
+            return
+        except Exception as e:
+            log_message(f"讀取工作進程通知時出錯: {e}", level='警告')
+            return
+        if file_path in in_flight_paths:
+            update_worker_status(file_path, 1, "處理中", pid, start_time=started)
+
 def process_file_worker(file_path, process_func, *args, **kwargs):
     """
     工作線程處理文件的包裝函數
@@ -134,11 +232,16 @@ def process_file_worker(file_path, process_func, *args, **kwargs):
         # 調用處理函數
         result = process_func(file_path, *args, **kwargs)
         
-        # 更新狀態為完成
-        update_worker_status(file_path, 2, "處理完成", thread_id)
-        
-        # 將結果放入結果隊列
-        result_queue.put((file_path, True, result))
+        # 處理函數返回結果記錄時，按記錄更新為失敗或因中斷而仍在等待，否則更新為完成
+        if isinstance(result, dict) and result.get('error'):
+            update_worker_status(file_path, 3, f"處理失敗: {result['error']}", thread_id)
+        elif isinstance(result, dict) and result.get('interrupted'):
+            update_worker_status(file_path, 0, "收到中斷信號，未處理", thread_id)
+        elif isinstance(result, dict) and result.get('encrypt_pending'):
+            # 已交給加密階段，狀態由加密階段在提交時和加密完成時更新
+            pass
+        else:
+            update_worker_status(file_path, 2, "處理完成", thread_id)
         
         return file_path, True, result
     except Exception as e:
@@ -149,66 +252,291 @@ def process_file_worker(file_path, process_func, *args, **kwargs):
         # 更新狀態為失敗
         update_worker_status(file_path, 3, error_message, thread_id)
         
-        # 將錯誤結果放入結果隊列
-        result_queue.put((file_path, False, str(e)))
-        
         return file_path, False, str(e)
 
-def process_files_parallel(file_list, process_func, max_workers=None, *args, **kwargs):
+def estimate_file_cost(file_path, use_ocr=False, has_ocr=False, page_counter=None):
+    """
+    預估處理單個文件的耗時
+
+    提取緩存中有同一文件內容的記錄時使用上次的提取耗時；否則根據頁數（只讀取交叉引用表，
+    不提取內容）和是否需要OCR估算，無法讀取頁數時按文件大小估算頁數。
+
+    參數:
+        file_path (str): 文件路徑（目錄掃描產出的PdfFileEntry帶有stat結果，不需要重新stat）
+        use_ocr (bool): 是否對所有頁面使用OCR
+        has_ocr (bool): 是否可以使用OCR（沒有文本層的掃描件會自動OCR）
+        page_counter (callable): 讀取頁數的函數page_counter(file_path)，返回None表示無法讀取
+
+    返回:
+        float: 預估耗時（秒）
+    """
+    stat_result = getattr(file_path, 'stat_result', None)
+    try:
+        if stat_result is None:
+            stat_result = os.stat(file_path)
+    except OSError:
+        return COST_FILE_SECONDS
+
+    # 優先使用提取緩存記錄的實際耗時
+    try:
+        import cache_utils
+        cache = cache_utils.get_extraction_cache()
+        if cache is not None:
+            elapsed = cache.historic_elapsed(file_path, stat_result)
+            if elapsed is not None:
+                return COST_FILE_SECONDS + elapsed
+    except Exception as e:
+        log_message(f"讀取歷史耗時時出錯: {file_path}, {e}", level='警告')
+
+    page_count = page_counter(file_path) if page_counter is not None else None
+    if not page_count:
+        page_count = max(1, stat_result.st_size // COST_BYTES_PER_PAGE)
+
+    needs_ocr = use_ocr or (has_ocr and stat_result.st_size / page_count > SCANNED_BYTES_PER_PAGE)
+    page_seconds = COST_OCR_PAGE_SECONDS if needs_ocr else COST_TEXT_PAGE_SECONDS
+    return COST_FILE_SECONDS + page_count * page_seconds
+
+def estimate_makespan(costs, max_workers):
+    """
+    按給定順序把任務依次分配給最早空閒的工作者，計算全部完成所需的時間
+
+    參數:
+        costs (list): 按提交順序排列的預估耗時
+        max_workers (int): 工作者數量
+
+    返回:
+        float: 預估的總完成時間（秒）
+    """
+    finish_times = [0.0] * max(1, max_workers)
+    for cost in costs:
+        heapq.heapreplace(finish_times, finish_times[0] + cost)
+    return max(finish_times)
+
+def order_by_estimated_cost(file_list, cost_func, max_workers=1):
+    """
+    按預估耗時從長到短排列文件（最長處理時間優先），使固定大小的工作池盡早同時完成
+
+    需要先取得全部文件才能排序，因此會讀完file_list；頁數讀取在線程池中並行進行。
+
+    參數:
+        file_list (iterable): 文件路徑列表或迭代器
+        cost_func (callable): 預估耗時函數cost_func(file_path)
+        max_workers (int): 處理文件的工作者數量，用於估算總完成時間
+
+    返回:
+        list: 排序後的文件路徑列表
+    """
+    files = list(file_list)
+    if len(files) < 2:
+        return files
+
+    start_time = time.time()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=COST_ESTIMATE_WORKERS) as executor:
+        costs = list(executor.map(cost_func, files))
+    order = sorted(range(len(files)), key=lambda i: costs[i], reverse=True)
+
+    discovery_makespan = estimate_makespan(costs, max_workers)
+    lpt_makespan = estimate_makespan([costs[i] for i in order], max_workers)
+    log_message(
+        f"已按預估耗時排序 {len(files)} 個文件（用時 {time.time() - start_time:.2f} 秒），"
+        f"最長 {costs[order[0]]:.1f} 秒，預估總完成時間 {lpt_makespan:.1f} 秒（按發現順序 {discovery_makespan:.1f} 秒）",
+        level='信息'
+    )
+    return [files[i] for i in order]
+
+def process_files_parallel(file_list, process_func, max_workers=None, *args, backend='thread', initializer=None, initargs=(), result_callback=None, schedule='discovery', cost_func=None, **kwargs):
     """
     並行處理多個文件
     
     參數:
-        file_list (list): 文件路徑列表
-        process_func (callable): 處理函數
+        file_list (iterable): 文件路徑列表或逐個產出路徑的迭代器（如目錄掃描生成器）
+        process_func (callable): 處理函數；進程池模式下必須是可序列化的模塊級函數，
+                                 並返回包含success、new_path、error、logs、stats的結果字典
         max_workers (int): 最大工作線程數
         *args, **kwargs: 傳遞給處理函數的參數
+        backend (str): 'thread'或'process'
+        initializer (callable): 工作進程初始化函數（僅進程池使用）
+        initargs (tuple): 傳遞給初始化函數的參數
+        result_callback (callable): 每個文件完成後在主線程中調用callback(file_path, record)，
+                                    record為包含success、new_path、error、elapsed的結果字典
+        schedule (str): 'discovery'按發現順序提交；'lpt'先讀完文件列表，按預估耗時從長到短提交
+        cost_func (callable): 'lpt'調度使用的預估耗時函數，默認為estimate_file_cost
     
     返回:
         int: 成功處理的文件數量
     """
-    if not file_list:
-        log_message("沒有文件需要處理", level='信息')
-        return 0
+    import file_utils
     
     # 初始化結果計數器
     success_count = 0
-    total_count = len(file_list)
-    
-    log_message(f"開始並行處理 {total_count} 個文件...", level='信息')
-    
-    # 將文件添加到數據庫中
-    added_count = add_files_to_database(file_list)
-    log_message(f"已將 {added_count} 個文件添加到數據庫", level='信息')
-    
-    # 使用線程池並行處理文件
-    with worker_context(max_workers) as executor:
-        # 提交所有任務
-        future_to_file = {}
-        for file_path in file_list:
-            # 更新狀態為等待
-            update_worker_status(file_path, 0, "等待處理")
-            
-            # 提交任務
-            future = executor.submit(process_file_worker, file_path, process_func, *args, **kwargs)
-            future_to_file[future] = file_path
-        
-        # 處理結果
-        for future in concurrent.futures.as_completed(future_to_file):
-            file_path = future_to_file[future]
-            try:
-                _, success, _ = future.result()
-                if success:
-                    success_count += 1
-            except Exception as e:
-                log_message(f"獲取任務結果時出錯: {e}", level='错误')
+    total_count = 0
+    added_count = 0
+    
+    log_message("開始並行處理文件...", level='信息')
+    
+    max_workers = resolve_max_workers(max_workers, backend)
+    window_size = max_workers * SUBMIT_WINDOW_FACTOR
+    if schedule == 'lpt':
+        file_list = order_by_estimated_cost(file_list, cost_func or estimate_file_cost, max_workers)
+    elif schedule != 'discovery':
+        log_message(f"未知的調度方式 {schedule}，將按發現順序處理", level='警告')
+    paths = iter(file_list)
+    pulled = collections.deque()
+    exhausted = False
+    interrupted = False
+    
+    def next_file():
+        """從已登記的緩衝中取出下一個文件；緩衝用完時從迭代器取出一小批並登記到數據庫"""
+        nonlocal exhausted, total_count, added_count
+        if not pulled and not exhausted:
+            chunk = list(itertools.islice(paths, SUBMIT_CHUNK_SIZE))
+            if chunk:
+                total_count += len(chunk)
+                # 將文件批量登記到數據庫中，同時設置為等待處理狀態
+                added_count += register_files(chunk)
+                pulled.extend(chunk)
+            else:
+                exhausted = True
+        return pulled.popleft() if pulled else None
+    
+    # 進程池的任務提交後先保持等待狀態，工作進程真正開始處理時經此隊列通知主進程
+    start_queue = None
+    if backend == 'process':
+        import multiprocessing
+        start_queue = multiprocessing.Queue()
+        initializer, initargs = _init_worker_process, (start_queue, initializer, initargs)
+    in_flight_paths = set()
+    
+    # 使用工作池並行處理文件
+    with worker_context(max_workers, backend=backend, initializer=initializer, initargs=initargs) as executor:
+        # 只保持固定數量的任務在工作池中，每完成一個才從迭代器取下一個文件
+        in_flight = {}
+        try:
+            while True:
+                # 收到中斷信號後不再提交新文件，只等待已提交的任務完成
+                if not interrupted and file_utils.interrupt_received:
+                    interrupted = True
+                    log_message(f"收到中斷信號，停止提交新文件，等待 {len(in_flight)} 個進行中的任務完成", level='警告')
+                while not interrupted and len(in_flight) < window_size:
+                    file_path = next_file()
+                    if file_path is None:
+                        break
+                    if backend == 'process':
+                        # 工作進程不寫數據庫，由主進程負責所有狀態更新；開始處理前保持登記時的等待狀態
+                        future = executor.submit(_run_in_worker_process, process_func, file_path, *args, **kwargs)
+                        in_flight_paths.add(file_path)
+                    else:
+                        # 等待狀態已在登記時設置，直接提交任務
+                        future = executor.submit(process_file_worker, file_path, process_func, *args, **kwargs)
+                    in_flight[future] = file_path
+                
+                if not in_flight:
+                    break
+                
+                # 等待至少一個任務完成；設置超時以便及時發現中斷信號
+                done, _ = concurrent.futures.wait(in_flight, timeout=0.5, return_when=concurrent.futures.FIRST_COMPLETED)
+                if start_queue is not None:
+                    _apply_start_messages(start_queue, in_flight_paths)
+                for future in done:
+                    file_path = in_flight.pop(future)
+                    in_flight_paths.discard(file_path)
+                    if _collect_result(future, file_path, backend, result_callback):
+                        success_count += 1
+        except KeyboardInterrupt:
+            # 取消尚未開始的任務，已在運行的任務由工作池關閉時等待完成
+            for future in in_flight:
+                future.cancel()
+            log_message("處理被中斷，已取消尚未開始的任務", level='警告')
+            raise
+        finally:
+            if start_queue is not None:
+                start_queue.close()
+    
+    if total_count == 0:
+        log_message("沒有文件需要處理", level='信息')
+        return 0
+    log_message(f"已將 {added_count} 個文件添加到數據庫，共 {total_count} 個文件", level='信息')
+    if interrupted:
+        log_message("處理已中斷，剩餘文件未提交", level='警告')
+    
+    # 確保最終狀態已寫入數據庫，UI和導出能看到完整結果
+    flush_status_updates()
     
     log_message(f"並行處理完成，成功: {success_count}/{total_count}", level='信息')
     return success_count
 
+def _collect_result(future, file_path, backend, result_callback=None):
+    """
+    取出一個已完成任務的結果，更新狀態並調用結果回調
+    
+    參數:
+        future (concurrent.futures.Future): 已完成的任務
+        file_path (str): 文件路徑
+        backend (str): 'thread'或'process'
+        result_callback (callable): 結果回調
+    
+    返回:
+        bool: 任務是否正常完成
+    """
+    success = False
+    try:
+        if backend == 'process':
+            record = future.result()
+            success = handle_process_result(file_path, record)
+        else:
+            _, success, result = future.result()
+            record = result if isinstance(result, dict) else {'success': bool(result) if success else False,
+                                                              'error': None if success else result}
+            # 處理函數以結果記錄報告的失敗和中斷與拋出異常一樣不計入成功
+            success = success and not (record.get('error') or record.get('interrupted'))
+    except Exception as e:
+        log_message(f"獲取任務結果時出錯: {e}", level='错误')
+        if backend == 'process':
+            update_worker_status(file_path, 3, f"處理文件時出錯: {e}")
+        record = {'success': False, 'error': str(e)}
+    if result_callback is not None:
+        try:
+            result_callback(file_path, record)
+        except Exception as e:
+            log_message(f"處理結果回調出錯: {file_path}, {e}", level='警告')
+    return success
+
+def handle_process_result(file_path, record):
+    """
+    在主進程中處理工作進程返回的結果記錄：合併日誌和統計數據並更新狀態
+    
+    參數:
+        file_path (str): 文件路徑
+        record (dict): 工作進程返回的結果記錄
+    
+    返回:
+        bool: 任務是否正常完成（未拋出異常）
+    """
+    from log_utils import append_log_entries
+    append_log_entries(record.get('logs', []))
+    if record.get('stats'):
+        from pdf_utils import merge_extraction_stats
+        merge_extraction_stats(record['stats'])
+    
+    if record.get('error'):
+        error_message = f"處理文件時出錯: {record['error']}"
+        log_message(error_message, level='错误')
+        update_worker_status(file_path, 3, error_message, record.get('pid'), start_time=record.get('started'))
+        return False
+    if record.get('interrupted'):
+        update_worker_status(file_path, 0, "收到中斷信號，未處理", record.get('pid'))
+        return False
+    if record.get('encrypt_pending'):
+        # 加密工作由主進程提交到加密階段，最終狀態在加密完成時更新
+        return True
+    
+    # 開始通知可能晚於結果到達，以工作進程記錄的開始時間為準
+    update_worker_status(file_path, 2, f"處理完成（{record.get('elapsed', 0):.2f}秒）", record.get('pid'), start_time=record.get('started'))
+    return True
+
 def get_worker_status():
     """
-    獲取所有工作線程的狀態
+    獲取進行中文件的狀態（已完成或失敗的文件只保存在數據庫中）
     
     返回:
         dict: 工作線程狀態字典